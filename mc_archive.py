@@ -0,0 +1,275 @@
+import gzip
+import heapq
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+from mc_groups import prune_groups
+
+# ---------------- COSTANTI ----------------
+
+ARCHIVE_TABLES = ("msg", "pos", "tele")
+ARCHIVE_PREFIX = "meshcom_"
+
+# il campo time è "gg/mm/aaaa hh:mm:ss": queste espressioni lo rendono
+# ordinabile (aaaammgg e aaaammgghhmmss)
+DAY_SQL = "(substr(time,7,4) || substr(time,4,2) || substr(time,1,2))"
+SORTABLE_TIME_SQL = (
+    "(substr(time,7,4) || substr(time,4,2) || substr(time,1,2) || "
+    "substr(time,12,2) || substr(time,15,2) || substr(time,18,2))"
+)
+
+_ARCHIVE_RE = re.compile(rf"^{ARCHIVE_PREFIX}(\d{{8}})\.db(\.gz)?$")
+
+# ---------------- UTILS ----------------
+
+def default_archive_dir(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), "archive")
+
+
+def archive_path(archive_dir, day):
+    return os.path.join(archive_dir, f"{ARCHIVE_PREFIX}{day}.db")
+
+
+def list_archives(archive_dir):
+    """
+    Archivi giornalieri presenti, [(aaaammgg, percorso), ...] in ordine
+    di data. I file compressi (.db.gz) sono inclusi.
+    """
+    if not archive_dir or not os.path.isdir(archive_dir):
+        return []
+
+    found = {}
+    for name in os.listdir(archive_dir):
+        m = _ARCHIVE_RE.match(name)
+        if m:
+            # se esistono entrambi si preferisce il file non compresso
+            if m.group(1) not in found or not m.group(2):
+                found[m.group(1)] = os.path.join(archive_dir, name)
+    return sorted(found.items())
+
+
+def time_filter_sql(start=None, end=None):
+    """
+    Condizione SQL (e parametri) per start <= time <= end, con start/end
+    datetime oppure None
+    """
+    sql, params = "", []
+    if start:
+        sql += f" AND {SORTABLE_TIME_SQL} >= ?"
+        params.append(start.strftime("%Y%m%d%H%M%S"))
+    if end:
+        sql += f" AND {SORTABLE_TIME_SQL} <= ?"
+        params.append(end.strftime("%Y%m%d%H%M%S"))
+    return sql, params
+
+
+def _table_columns(conn, schema, table):
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()]
+
+
+def _prepare_archive_table(conn, table):
+    """
+    Crea (o allinea alle nuove colonne) la tabella nell'archivio "arc"
+    """
+    main_cols = _table_columns(conn, "main", table)
+    arc_cols = _table_columns(conn, "arc", table)
+
+    if not arc_cols:
+        conn.execute(f"""
+            CREATE TABLE arc.{table} (
+                id INTEGER PRIMARY KEY,
+                time TEXT
+            )
+        """)
+        arc_cols = ["id", "time"]
+
+    for col in main_cols:
+        if col not in arc_cols:
+            conn.execute(f"ALTER TABLE arc.{table} ADD COLUMN {col} TEXT")
+
+    return main_cols
+
+# ---------------- ARCHIVIAZIONE ----------------
+
+def archive_database(db_path, days, archive_dir=None, vacuum=False):
+    """
+    Sposta le righe di msg/pos/tele più vecchie di 'days' giorni negli
+    archivi giornalieri archive_dir/meshcom_aaaammgg.db (stessi id e
+    colonne del database principale). Ritorna {tabella: righe spostate}.
+    """
+    archive_dir = archive_dir or default_archive_dir(db_path)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y%m%d")
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    tables = {
+        r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table'"
+        ).fetchall()
+    }
+
+    moved = {}
+
+    for table in ARCHIVE_TABLES:
+        if table not in tables:
+            continue
+
+        # intervallo di id per giorno: le copie/cancellazioni successive
+        # leggono solo quel tratto della tabella
+        rows = conn.execute(f"""
+            SELECT {DAY_SQL} AS day, MIN(id), MAX(id)
+            FROM {table}
+            WHERE time LIKE '__/__/____%' AND {DAY_SQL} < ?
+            GROUP BY day
+            ORDER BY day
+        """, (cutoff,)).fetchall()
+
+        for day, first_id, last_id in rows:
+            path = archive_path(archive_dir, day)
+            if os.path.exists(path + ".gz") and not os.path.exists(path):
+                _decompress(path + ".gz", path)
+
+            conn.execute("ATTACH DATABASE ? AS arc", (path,))
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                cols = ", ".join(_prepare_archive_table(conn, table))
+                conn.execute(f"""
+                    INSERT OR IGNORE INTO arc.{table} ({cols})
+                    SELECT {cols} FROM main.{table}
+                    WHERE id BETWEEN ? AND ? AND {DAY_SQL} = ?
+                """, (first_id, last_id, day))
+                count = conn.execute(f"""
+                    DELETE FROM main.{table}
+                    WHERE id BETWEEN ? AND ? AND {DAY_SQL} = ?
+                """, (first_id, last_id, day)).rowcount
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute("DETACH DATABASE arc")
+
+            moved[table] = moved.get(table, 0) + count
+
+    # l'indice dei gruppi non deve puntare a messaggi archiviati
+    if moved.get("msg"):
+        prune_groups(conn)
+
+    if vacuum and moved:
+        conn.execute("VACUUM")
+
+    conn.close()
+    return moved
+
+
+def _decompress(src_path, dst_path):
+    with gzip.open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(src_path)
+
+
+def compress_archives(archive_dir, days):
+    """
+    Comprime (gzip) gli archivi giornalieri più vecchi di 'days' giorni.
+    Ritorna il numero di file compressi.
+    """
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y%m%d")
+    count = 0
+
+    for day, path in list_archives(archive_dir):
+        if day >= cutoff or path.endswith(".gz"):
+            continue
+
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+        count += 1
+
+    return count
+
+# ---------------- QUERY UNIFICATA ----------------
+
+def _open_archive(path):
+    """
+    Connessione in sola lettura; i .gz vengono estratti in un file
+    temporaneo. Ritorna (connessione, file temporaneo o None).
+    """
+    tmp = None
+    if path.endswith(".gz"):
+        fd, tmp = tempfile.mkstemp(suffix=".db")
+        with os.fdopen(fd, "wb") as dst, gzip.open(path, "rb") as src:
+            shutil.copyfileobj(src, dst)
+        path = tmp
+
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    return conn, tmp
+
+
+def is_missing_schema(error):
+    text = str(error).lower()
+    return text.startswith("no such table") or text.startswith("no such column")
+
+
+def _source_rows(path, db_path, sql, params):
+    """
+    Righe di un archivio o del database principale; la connessione si
+    apre alla prima lettura
+    """
+    if path == db_path:
+        conn, tmp = sqlite3.connect(db_path), None
+    else:
+        conn, tmp = _open_archive(path)
+    conn.row_factory = sqlite3.Row
+
+    try:
+        cur = conn.execute(sql, params)
+        for row in cur:
+            yield row
+    except sqlite3.OperationalError as e:
+        # tabella o colonna assente in questo archivio: si salta;
+        # database bloccato, SQL errato ecc. arrivano al chiamante
+        if not is_missing_schema(e):
+            raise
+    finally:
+        conn.close()
+        if tmp:
+            os.remove(tmp)
+
+
+def iter_rows(db_path, table, where="", params=(), start=None, end=None,
+              archive_dir=None, columns="*", order="id ASC", merge_key=None):
+    """
+    Genera le righe (sqlite3.Row) di una tabella prendendole prima dagli
+    archivi giornalieri (dal più vecchio) e poi dal database principale,
+    in ordine di id. 'where' è una condizione SQL aggiuntiva che inizia
+    con AND; start/end (datetime) limitano sia gli archivi aperti sia le
+    righe. Una riga alla volta: memoria costante.
+
+    Con un ordine diverso ('order' SQL e la stessa chiave in Python in
+    merge_key) le sorgenti vengono lette insieme e fuse in quell'ordine,
+    ognuna aperta una sola volta.
+    """
+    time_sql, time_params = time_filter_sql(start, end)
+    sql = f"SELECT {columns} FROM {table} WHERE 1=1 {where} {time_sql} ORDER BY {order}"
+    all_params = list(params) + time_params
+
+    first_day = start.strftime("%Y%m%d") if start else None
+    last_day = end.strftime("%Y%m%d") if end else None
+
+    sources = [
+        path for day, path in list_archives(archive_dir)
+        if (not first_day or day >= first_day) and (not last_day or day <= last_day)
+    ]
+    sources.append(db_path)
+
+    streams = [_source_rows(path, db_path, sql, all_params) for path in sources]
+    if merge_key is None:
+        for stream in streams:
+            yield from stream
+    else:
+        yield from heapq.merge(*streams, key=merge_key)
@@ -0,0 +1,273 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from mc_synth import generate
+
+# ---------------- CONFIG ----------------
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+BENCH_DIR = "bench"
+BASELINE_FILE = "bench_baseline.json"
+
+# regressione = più lento del riferimento di oltre TOLERANCE e di almeno
+# MIN_DELTA secondi (sotto non si distingue dal rumore)
+TOLERANCE = 0.25
+MIN_DELTA = 0.005
+
+# callsign cercato dalle query per nominativo: non presente nei database
+# sintetici, quindi il caso peggiore (scansione completa)
+PROBE_CALLSIGN = "IK5XMK-98"
+
+# ---------------- CASI ----------------
+
+CASES = []
+
+
+def case(name, modules=(), copy=False):
+    """
+    Registra un caso: fn(db_path, mod) con mod = {nome: modulo}. Con
+    copy=True il caso lavora su una copia del database (scritture)
+    """
+    def register(fn):
+        CASES.append((name, modules, copy, fn))
+        return fn
+    return register
+
+
+@case("hub.latest_positions (nodes, map)", ("mc_data",))
+def _(db_path, mod):
+    hub = mod["mc_data"].DataHub(db_path)
+    hub.latest_positions()
+    hub.conn.close()
+
+
+@case("hub.new_messages da 0 (messages, listener)", ("mc_data",))
+def _(db_path, mod):
+    hub = mod["mc_data"].DataHub(db_path)
+    hub.msg_last_id = 0
+    hub.new_messages()
+    hub.conn.close()
+
+
+@case("hub.new_positions da 0 (map tracce)", ("mc_data",))
+def _(db_path, mod):
+    hub = mod["mc_data"].DataHub(db_path)
+    hub.pos_last_id = 0
+    hub.new_positions()
+    hub.conn.close()
+
+
+@case("nodes.get_latest_positions", ("mc_nodes",))
+def _(db_path, mod):
+    mod["mc_nodes"].DB_PATH = db_path
+    mod["mc_nodes"].get_latest_positions()
+
+
+@case("nodes.get_position_by_callsign", ("mc_nodes",))
+def _(db_path, mod):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    mod["mc_nodes"].get_position_by_callsign(PROBE_CALLSIGN, conn)
+    conn.close()
+
+
+@case("map.TrackCache.update", ("mc_tracks",))
+def _(db_path, mod):
+    mod["mc_tracks"].TrackCache(db_path, max_age_hours=24).update()
+
+
+@case("messages.fetch_backlog", ("mc_messages",))
+def _(db_path, mod):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    mod["mc_messages"].fetch_backlog(conn, 0, limit=500)
+    mod["mc_messages"].fetch_last_record(conn, " AND dst LIKE ? ", ["2222"])
+    conn.close()
+
+
+@case("export.csv msg", ("mc_export",))
+def _(db_path, mod):
+    export = mod["mc_export"]
+    with open(os.devnull, "w", encoding="utf-8", newline="") as out:
+        export.export_csv(export.Source(db_path), "msg", out)
+
+
+@case("dbcleaner.archive_database (1 giorno)", ("mc_archive",), copy=True)
+def _(db_path, mod):
+    archive_dir = os.path.join(os.path.dirname(db_path), "archive")
+    mod["mc_archive"].archive_database(db_path, 1, archive_dir)
+
+
+@case("dbcleaner.cleanup_database", ("mc_dbcleaner",), copy=True)
+def _(db_path, mod):
+    with contextlib.redirect_stdout(io.StringIO()):
+        mod["mc_dbcleaner"].cleanup_database(db_path)
+
+
+@case("logger.TopologyStore.rebuild", ("mc_topology",), copy=True)
+def _(db_path, mod):
+    conn = sqlite3.connect(db_path)
+    mod["mc_topology"].TopologyStore(conn, "IK5XMK-99").rebuild()
+    conn.close()
+
+
+@case("logger.CoverageStore.rebuild", ("mc_coverage",), copy=True)
+def _(db_path, mod):
+    conn = sqlite3.connect(db_path)
+    mod["mc_coverage"].CoverageStore(conn, "IK5XMK-99").rebuild()
+    conn.close()
+
+
+@case("logger.GroupIndex.rebuild", ("mc_groups",), copy=True)
+def _(db_path, mod):
+    conn = sqlite3.connect(db_path)
+    mod["mc_groups"].GroupIndex(conn).rebuild()
+    conn.close()
+
+
+@case("logger.TelemetryStore.rebuild", ("mc_telemetry",), copy=True)
+def _(db_path, mod):
+    conn = sqlite3.connect(db_path)
+    mod["mc_telemetry"].TelemetryStore(conn).rebuild()
+    conn.close()
+
+# ---------------- ESECUZIONE ----------------
+
+def load_modules(names):
+    """
+    Moduli richiesti da un caso; None + motivo se non importabili (es.
+    tkintermapview non installato)
+    """
+    mod = {}
+    for name in names:
+        try:
+            mod[name] = importlib.import_module(name)
+        except (ImportError, SystemExit) as e:
+            return None, f"{name}: {e}"
+    return mod, ""
+
+
+def synth_db(bench_dir, rows, regen=False):
+    path = os.path.join(bench_dir, f"synth_{rows}.db")
+    if regen or not os.path.exists(path):
+        print(f"Generazione database sintetico da {rows} righe...")
+        start = time.perf_counter()
+        generate(path, rows=rows)
+        print(f"  pronto in {time.perf_counter() - start:.1f} s")
+    return path
+
+
+def run_case(db_path, fn, mod, copy, repeat):
+    """
+    Tempo migliore su 'repeat' esecuzioni (la copia del database non è
+    compresa nel tempo)
+    """
+    best = None
+    for _ in range(repeat):
+        work = tempfile.mkdtemp(prefix="mc_bench_")
+        try:
+            target = db_path
+            if copy:
+                target = os.path.join(work, "bench.db")
+                shutil.copyfile(db_path, target)
+
+            start = time.perf_counter()
+            fn(target, mod)
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def compare(elapsed, baseline):
+    """
+    (variazione percentuale, regressione?) rispetto al riferimento
+    """
+    if baseline is None:
+        return None, False
+    change = (elapsed - baseline) / baseline if baseline > 0 else 0.0
+    return change, change > TOLERANCE and elapsed - baseline > MIN_DELTA
+
+
+def load_baseline(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+# ---------------- MAIN ----------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark delle query dei programmi MeshCom")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="righe dei database sintetici, es. 10000,100000")
+    parser.add_argument("--dir", default=BENCH_DIR, help="cartella dei database sintetici")
+    parser.add_argument("--regen", action="store_true", help="rigenera i database sintetici")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--filter", default="", help="esegue solo i casi che contengono questo testo")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save", action="store_true", help="salva i tempi come nuovo riferimento")
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    baseline = load_baseline(args.baseline)
+    results = {}
+    regressions = []
+
+    for rows in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        db_path = synth_db(args.dir, rows, args.regen)
+        base = baseline.get(str(rows), {})
+        results[str(rows)] = {}
+
+        print(f"\n== {rows} righe ==")
+        print(f"{'caso':<46} {'tempo':>10} {'riferim.':>10} {'var.':>8}")
+
+        for name, modules, copy, fn in CASES:
+            if args.filter and args.filter not in name:
+                continue
+
+            mod, reason = load_modules(modules)
+            if mod is None:
+                print(f"{name:<46} {'saltato':>10}  ({reason})")
+                continue
+
+            elapsed = run_case(db_path, fn, mod, copy, args.repeat)
+            results[str(rows)][name] = round(elapsed, 6)
+
+            change, slower = compare(elapsed, base.get(name))
+            ref = f"{base[name]:.4f}" if name in base else "-"
+            var = f"{change * 100:+.0f}%" if change is not None else ""
+            mark = "  ⚠ REGRESSIONE" if slower else ""
+            print(f"{name:<46} {elapsed:>10.4f} {ref:>10} {var:>8}{mark}")
+
+            if slower:
+                regressions.append((rows, name, base[name], elapsed))
+
+    if args.save:
+        for rows, cases in results.items():
+            baseline.setdefault(rows, {}).update(cases)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=4)
+        print(f"\nRiferimenti salvati in {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regressioni:")
+        for rows, name, before, after in regressions:
+            print(f"  {rows} righe | {name}: {before:.4f} s -> {after:.4f} s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+import importlib
+import json
+import sys
+
+from mc_data import SNAPSHOT_MAX_SKIP, DataHub
+from mc_watchdog import Watchdog
+
+# ---------------- CONFIG (DA FILE JSON) ----------------
+
+CONFIG_FILE = "config_console.json"
+
+try:
+    with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+        config = json.load(f)
+except FileNotFoundError:
+    messagebox.showerror("Errore", f"File di configurazione mancante: {CONFIG_FILE}")
+    sys.exit(1)
+except json.JSONDecodeError as e:
+    messagebox.showerror("Errore", f"Errore nel file JSON:\n{e}")
+    sys.exit(1)
+
+DB_PATH = config.get("DB_PATH", "meshcom.db")
+POLL_INTERVAL = config.get("POLL_INTERVAL", 10)
+TABS = config.get("TABS", ["messages", "nodes", "map", "listener"])
+BACKGROUND_REFRESH = config.get("BACKGROUND_REFRESH", True)
+WATCHDOG = config.get("WATCHDOG", False)
+WATCHDOG_SLOW_MS = config.get("WATCHDOG_SLOW_MS", 200)
+WATCHDOG_LOG = config.get("WATCHDOG_LOG", "") or None
+MAX_SKIP = config.get("SNAPSHOT_MAX_SKIP", SNAPSHOT_MAX_SKIP)
+
+# vista -> (modulo, classe, titolo della scheda)
+VIEWS = {
+    "messages": ("mc_messages", "MessagesView", "Messaggi"),
+    "nodes": ("mc_nodes", "NodesView", "Nodi"),
+    "map": ("mc_map", "MapView", "Mappa"),
+    "listener": ("mc_listener", "ListenerView", "Comandi"),
+}
+
+# ---------------- APP ----------------
+
+class ConsoleApp(tk.Tk):
+    """
+    Console operativa: messaggi, nodi, mappa e listener in un solo
+    processo, con un'unica connessione al database e un solo ciclo di
+    refresh (DataHub) che aggiorna tutte le schede.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.title("MeshCom – Console operativa by IK5XMK")
+        self.geometry("1200x750")
+
+        # misura di lag e callback lente (Ctrl+F10 riepilogo, Ctrl+F11
+        # campionamento, Ctrl+F12 cProfile); va installato prima delle viste
+        self.watchdog = None
+        if WATCHDOG:
+            self.watchdog = Watchdog(self, WATCHDOG_SLOW_MS, log_file=WATCHDOG_LOG).install().start()
+
+        self.hub = DataHub(DB_PATH)
+
+        self.notebook = ttk.Notebook(self)
+        self.notebook.pack(fill="both", expand=True)
+
+        for key in TABS:
+            if key not in VIEWS:
+                continue
+
+            module_name, class_name, label = VIEWS[key]
+            try:
+                # ogni modulo legge il proprio file config_*.json
+                module = importlib.import_module(module_name)
+                view = getattr(module, class_name)(self.notebook, self.hub)
+            except (Exception, SystemExit) as e:
+                view = ttk.Frame(self.notebook)
+                ttk.Label(view, text=f"{label} non disponibile: {e}").pack(padx=20, pady=20)
+
+            self.notebook.add(view, text=label)
+
+        self.hub.start(self, POLL_INTERVAL, BACKGROUND_REFRESH, self.watchdog, MAX_SKIP)
+
+# ---------------- MAIN ----------------
+
+if __name__ == "__main__":
+    app = ConsoleApp()
+    app.mainloop()
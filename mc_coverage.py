@@ -0,0 +1,227 @@
+import math
+import sqlite3
+import sys
+
+from mc_topology import parse_path
+
+# ---------------- CONFIG ----------------
+
+# lato della cella della griglia in gradi (0.01° ≈ 1.1 km in latitudine)
+CELL_DEG = 0.01
+
+# ---------------- UTILS ----------------
+
+def to_degrees(value, direction):
+    value = float(value)
+    if direction in ("S", "W"):
+        value = -value
+    return value
+
+
+def cell_of(lat, lon, cell_deg=CELL_DEG):
+    """
+    (riga, colonna) della cella che contiene il punto
+    """
+    return math.floor(lat / cell_deg), math.floor(lon / cell_deg)
+
+
+def cell_bounds(cy, cx, cell_deg=CELL_DEG, factor=1):
+    """
+    (min_lat, min_lon, max_lat, max_lon) di una cella; con factor > 1 la
+    cella aggregata di factor x factor celle base
+    """
+    size = cell_deg * factor
+    return cy * size, cx * size, (cy + 1) * size, (cx + 1) * size
+
+# ---------------- SCRITTURA (SINK DEL LOGGER) ----------------
+
+class CoverageStore:
+    """
+    Copertura radio: ogni frame pos ricevuto incrementa i contatori della
+    cella della griglia in cui si trovava il nodo (ascolti, ascolti
+    diretti, somma e minimo dei relay attraversati). 'seq' è l'id della
+    riga pos che ha aggiornato la cella per ultima e permette alle viste
+    di leggere solo le celle cambiate.
+    Come sink di FrameProcessor non esegue commit: lo fa il logger.
+    """
+
+    def __init__(self, conn, local_callsign, cell_deg=CELL_DEG):
+        self.conn = conn
+        self.local = local_callsign.strip().upper()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS coverage_cells (
+                cy INTEGER,
+                cx INTEGER,
+                hits INTEGER,
+                direct INTEGER,
+                hop_sum INTEGER,
+                min_hops INTEGER,
+                last_seen TEXT,
+                seq INTEGER,
+                PRIMARY KEY (cy, cx)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS coverage_cells_seq ON coverage_cells (seq);
+
+            CREATE TABLE IF NOT EXISTS coverage_meta (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+
+        # la dimensione della cella è fissata alla creazione della tabella
+        row = self.conn.execute("SELECT value FROM coverage_meta WHERE name = 'cell_deg'").fetchone()
+        if row:
+            self.cell_deg = float(row[0])
+        else:
+            self.cell_deg = cell_deg
+            self.conn.execute(
+                "INSERT INTO coverage_meta (name, value) VALUES ('cell_deg', ?)",
+                (str(cell_deg),)
+            )
+        self.conn.commit()
+
+    def on_frame(self, frame_type, row_id, frame):
+        if frame_type != "pos":
+            return
+        self.add(frame, row_id)
+
+    def add(self, row, seq):
+        path = parse_path(row.get("src"))
+        if not path or path[0] == self.local:
+            return
+
+        try:
+            lat = to_degrees(row.get("lat"), row.get("lat_dir"))
+            lon = to_degrees(row.get("long"), row.get("long_dir"))
+        except (TypeError, ValueError):
+            return
+        if lat == 0 and lon == 0:
+            return
+
+        cy, cx = cell_of(lat, lon, self.cell_deg)
+        relays = len(path) - 1
+
+        self.conn.execute("""
+            INSERT INTO coverage_cells (cy, cx, hits, direct, hop_sum, min_hops, last_seen, seq)
+            VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+            ON CONFLICT (cy, cx) DO UPDATE SET
+                hits = hits + 1,
+                direct = direct + excluded.direct,
+                hop_sum = hop_sum + excluded.hop_sum,
+                min_hops = MIN(min_hops, excluded.min_hops),
+                last_seen = excluded.last_seen,
+                seq = excluded.seq
+        """, (cy, cx, 1 if relays == 0 else 0, relays, relays, row.get("time"), seq))
+
+    def rebuild(self):
+        """
+        Ricalcola la griglia da tutta la tabella pos
+        """
+        self.conn.execute("DELETE FROM coverage_cells")
+
+        count = 0
+        try:
+            cur = self.conn.execute("""
+                SELECT id, src, time, lat, lat_dir, long, long_dir
+                FROM pos
+                ORDER BY id ASC
+            """)
+        except sqlite3.OperationalError:
+            cur = []
+
+        for r in cur:
+            self.add({
+                "src": r[1], "time": r[2],
+                "lat": r[3], "lat_dir": r[4], "long": r[5], "long_dir": r[6]
+            }, r[0])
+            count += 1
+
+        self.conn.commit()
+        return count
+
+# ---------------- LETTURA (VISTE) ----------------
+
+class CoverageGrid:
+    """
+    Copia in memoria delle celle di copertura, aggiornata leggendo solo
+    quelle con seq maggiore dell'ultimo refresh
+    """
+
+    def __init__(self):
+        self.cell_deg = None
+        self.cells = {}
+        self.last_seq = 0
+        self.version = 0
+
+    def refresh(self, conn):
+        try:
+            if self.cell_deg is None:
+                row = conn.execute("SELECT value FROM coverage_meta WHERE name = 'cell_deg'").fetchone()
+                if not row:
+                    return False
+                self.cell_deg = float(row[0])
+
+            # seq più basso di quello letto = griglia ricostruita
+            top = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM coverage_cells").fetchone()[0]
+            if top < self.last_seq:
+                self.cells = {}
+                self.last_seq = 0
+
+            rows = conn.execute("""
+                SELECT cy, cx, hits, direct, hop_sum, min_hops, seq
+                FROM coverage_cells
+                WHERE seq > ?
+            """, (self.last_seq,)).fetchall()
+        except sqlite3.OperationalError:
+            return False
+
+        for cy, cx, hits, direct, hop_sum, min_hops, seq in rows:
+            self.cells[(cy, cx)] = (hits, direct, hop_sum, min_hops)
+            self.last_seq = max(self.last_seq, seq)
+
+        if rows:
+            self.version += 1
+        return bool(rows)
+
+    def query(self, min_lat, min_lon, max_lat, max_lon, factor=1):
+        """
+        Celle nel rettangolo, aggregate a blocchi di factor x factor:
+        {(cy, cx): (hits, direct, hop_sum, min_hops)} con cy, cx nella
+        griglia aggregata
+        """
+        if self.cell_deg is None:
+            return {}
+
+        size = self.cell_deg
+        y0, x0 = math.floor(min_lat / size), math.floor(min_lon / size)
+        y1, x1 = math.floor(max_lat / size), math.floor(max_lon / size)
+
+        result = {}
+        for (cy, cx), (hits, direct, hop_sum, min_hops) in self.cells.items():
+            if not (y0 <= cy <= y1 and x0 <= cx <= x1):
+                continue
+
+            key = (cy // factor, cx // factor)
+            old = result.get(key)
+            if old:
+                result[key] = (
+                    old[0] + hits,
+                    old[1] + direct,
+                    old[2] + hop_sum,
+                    min(old[3], min_hops)
+                )
+            else:
+                result[key] = (hits, direct, hop_sum, min_hops)
+        return result
+
+# ---------------- MAIN ----------------
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3:
+        conn = sqlite3.connect(sys.argv[1])
+        store = CoverageStore(conn, sys.argv[2])
+        count = store.rebuild()
+        conn.close()
+        print(f"Copertura ricostruita da {count} posizioni (celle da {store.cell_deg}°)")
+    else:
+        print("Uso: mc_coverage.py <database> <callsign del nodo locale>")
@@ -0,0 +1,284 @@
+import sqlite3
+import time
+
+from mc_coverage import CoverageGrid
+from mc_liveness import LivenessState
+from mc_snapshot import SnapshotReader, default_snapshot_path
+from mc_topology import TopologyGraph
+
+# ---------------- CONFIG ----------------
+
+# con lo snapshot del logger invariato il refresh viene saltato, ma non
+# più di SNAPSHOT_MAX_SKIP volte di fila: modifiche fatte da altri
+# programmi (es. dbcleaner) e colonne che dipendono dall'ora (filtro "solo
+# oggi") possono restare indietro fino a SNAPSHOT_MAX_SKIP giri di
+# polling. Configurabile con SNAPSHOT_MAX_SKIP nei config_*.json delle
+# viste; 0 = nessun giro saltato.
+SNAPSHOT_MAX_SKIP = 6
+TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+# ---------------- UTILS ----------------
+
+def snapshot_positions(snapshot):
+    """
+    Ultima posizione per nodo dallo snapshot, nella stessa forma delle
+    righe di pos (src, time, lat, lat_dir, long, long_dir, id), dal nodo
+    ascoltato più di recente. 'time' è l'ultimo ascolto del nodo: lo
+    snapshot non conserva l'ora della posizione.
+    """
+    rows = []
+    for n in sorted(snapshot.nodes, key=lambda n: -n.last_heard):
+        if n.lat is None or n.lon is None:
+            continue
+        rows.append({
+            "id": n.pos_id,
+            "src": n.callsign,
+            "time": time.strftime(TIME_FORMAT, time.localtime(n.last_heard)) if n.last_heard else "",
+            "lat": abs(n.lat),
+            "lat_dir": "S" if n.lat < 0 else "N",
+            "long": abs(n.lon),
+            "long_dir": "W" if n.lon < 0 else "E",
+        })
+    return rows
+
+# ---------------- DATI CONDIVISI ----------------
+
+class RefreshData:
+    """
+    Risultato di un ciclo di refresh, distribuito a tutte le viste:
+    - messages: nuove righe di msg (id crescente)
+    - positions: ultima riga di pos per ogni src
+    - pos_rows: nuove righe di pos (id crescente)
+    - topology: grafo dei collegamenti (TopologyGraph), aggiornato in modo
+      incrementale
+    - coverage: griglia di copertura radio (CoverageGrid), incrementale
+    - liveness: nodi persi e nuovi eventi lost/back (LivenessState)
+    - snapshot: stato corrente dei nodi pubblicato dal logger (Snapshot
+      di mc_snapshot, letto senza SQL; None se il logger non lo scrive).
+      Una vista che chiede sia "positions" sia "snapshot" usa lo
+      snapshot (snapshot_positions) e riceve positions solo quando lo
+      snapshot non c'è
+    I campi non richiesti da nessuna vista restano None.
+    """
+
+    def __init__(self):
+        self.messages = None
+        self.positions = None
+        self.pos_rows = None
+        self.topology = None
+        self.coverage = None
+        self.liveness = None
+        self.snapshot = None
+
+
+class DataHub:
+    """
+    Unico punto di accesso al database per le viste (messaggi, nodi,
+    mappa, listener): una sola connessione e un solo timer di polling,
+    i cui risultati vengono passati a ogni vista registrata.
+
+    Una vista implementa on_refresh(data) e dichiara in 'wants' cosa le
+    serve ("messages", "positions", "pos_rows", "topology", "coverage",
+    "liveness", "snapshot"). Con msg_start_id / pos_start_id può chiedere di ricevere
+    le righe a partire da un id.
+
+    Con background=True le query sulle tabelle dei frame girano in un
+    thread con una connessione propria e i risultati arrivano alle viste
+    sul thread Tk; gli indici incrementali (topologia, copertura, stato
+    dei nodi) restano sul thread Tk perché le viste li leggono.
+
+    Se il logger pubblica lo snapshot (mc_snapshot) il timer controlla
+    prima la sua versione: se non è cambiata non arriva nessun frame
+    nuovo e il giro viene saltato senza interrogare il database.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+
+        self.views = []
+        self.msg_last_id = None
+        self.pos_last_id = None
+        self.topology = TopologyGraph()
+        self.coverage = CoverageGrid()
+        self.liveness = LivenessState()
+        self.snapshot = SnapshotReader(default_snapshot_path(db_path))
+        self.snapshot_version = None
+        self.skipped = 0
+        self.max_skip = SNAPSHOT_MAX_SKIP
+
+        self.root = None
+        self.interval_ms = 10000
+        self.runner = None
+        self.watchdog = None
+
+    # ---------------- REGISTRAZIONE ----------------
+
+    def register(self, view):
+        self.views.append(view)
+
+    def _wanted(self, what):
+        return any(what in getattr(v, "wants", ()) for v in self.views)
+
+    def _wanted_without(self, what, alternative):
+        return any(
+            what in getattr(v, "wants", ()) and alternative not in getattr(v, "wants", ())
+            for v in self.views
+        )
+
+    def _start_id(self, attr, table):
+        ids = [getattr(v, attr) for v in self.views if getattr(v, attr, None) is not None]
+        return min(ids) if ids else self.max_id(table)
+
+    def start(self, root, poll_interval, background=False, watchdog=None, max_skip=SNAPSHOT_MAX_SKIP):
+        """
+        Avvia il ciclo di refresh sul main loop di 'root' (da chiamare
+        dopo aver creato tutte le viste). 'watchdog' (mc_watchdog) misura
+        la durata di on_refresh di ogni vista; max_skip: giri saltati al
+        massimo di fila con lo snapshot invariato.
+        """
+        self.root = root
+        self.interval_ms = int(poll_interval * 1000)
+        self.watchdog = watchdog
+        self.max_skip = max(0, int(max_skip))
+        self.msg_last_id = self._start_id("msg_start_id", "msg")
+        self.pos_last_id = self._start_id("pos_start_id", "pos")
+
+        if background:
+            from mc_watchdog import BackgroundRunner
+            self.runner = BackgroundRunner(root, self.db_path, workers=1)
+
+        self._tick()
+
+    def _changed(self):
+        version = self.snapshot.version()
+        if version is None:
+            return True
+        if version == self.snapshot_version and self.skipped < self.max_skip:
+            self.skipped += 1
+            return False
+        self.snapshot_version = version
+        self.skipped = 0
+        return True
+
+    def _tick(self):
+        if not self._changed():
+            self.root.after(self.interval_ms, self._tick)
+            return
+
+        if self.runner is None:
+            self.refresh()
+            self.root.after(self.interval_ms, self._tick)
+            return
+
+        # il prossimo giro parte solo dopo la consegna del precedente
+        def done(data):
+            self.deliver(data)
+            self.root.after(self.interval_ms, self._tick)
+
+        def failed(error):
+            print(f"Errore refresh in background: {error}")
+            self.root.after(self.interval_ms, self._tick)
+
+        self.runner.submit_db(self.fetch, on_done=done, on_error=failed)
+
+    # ---------------- QUERY ----------------
+
+    def max_id(self, table):
+        try:
+            return self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
+
+    def _query(self, sql, params=(), conn=None):
+        try:
+            return (conn or self.conn).execute(sql, params).fetchall()
+        except sqlite3.OperationalError:
+            # tabella non ancora creata dal logger
+            return []
+
+    def new_messages(self, conn=None):
+        rows = self._query("""
+            SELECT *
+            FROM msg
+            WHERE id > ?
+            ORDER BY id ASC
+        """, (self.msg_last_id,), conn)
+        if rows:
+            self.msg_last_id = rows[-1]["id"]
+        return rows
+
+    def new_positions(self, conn=None):
+        rows = self._query("""
+            SELECT *
+            FROM pos
+            WHERE id > ?
+            ORDER BY id ASC
+        """, (self.pos_last_id,), conn)
+        if rows:
+            self.pos_last_id = rows[-1]["id"]
+        return rows
+
+    def latest_positions(self, conn=None):
+        return self._query("""
+            SELECT *
+            FROM pos
+            WHERE id IN (
+                SELECT MAX(id)
+                FROM pos
+                WHERE lat IS NOT NULL AND long IS NOT NULL
+                GROUP BY src
+            )
+            ORDER BY id DESC
+        """, (), conn)
+
+    # ---------------- REFRESH ----------------
+
+    def refresh(self):
+        data = self.fetch(self.conn)
+        self.deliver(data)
+        return data
+
+    def fetch(self, conn):
+        """
+        Righe nuove delle tabelle dei frame (eseguibile in un thread con
+        la sua connessione)
+        """
+        data = RefreshData()
+
+        if self._wanted("snapshot"):
+            data.snapshot = self.snapshot.read()
+        if self._wanted("messages"):
+            data.messages = self.new_messages(conn)
+        # con lo snapshot disponibile le ultime posizioni non si leggono
+        # dal database, salvo per le viste che non lo usano
+        if data.snapshot is None and self._wanted("positions") or self._wanted_without("positions", "snapshot"):
+            data.positions = self.latest_positions(conn)
+        if self._wanted("pos_rows"):
+            data.pos_rows = self.new_positions(conn)
+        return data
+
+    def deliver(self, data):
+        """
+        Aggiorna gli indici incrementali e passa i dati alle viste (thread Tk)
+        """
+        if self._wanted("topology"):
+            self.topology.refresh(self.conn)
+            data.topology = self.topology
+        if self._wanted("coverage"):
+            self.coverage.refresh(self.conn)
+            data.coverage = self.coverage
+        if self._wanted("liveness"):
+            self.liveness.refresh(self.conn)
+            data.liveness = self.liveness
+
+        for view in self.views:
+            try:
+                if self.watchdog:
+                    with self.watchdog.measure(f"{type(view).__name__}.on_refresh"):
+                        view.on_refresh(data)
+                else:
+                    view.on_refresh(data)
+            except Exception as e:
+                print(f"Errore refresh {type(view).__name__}: {e}")
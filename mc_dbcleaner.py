@@ -1,7 +1,10 @@
 import sqlite3
-import sys
+import argparse
 import os
 
+from mc_archive import archive_database, compress_archives, default_archive_dir
+from mc_groups import prune_groups
+
 TIME_FIELD = "time"
 
 def cleanup_database(db_path):
@@ -51,6 +54,10 @@ def cleanup_database(db_path):
             continue
 
     conn.commit()
+
+    # l'indice dei gruppi non deve puntare a messaggi cancellati
+    if per_table_deleted.get("msg"):
+        prune_groups(conn)
     conn.close()
 
     if per_table_deleted:
@@ -61,8 +68,42 @@ def cleanup_database(db_path):
         print("Nessun record cancellato")
 
 
-if __name__ == "__main__":
-    if len(sys.argv) >= 2:
-        cleanup_database(sys.argv[1])
+def archive_mode(db_path, days, archive_dir, compress_days, vacuum):
+    if not os.path.isfile(db_path):
+        print(f"ERRORE: file non trovato ({db_path})")
+        return
+
+    archive_dir = archive_dir or default_archive_dir(db_path)
+    moved = archive_database(db_path, days, archive_dir, vacuum)
+
+    if moved:
+        for table, count in moved.items():
+            print(f"{table}: {count} record archiviati")
+        print(f"Archivi in: {archive_dir}")
     else:
+        print("Nessun record da archiviare")
+
+    if compress_days is not None:
+        count = compress_archives(archive_dir, compress_days)
+        print(f"Archivi compressi: {count}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pulizia (o archiviazione) del database MeshCom"
+    )
+    parser.add_argument("db", nargs="?", help="percorso/nome del database")
+    parser.add_argument("--archive", type=int, metavar="GIORNI",
+                        help="sposta negli archivi giornalieri i record più vecchi di GIORNI invece di cancellarli")
+    parser.add_argument("--dir", help="cartella archivi (default: archive/ accanto al database)")
+    parser.add_argument("--compress", type=int, metavar="GIORNI",
+                        help="comprime gli archivi più vecchi di GIORNI")
+    parser.add_argument("--vacuum", action="store_true", help="compatta il database dopo l'archiviazione")
+    args = parser.parse_args()
+
+    if not args.db:
         print("Specificare il percorso/nome del database")
+    elif args.archive is not None:
+        archive_mode(args.db, args.archive, args.dir, args.compress, args.vacuum)
+    else:
+        cleanup_database(args.db)
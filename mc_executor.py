@@ -0,0 +1,152 @@
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+IS_WINDOWS = os.name == "nt"
+
+OUTPUT_MAX = 4000
+SEEN_MAX = 1000
+
+# ---------------- EXECUTOR ----------------
+
+class CommandExecutor:
+    """
+    Esegue gli script dei comandi in thread separati con:
+    - limite di esecuzioni contemporanee globale e per comando
+    - cooldown per comando e scarto dei msg_id già visti
+    - kill allo scadere del timeout (intero gruppo di processi)
+    - raccolta asincrona di exit code e output (poll_results)
+    """
+
+    def __init__(self, max_concurrent=2, default_timeout=60, default_cooldown=30):
+        self.default_timeout = default_timeout
+        self.default_cooldown = default_cooldown
+
+        self.slots = threading.BoundedSemaphore(max(1, max_concurrent))
+        self.lock = threading.Lock()
+        self.active = {}
+        self.last_start = {}
+        self.seen = OrderedDict()
+        self.results = queue.Queue()
+
+    # ---------------- SUBMIT ----------------
+
+    def submit(self, cmd, script, msg_id=None):
+        """
+        Accoda l'esecuzione. Ritorna (True, "") oppure (False, motivo).
+        """
+        name = cmd["command"]
+        limit = int(cmd.get("max_concurrent", 1))
+        cooldown = float(cmd.get("cooldown", self.default_cooldown))
+        now = time.monotonic()
+
+        with self.lock:
+            if msg_id:
+                if msg_id in self.seen:
+                    return False, f"msg_id {msg_id} già eseguito"
+                self.seen[msg_id] = now
+                if len(self.seen) > SEEN_MAX:
+                    self.seen.popitem(last=False)
+
+            last = self.last_start.get(name)
+            if last is not None and now - last < cooldown:
+                return False, f"cooldown attivo ({int(cooldown - (now - last))}s)"
+
+            if self.active.get(name, 0) >= limit:
+                return False, "limite esecuzioni contemporanee raggiunto"
+
+            self.active[name] = self.active.get(name, 0) + 1
+            self.last_start[name] = now
+
+        timeout = float(cmd.get("timeout", self.default_timeout))
+        threading.Thread(
+            target=self._run,
+            args=(cmd, script, msg_id, timeout),
+            daemon=True
+        ).start()
+        return True, ""
+
+    # ---------------- WORKER ----------------
+
+    def _run(self, cmd, script, msg_id, timeout):
+        name = cmd["command"]
+        result = {
+            "command": name,
+            "script": script,
+            "msg_id": msg_id,
+            "returncode": None,
+            "output": "",
+            "timed_out": False,
+            "duration": 0.0,
+            "error": None,
+        }
+
+        # attesa di uno slot libero globale
+        with self.slots:
+            start = time.monotonic()
+            try:
+                if IS_WINDOWS:
+                    proc = subprocess.Popen(
+                        script, shell=True,
+                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+                    )
+                else:
+                    proc = subprocess.Popen(
+                        ["/bin/bash", script],
+                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                        start_new_session=True
+                    )
+
+                try:
+                    out, _ = proc.communicate(timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    result["timed_out"] = True
+                    self._kill(proc)
+                    out, _ = proc.communicate()
+
+                result["returncode"] = proc.returncode
+                result["output"] = out.decode("utf-8", errors="ignore")[-OUTPUT_MAX:]
+
+            except Exception as e:
+                result["error"] = str(e)
+
+            result["duration"] = time.monotonic() - start
+
+        with self.lock:
+            self.active[name] -= 1
+
+        self.results.put(result)
+
+    @staticmethod
+    def _kill(proc):
+        try:
+            if IS_WINDOWS:
+                subprocess.run(
+                    ["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+            else:
+                os.killpg(proc.pid, signal.SIGKILL)
+        except (OSError, ProcessLookupError):
+            proc.kill()
+
+    # ---------------- RISULTATI ----------------
+
+    def poll_results(self):
+        """
+        Risultati completati dall'ultima chiamata (non bloccante)
+        """
+        done = []
+        while True:
+            try:
+                done.append(self.results.get_nowait())
+            except queue.Empty:
+                return done
+
+    def running(self):
+        with self.lock:
+            return sum(self.active.values())
@@ -0,0 +1,312 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+
+from mc_archive import ARCHIVE_TABLES, default_archive_dir, iter_rows
+
+# ---------------- CONFIG ----------------
+
+TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+INPUT_FORMATS = (
+    "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y",
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d",
+)
+POS_COLUMNS = "id, src, time, lat, lat_dir, long, long_dir"
+# nodo di origine calcolato in SQL (primo elemento di src), per leggere
+# le tracce già raggruppate per nodo
+TRACK_SQL = (
+    "TRIM(CASE WHEN instr(src, ',') > 0 "
+    "THEN substr(src, 1, instr(src, ',') - 1) ELSE src END)"
+)
+
+# ---------------- UTILS ----------------
+
+def parse_when(text, end=False):
+    """
+    Data/ora da riga di comando; una data senza ora vale l'inizio del
+    giorno (o la fine se end=True)
+    """
+    if not text:
+        return None
+    for fmt in INPUT_FORMATS:
+        try:
+            value = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if end and "%H" not in fmt:
+            value = value.replace(hour=23, minute=59, second=59)
+        return value
+    raise argparse.ArgumentTypeError(f"data non valida: {text}")
+
+
+def build_filter(table, callsigns=(), group=None):
+    """
+    Condizione SQL (che inizia con AND) e parametri per i filtri su
+    callsign di origine e gruppo di destinazione (solo msg)
+    """
+    sql, params = "", []
+
+    if callsigns:
+        parts = []
+        for cs in callsigns:
+            parts.append("(UPPER(src) = ? OR UPPER(src) LIKE ?)")
+            params += [cs.upper(), cs.upper() + ",%"]
+        sql += " AND (" + " OR ".join(parts) + ")"
+
+    if group and table == "msg":
+        # il gruppo è l'ultimo elemento di dst ("VIA,...,GRUPPO")
+        sql += " AND (TRIM(dst) = ? OR dst LIKE ?)"
+        params += [group, "%," + group]
+
+    return sql, params
+
+
+def to_degrees(value, direction):
+    value = float(value)
+    if direction in ("S", "W"):
+        value = -value
+    return value
+
+
+def point_of(row):
+    """
+    (callsign, lat, lon, time) di una riga di pos, None se non valida
+    """
+    try:
+        lat = to_degrees(row["lat"], row["lat_dir"])
+        lon = to_degrees(row["long"], row["long_dir"])
+    except (TypeError, ValueError):
+        return None
+    if not row["src"]:
+        return None
+    return row["src"].split(",")[0].strip(), lat, lon, row["time"]
+
+
+def iso_time(t):
+    """
+    "gg/mm/aaaa hh:mm:ss" (ora locale) -> ISO 8601 UTC, "" se non valida
+    """
+    try:
+        local = datetime.strptime(t, TIME_FORMAT).astimezone()
+    except (TypeError, ValueError):
+        return ""
+    return local.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def open_output(path, compress):
+    """
+    File di testo in uscita ("-" = stdout), compresso al volo con gzip
+    """
+    if path == "-":
+        if compress:
+            return io.TextIOWrapper(gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb"),
+                                    encoding="utf-8", newline="")
+        return io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="")
+
+    if compress:
+        if not path.endswith(".gz"):
+            path += ".gz"
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+# ---------------- SORGENTE ----------------
+
+class Source:
+    """
+    Righe filtrate di una tabella, dal database principale e (se
+    archive_dir) dagli archivi giornalieri, una alla volta
+    """
+
+    def __init__(self, db_path, start=None, end=None, callsigns=(), group=None, archive_dir=None):
+        self.db_path = db_path
+        self.start = start
+        self.end = end
+        self.callsigns = callsigns
+        self.group = group
+        self.archive_dir = archive_dir
+
+    def rows(self, table, columns="*", callsigns=None, extra="", order="id ASC", merge_key=None):
+        where, params = build_filter(
+            table,
+            self.callsigns if callsigns is None else callsigns,
+            self.group
+        )
+        return iter_rows(
+            self.db_path, table, where + extra, params,
+            self.start, self.end, self.archive_dir, columns, order, merge_key
+        )
+
+    def positions(self, callsigns=None):
+        extra = " AND lat IS NOT NULL AND long IS NOT NULL"
+        for row in self.rows("pos", POS_COLUMNS, callsigns, extra):
+            point = point_of(row)
+            if point:
+                yield row["id"], point
+
+    def latest(self):
+        """
+        Ultima posizione per callsign: memoria proporzionale ai nodi, non
+        alle righe
+        """
+        last = {}
+        for row_id, point in self.positions():
+            last[point[0]] = (row_id, point)
+        return sorted(last.values(), key=lambda item: -item[0])
+
+    def tracks(self):
+        """
+        (callsign, punti) per nodo, in una sola lettura ordinata per nodo
+        e id (archivi e database fusi): in memoria resta una sola traccia
+        alla volta
+        """
+        extra = " AND lat IS NOT NULL AND long IS NOT NULL AND src IS NOT NULL"
+        rows = self.rows(
+            "pos", f"{POS_COLUMNS}, {TRACK_SQL} AS track", extra=extra,
+            order="track ASC, id ASC", merge_key=lambda row: (row["track"], row["id"])
+        )
+
+        current, points = None, []
+        for row in rows:
+            if row["track"] != current:
+                if points:
+                    yield current, points
+                current, points = row["track"], []
+            point = point_of(row)
+            if point:
+                points.append(point)
+        if points:
+            yield current, points
+
+# ---------------- FORMATI ----------------
+
+def export_csv(source, table, out):
+    writer = csv.writer(out)
+    header = None
+    count = 0
+
+    for row in source.rows(table):
+        if header is None:
+            header = row.keys()
+            writer.writerow(header)
+        keys = row.keys()
+        writer.writerow([row[k] if k in keys else "" for k in header])
+        count += 1
+
+    return count
+
+
+def export_geojson(source, mode, out):
+    out.write('{"type": "FeatureCollection", "features": [\n')
+    count = 0
+
+    def feature(geometry, properties):
+        nonlocal count
+        if count:
+            out.write(",\n")
+        out.write(json.dumps({
+            "type": "Feature",
+            "geometry": geometry,
+            "properties": properties
+        }, ensure_ascii=False))
+        count += 1
+
+    if mode == "latest":
+        for row_id, (cs, lat, lon, t) in source.latest():
+            feature({"type": "Point", "coordinates": [lon, lat]}, {"callsign": cs, "time": t, "id": row_id})
+    else:
+        for cs, points in source.tracks():
+            coords = [[lon, lat] for _, lat, lon, _ in points]
+            times = [t for _, _, _, t in points]
+            if len(coords) >= 2:
+                feature(
+                    {"type": "LineString", "coordinates": coords},
+                    {"callsign": cs, "start": times[0], "end": times[-1], "points": len(coords)}
+                )
+
+    out.write("\n]}\n")
+    return count
+
+
+def export_gpx(source, mode, out):
+    out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    out.write('<gpx version="1.1" creator="mc_export" xmlns="http://www.topografix.com/GPX/1/1">\n')
+    count = 0
+
+    if mode == "latest":
+        for _, (cs, lat, lon, t) in source.latest():
+            out.write(f'  <wpt lat="{lat:.6f}" lon="{lon:.6f}">')
+            ts = iso_time(t)
+            if ts:
+                out.write(f"<time>{ts}</time>")
+            out.write(f"<name>{escape(cs)}</name></wpt>\n")
+            count += 1
+    else:
+        for cs, points in source.tracks():
+            out.write(f"  <trk><name>{escape(cs)}</name><trkseg>\n")
+            for _, lat, lon, t in points:
+                out.write(f'    <trkpt lat="{lat:.6f}" lon="{lon:.6f}">')
+                ts = iso_time(t)
+                if ts:
+                    out.write(f"<time>{ts}</time>")
+                out.write("</trkpt>\n")
+            out.write("  </trkseg></trk>\n")
+            count += 1
+
+    out.write("</gpx>\n")
+    return count
+
+# ---------------- MAIN ----------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Esportazione di msg/pos/tele in CSV, GeoJSON o GPX")
+    parser.add_argument("db", help="database (es. meshcom.db)")
+    parser.add_argument("format", choices=("csv", "geojson", "gpx"))
+    parser.add_argument("-o", "--output", default="-", help="file in uscita (default stdout)")
+    parser.add_argument("--table", choices=ARCHIVE_TABLES, default="msg", help="tabella per il CSV")
+    parser.add_argument("--geo", choices=("latest", "tracks"), default="latest",
+                        help="GeoJSON/GPX: ultime posizioni o tracce")
+    parser.add_argument("--start", type=parse_when, help="da (gg/mm/aaaa [hh:mm])")
+    parser.add_argument("--end", type=lambda t: parse_when(t, end=True), help="a (gg/mm/aaaa [hh:mm])")
+    parser.add_argument("--callsign", action="append", default=[], help="nodo di origine (ripetibile)")
+    parser.add_argument("--group", help="gruppo di destinazione (solo msg)")
+    parser.add_argument("--archive", action="store_true", help="includi gli archivi giornalieri")
+    parser.add_argument("--dir", help="cartella degli archivi (default ./archive accanto al db)")
+    parser.add_argument("--gzip", action="store_true", help="comprimi l'uscita")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db):
+        print(f"ERRORE: file non trovato ({args.db})", file=sys.stderr)
+        sys.exit(1)
+
+    callsigns = [c.strip() for item in args.callsign for c in item.split(",") if c.strip()]
+    source = Source(
+        args.db,
+        args.start,
+        args.end,
+        callsigns,
+        args.group,
+        (args.dir or default_archive_dir(args.db)) if args.archive else None
+    )
+
+    out = open_output(args.output, args.gzip)
+    try:
+        if args.format == "csv":
+            count = export_csv(source, args.table, out)
+        elif args.format == "geojson":
+            count = export_geojson(source, args.geo, out)
+        else:
+            count = export_gpx(source, args.geo, out)
+    finally:
+        out.close()
+
+    print(f"Esportati {count} elementi", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
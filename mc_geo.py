@@ -0,0 +1,177 @@
+import math
+
+# ---------------- COSTANTI ----------------
+
+EARTH_RADIUS_KM = 6371.0
+TILE_SIZE = 256
+MAX_LAT = 85.05112878
+METERS_PER_PIXEL_Z0 = 156543.03392
+
+# ---------------- UTILS ----------------
+
+def haversine(lat1, lon1, lat2, lon2):
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dp = math.radians(lat2 - lat1)
+    dl = math.radians(lon2 - lon1)
+
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def bbox_around(lat, lon, radius_km):
+    """
+    Rettangolo (min_lat, min_lon, max_lat, max_lon) che contiene il
+    cerchio di raggio radius_km
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def latlon_to_pixel(lat, lon, zoom):
+    """
+    Coordinate in pixel "mondo" (Web Mercator) al livello di zoom dato
+    """
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    scale = TILE_SIZE * (2 ** zoom)
+    x = (lon + 180.0) / 360.0 * scale
+    s = math.sin(math.radians(lat))
+    y = (0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)) * scale
+    return x, y
+
+
+def zoom_for_span(span_km, lat, pixels, min_zoom=1, max_zoom=19):
+    """
+    Zoom più alto al quale span_km entra in 'pixels' pixel di schermo
+    """
+    if span_km <= 0 or pixels <= 0:
+        return max_zoom
+
+    mpp = span_km * 1000.0 / pixels
+    zoom = math.log2(METERS_PER_PIXEL_Z0 * math.cos(math.radians(lat)) / mpp)
+    return max(min_zoom, min(max_zoom, int(math.floor(zoom))))
+
+
+def bounds_of(points, pad_ratio=0.1, min_pad_deg=0.005):
+    """
+    Estensione (min_lat, min_lon, max_lat, max_lon) di una lista di
+    (lat, lon), con un margine proporzionale. None se la lista è vuota.
+    """
+    if not points:
+        return None
+
+    lats = [p[0] for p in points]
+    lons = [p[1] for p in points]
+    min_lat, max_lat = min(lats), max(lats)
+    min_lon, max_lon = min(lons), max(lons)
+
+    pad_lat = max((max_lat - min_lat) * pad_ratio, min_pad_deg)
+    pad_lon = max((max_lon - min_lon) * pad_ratio, min_pad_deg)
+
+    return (
+        max(-MAX_LAT, min_lat - pad_lat),
+        max(-180.0, min_lon - pad_lon),
+        min(MAX_LAT, max_lat + pad_lat),
+        min(180.0, max_lon + pad_lon),
+    )
+
+# ---------------- INDICE SPAZIALE ----------------
+
+class GridIndex:
+    """
+    Indice spaziale a griglia regolare in gradi: inserimento e rimozione
+    O(1), query per rettangolo proporzionale alle celle toccate.
+    """
+
+    def __init__(self, cell_deg=0.05):
+        self.cell_deg = cell_deg
+        self.cells = {}
+        self.items = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def _cell(self, lat, lon):
+        return (int(math.floor(lat / self.cell_deg)),
+                int(math.floor(lon / self.cell_deg)))
+
+    def clear(self):
+        self.cells.clear()
+        self.items.clear()
+
+    def insert(self, key, lat, lon):
+        if key in self.items:
+            self.remove(key)
+
+        cell = self._cell(lat, lon)
+        self.cells.setdefault(cell, set()).add(key)
+        self.items[key] = (lat, lon, cell)
+
+    def remove(self, key):
+        item = self.items.pop(key, None)
+        if item is None:
+            return
+
+        bucket = self.cells.get(item[2])
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self.cells[item[2]]
+
+    def position(self, key):
+        item = self.items.get(key)
+        return (item[0], item[1]) if item else None
+
+    def query_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        r0, c0 = self._cell(min_lat, min_lon)
+        r1, c1 = self._cell(max_lat, max_lon)
+
+        # rettangolo più grande dell'intera griglia: conviene la scansione
+        if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self.cells):
+            candidates = (k for bucket in self.cells.values() for k in bucket)
+        else:
+            candidates = (
+                k
+                for r in range(r0, r1 + 1)
+                for c in range(c0, c1 + 1)
+                for k in self.cells.get((r, c), ())
+            )
+
+        result = []
+        for key in candidates:
+            lat, lon, _ = self.items[key]
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                result.append(key)
+        return result
+
+# ---------------- CLUSTERING ----------------
+
+def cluster_points(points, zoom, radius_px):
+    """
+    Raggruppa i punti [(key, lat, lon), ...] che allo zoom dato cadono
+    nella stessa cella di radius_px pixel. Ritorna una lista di dict
+    {"lat", "lon", "keys"} con il baricentro di ogni gruppo.
+    """
+    buckets = {}
+
+    for key, lat, lon in points:
+        x, y = latlon_to_pixel(lat, lon, zoom)
+        cell = (int(x // radius_px), int(y // radius_px))
+        b = buckets.get(cell)
+        if b is None:
+            buckets[cell] = [lat, lon, [key]]
+        else:
+            b[0] += lat
+            b[1] += lon
+            b[2].append(key)
+
+    clusters = []
+    for lat_sum, lon_sum, keys in buckets.values():
+        n = len(keys)
+        clusters.append({
+            "lat": lat_sum / n,
+            "lon": lon_sum / n,
+            "keys": keys
+        })
+    return clusters
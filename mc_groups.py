@@ -0,0 +1,224 @@
+import sqlite3
+import sys
+import time
+
+from mc_topology import parse_path, parse_ts
+
+# ---------------- CONFIG ----------------
+
+PAGE_SIZE = 100
+RECENT_HOURS = 24
+
+# ---------------- UTILS ----------------
+
+def group_of(dst):
+    """
+    Gruppo (o nominativo) di destinazione: ultimo elemento di
+    "VIA,...,GRUPPO"
+    """
+    parts = [p.strip() for p in str(dst or "").split(",") if p.strip()]
+    return parts[-1] if parts else "?"
+
+# ---------------- SCRITTURA (SINK DEL LOGGER) ----------------
+
+class GroupIndex:
+    """
+    Indice delle conversazioni per gruppo, aggiornato ad ogni msg:
+    - group_summary: totale messaggi e ultimo messaggio di ogni gruppo
+    - group_hourly: messaggi per ora
+    - group_participants: nodi che hanno scritto nel gruppo
+    - group_messages: (gruppo, id di msg) per sfogliare un gruppo a
+      pagine senza leggere tutta la tabella msg
+    Come sink di FrameProcessor non esegue commit.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS group_summary (
+                grp TEXT PRIMARY KEY,
+                count INTEGER,
+                last_id INTEGER,
+                last_time TEXT,
+                last_src TEXT,
+                last_msg TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS group_hourly (
+                grp TEXT,
+                hour INTEGER,
+                count INTEGER,
+                PRIMARY KEY (grp, hour)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS group_participants (
+                grp TEXT,
+                callsign TEXT,
+                count INTEGER,
+                last_id INTEGER,
+                PRIMARY KEY (grp, callsign)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS group_messages (
+                grp TEXT,
+                msg_id INTEGER,
+                PRIMARY KEY (grp, msg_id)
+            ) WITHOUT ROWID;
+        """)
+        self.conn.commit()
+
+    def on_frame(self, frame_type, row_id, frame):
+        if frame_type != "msg":
+            return
+        self.add(row_id, frame.get("src"), frame.get("dst"), frame.get("msg"), frame.get("time"))
+
+    def add(self, msg_id, src, dst, text, t):
+        grp = group_of(dst)
+        path = parse_path(src)
+        sender = path[0] if path else "?"
+
+        self.conn.execute("""
+            INSERT INTO group_summary (grp, count, last_id, last_time, last_src, last_msg)
+            VALUES (?, 1, ?, ?, ?, ?)
+            ON CONFLICT (grp) DO UPDATE SET
+                count = count + 1,
+                last_id = excluded.last_id,
+                last_time = excluded.last_time,
+                last_src = excluded.last_src,
+                last_msg = excluded.last_msg
+        """, (grp, msg_id, t, sender, text))
+
+        self.conn.execute("""
+            INSERT INTO group_hourly (grp, hour, count)
+            VALUES (?, ?, 1)
+            ON CONFLICT (grp, hour) DO UPDATE SET count = count + 1
+        """, (grp, parse_ts(t) // 3600))
+
+        self.conn.execute("""
+            INSERT INTO group_participants (grp, callsign, count, last_id)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT (grp, callsign) DO UPDATE SET
+                count = count + 1,
+                last_id = excluded.last_id
+        """, (grp, sender, msg_id))
+
+        self.conn.execute(
+            "INSERT OR IGNORE INTO group_messages (grp, msg_id) VALUES (?, ?)",
+            (grp, msg_id)
+        )
+
+    def rebuild(self):
+        """
+        Ricostruisce l'indice da tutta la tabella msg
+        """
+        for table in ("group_summary", "group_hourly", "group_participants", "group_messages"):
+            self.conn.execute(f"DELETE FROM {table}")
+
+        count = 0
+        try:
+            cur = self.conn.execute("SELECT id, src, dst, msg, time FROM msg ORDER BY id ASC")
+        except sqlite3.OperationalError:
+            cur = []
+
+        for row in cur:
+            self.add(*row)
+            count += 1
+
+        self.conn.commit()
+        return count
+
+
+def prune_groups(conn):
+    """
+    Da chiamare dopo aver cancellato righe di msg (archiviazione,
+    pulizia): l'indice viene ricostruito dai messaggi rimasti. Nessun
+    effetto se il logger non ha mai creato l'indice.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'group_messages'"
+    ).fetchone()
+    if not exists:
+        return 0
+    return GroupIndex(conn).rebuild()
+
+# ---------------- LETTURA (VISTE) ----------------
+
+def group_overview(conn, recent_hours=RECENT_HOURS):
+    """
+    Una riga per gruppo, dal più recente: grp, count, last_id, last_time,
+    last_src, last_msg, recent (messaggi nelle ultime recent_hours ore),
+    nodes (partecipanti)
+    """
+    since = int(time.time()) // 3600 - recent_hours + 1
+    try:
+        return conn.execute("""
+            SELECT s.grp, s.count, s.last_id, s.last_time, s.last_src, s.last_msg,
+                   (SELECT COALESCE(SUM(h.count), 0) FROM group_hourly h
+                    WHERE h.grp = s.grp AND h.hour >= ?) AS recent,
+                   (SELECT COUNT(*) FROM group_participants p
+                    WHERE p.grp = s.grp) AS nodes
+            FROM group_summary s
+            ORDER BY s.last_id DESC
+        """, (since,)).fetchall()
+    except sqlite3.OperationalError:
+        # logger senza indice dei gruppi
+        return []
+
+
+def unread_count(conn, grp, after_id):
+    """
+    Messaggi del gruppo con id > after_id ancora presenti in msg
+    """
+    try:
+        return conn.execute("""
+            SELECT COUNT(*)
+            FROM group_messages g
+            JOIN msg m ON m.id = g.msg_id
+            WHERE g.grp = ? AND g.msg_id > ?
+        """, (grp, after_id)).fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def participants(conn, grp, limit=20):
+    try:
+        return conn.execute("""
+            SELECT callsign, count
+            FROM group_participants
+            WHERE grp = ?
+            ORDER BY last_id DESC
+            LIMIT ?
+        """, (grp, limit)).fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+
+def fetch_page(conn, grp, before_id=None, limit=PAGE_SIZE):
+    """
+    Messaggi del gruppo con id < before_id (None = dai più recenti), in
+    ordine di id decrescente: per la pagina successiva si passa l'id
+    dell'ultima riga ricevuta (paginazione a chiave, costo costante)
+    """
+    try:
+        return conn.execute("""
+            SELECT m.id, m.time, m.src, m.dst, m.msg
+            FROM group_messages g
+            JOIN msg m ON m.id = g.msg_id
+            WHERE g.grp = ? AND g.msg_id < ?
+            ORDER BY g.msg_id DESC
+            LIMIT ?
+        """, (grp, before_id if before_id is not None else sys.maxsize, limit)).fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+# ---------------- MAIN ----------------
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        conn = sqlite3.connect(sys.argv[1])
+        start = time.time()
+        count = GroupIndex(conn).rebuild()
+        print(f"Indice dei gruppi ricostruito da {count} messaggi in {time.time() - start:.1f} s")
+        conn.close()
+    else:
+        print("Uso: mc_groups.py <database>")
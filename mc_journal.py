@@ -0,0 +1,346 @@
+import bisect
+import json
+import os
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+from collections import namedtuple
+
+# ---------------- CONFIG ----------------
+
+SEGMENT_BYTES = 16 * 1024 * 1024
+SYNC_INTERVAL = 0.5
+
+# formato di un segmento (little endian):
+#   intestazione  MAGIC (4 byte) + primo seq (uint64)
+#   record        lunghezza payload (uint32) | crc32 (uint32) |
+#                 seq (uint64) | ricezione (double, epoch) | payload utf-8
+# il crc copre seq, ricezione e payload; un record incompleto o con crc
+# errato chiude il segmento (coda scritta a metà durante un crash)
+MAGIC = b"MCJ1"
+SEGMENT_HEADER = struct.Struct("<4sQ")
+RECORD_HEADER = struct.Struct("<IIQd")
+MAX_RECORD = 1024 * 1024
+SUFFIX = ".mcj"
+QUARANTINE_FILE = "quarantine.jsonl"
+
+JournalRecord = namedtuple("JournalRecord", "seq received line segment end")
+
+# ---------------- UTILS ----------------
+
+def segment_name(first_seq):
+    return f"{first_seq:012d}{SUFFIX}"
+
+
+def list_segments(directory):
+    """
+    Primi seq dei segmenti presenti, in ordine
+    """
+    firsts = []
+    for name in os.listdir(directory):
+        if name.endswith(SUFFIX) and name[:-len(SUFFIX)].isdigit():
+            firsts.append(int(name[:-len(SUFFIX)]))
+    return sorted(firsts)
+
+
+def default_journal_dir(db_path, name="journal"):
+    if os.path.isabs(name):
+        return name
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), name)
+
+
+def segment_header(path):
+    """
+    Primo seq dichiarato nell'intestazione, None se non valida
+    """
+    with open(path, "rb") as f:
+        head = f.read(SEGMENT_HEADER.size)
+    if len(head) < SEGMENT_HEADER.size or head[:4] != MAGIC:
+        return None
+    return SEGMENT_HEADER.unpack(head)[1]
+
+
+def scan_segment(path, offset=None):
+    """
+    (seq, ricezione, riga, fine record) dei record validi a partire da
+    'offset'; l'ultimo elemento è None se il segmento termina con un
+    record danneggiato, altrimenti l'offset in cui si è fermato. Con
+    intestazione non valida non produce nulla.
+    """
+    if segment_header(path) is None:
+        return
+
+    with open(path, "rb") as f:
+        pos = SEGMENT_HEADER.size if offset is None else offset
+        f.seek(pos)
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if not header:
+                yield pos
+                return
+            if len(header) < RECORD_HEADER.size:
+                yield None
+                return
+
+            length, crc, seq, received = RECORD_HEADER.unpack(header)
+            payload = f.read(length) if length <= MAX_RECORD else b""
+            if len(payload) != length or zlib.crc32(header[8:] + payload) != crc:
+                yield None
+                return
+
+            pos += RECORD_HEADER.size + length
+            yield seq, received, payload.decode("utf-8", errors="replace"), pos
+
+# ---------------- JOURNAL ----------------
+
+class Journal:
+    """
+    Registro append-only delle righe ricevute dalla seriale, scritto
+    prima del parsing. Ogni riga riceve un seq crescente; i segmenti
+    ruotano oltre segment_bytes. write+flush ad ogni record (sopravvive
+    a un crash del processo), fsync al massimo ogni sync_interval
+    secondi (sopravvive a un crash del sistema salvo l'ultimo intervallo).
+
+    min_seq: ultimo seq già confermato nel database; se il journal ha
+    perso la coda (crash del sistema prima del fsync) la numerazione
+    riparte dopo min_seq, così nessun seq viene riusato.
+    """
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, sync_interval=SYNC_INTERVAL, min_seq=0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.sync_interval = sync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments = list_segments(directory)
+        self.file = None
+        self.segment = None
+        self.last_seq = 0
+        self.unsynced = False
+        self.last_sync = time.monotonic()
+
+        if self.segments:
+            self._recover(self.segments[-1])
+
+        if self.file is None or self.last_seq < min_seq:
+            self.last_seq = max(self.last_seq, min_seq)
+            self._open_segment(self.last_seq + 1)
+
+    def _path(self, first_seq):
+        return os.path.join(self.directory, segment_name(first_seq))
+
+    def _recover(self, first_seq):
+        """
+        Ultimo record valido del segmento corrente; una coda danneggiata
+        (scritta a metà) viene troncata
+        """
+        path = self._path(first_seq)
+        size = os.path.getsize(path)
+
+        if segment_header(path) != first_seq:
+            if size > 0:
+                print(f"⚠ Journal: segmento {segment_name(first_seq)} illeggibile, ignorato")
+                os.replace(path, path + ".bad")
+            else:
+                os.remove(path)
+            self.segments.remove(first_seq)
+            self.last_seq = first_seq - 1
+            return
+
+        last, end = first_seq - 1, SEGMENT_HEADER.size
+        for item in scan_segment(path):
+            if isinstance(item, tuple):
+                last, end = item[0], item[3]
+        if end < size:
+            print(f"⚠ Journal: coda danneggiata in {segment_name(first_seq)}, troncati {size - end} byte")
+
+        self.file = open(path, "r+b")
+        self.file.truncate(end)
+        self.file.seek(end)
+        self.segment = first_seq
+        self.last_seq = last
+
+    def _open_segment(self, first_seq):
+        if self.file:
+            self.sync()
+            self.file.close()
+
+        path = self._path(first_seq)
+        self.file = open(path, "wb")
+        self.file.write(SEGMENT_HEADER.pack(MAGIC, first_seq))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.segment = first_seq
+        if first_seq not in self.segments:
+            self.segments.append(first_seq)
+
+    # ---------------- SCRITTURA ----------------
+
+    def append(self, line, received=None):
+        """
+        Aggiunge una riga; ritorna il record (seq, ricezione, riga,
+        segmento, fine record) da passare al database
+        """
+        received = time.time() if received is None else received
+        if self.file.tell() >= self.segment_bytes:
+            self._open_segment(self.last_seq + 1)
+
+        seq = self.last_seq + 1
+        payload = line.encode("utf-8")
+        body = RECORD_HEADER.pack(len(payload), 0, seq, received)[8:] + payload
+        self.file.write(struct.pack("<II", len(payload), zlib.crc32(body)) + body)
+        self.file.flush()
+        self.last_seq = seq
+        self.unsynced = True
+
+        self.maybe_sync()
+        return JournalRecord(seq, received, line, self.segment, self.file.tell())
+
+    def maybe_sync(self):
+        """
+        fsync raggruppato: da chiamare anche quando non arrivano righe
+        """
+        if self.unsynced and time.monotonic() - self.last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        if self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = False
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if self.file:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def prune(self, committed_seq, keep):
+        """
+        Elimina i segmenti più vecchi, tenendone almeno 'keep' e mai uno
+        che contenga record non ancora confermati (keep=0: tiene tutto)
+        """
+        if keep <= 0:
+            return 0
+        removed = 0
+        while len(self.segments) > keep and self.segments[1] <= committed_seq + 1:
+            os.remove(self._path(self.segments.pop(0)))
+            removed += 1
+        return removed
+
+    def read(self, after_seq=0, segment=None, offset=None):
+        return read_records(self.directory, after_seq, segment, offset)
+
+
+def read_records(directory, after_seq=0, segment=None, offset=None):
+    """
+    Record con seq > after_seq, in ordine. segment/offset (dalla tabella
+    journal_state) evitano di rileggere il segmento dall'inizio. Solo
+    lettura: si può usare mentre il logger scrive.
+    """
+    firsts = list_segments(directory)
+    path = os.path.join(directory, segment_name(segment)) if segment is not None else None
+    if segment in firsts and offset is not None and offset <= os.path.getsize(path):
+        start = firsts.index(segment)
+    else:
+        start = max(bisect.bisect_right(firsts, after_seq + 1) - 1, 0)
+        offset = None
+
+    for i in range(start, len(firsts)):
+        first = firsts[i]
+        for item in scan_segment(os.path.join(directory, segment_name(first)), offset if i == start else None):
+            if isinstance(item, tuple):
+                seq, received, line, end = item
+                if seq > after_seq:
+                    yield JournalRecord(seq, received, line, first, end)
+            elif item is None and i < len(firsts) - 1:
+                print(f"⚠ Journal: record danneggiato in {segment_name(first)}, resto del segmento ignorato")
+
+# ---------------- STATO NEL DATABASE ----------------
+
+def ensure_state_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS journal_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            seq INTEGER,
+            segment INTEGER,
+            offset INTEGER
+        )
+    """)
+
+
+def load_state(conn):
+    """
+    (seq, segmento, offset) dell'ultimo record confermato nel database
+    """
+    ensure_state_table(conn)
+    row = conn.execute("SELECT seq, segment, offset FROM journal_state WHERE id = 1").fetchone()
+    return tuple(row) if row else (0, None, None)
+
+
+def save_state(conn, record):
+    """
+    Da eseguire nella stessa transazione del frame (senza commit)
+    """
+    conn.execute(
+        "INSERT OR REPLACE INTO journal_state (id, seq, segment, offset) VALUES (1, ?, ?, ?)",
+        (record.seq, record.segment, record.end)
+    )
+
+
+
+def quarantine(conn, directory, record, error):
+    """
+    Record che il database rifiuta per un motivo diverso da un blocco
+    (es. colonna con un nome non valido): la riga finisce in
+    quarantine.jsonl nella cartella del journal e journal_state passa
+    oltre, così il recupero non si ferma sullo stesso record
+    """
+    with open(os.path.join(directory, QUARANTINE_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "seq": record.seq,
+            "received": record.received,
+            "line": record.line,
+            "error": str(error),
+        }, ensure_ascii=False) + "\n")
+
+    try:
+        save_state(conn, record)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"⚠ Journal: seq {record.seq} in quarantena ma stato non aggiornato: {e}")
+
+# ---------------- MAIN ----------------
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        directory = sys.argv[1]
+        dump = "--dump" in sys.argv[2:]
+        firsts = list_segments(directory)
+        count = 0
+        first_seq = last_seq = None
+
+        for first in firsts:
+            path = os.path.join(directory, segment_name(first))
+            records = 0
+            for item in scan_segment(path):
+                if isinstance(item, tuple):
+                    seq, received, line, _ = item
+                    first_seq = seq if first_seq is None else first_seq
+                    last_seq = seq
+                    records += 1
+                    if dump:
+                        print(f"{seq}\t{received:.3f}\t{line}")
+                elif item is None:
+                    print(f"⚠ {segment_name(first)}: record danneggiato dopo {records} record", file=sys.stderr)
+            count += records
+            if not dump:
+                print(f"{segment_name(first)}: {records} record, {os.path.getsize(path)} byte")
+
+        if not dump:
+            print(f"Totale: {len(firsts)} segmenti, {count} record, seq {first_seq} - {last_seq}")
+    else:
+        print("Uso: mc_journal.py <cartella journal> [--dump]")
@@ -1,12 +1,16 @@
-import sqlite3
 import tkinter as tk
 from tkinter.scrolledtext import ScrolledText
 import json
 import sys
 import os
-import subprocess
+import socket
+from collections import deque
 from datetime import datetime
 
+from mc_data import SNAPSHOT_MAX_SKIP, DataHub
+from mc_offsets import ConsumerOffsets, START_MODES
+from mc_executor import CommandExecutor
+
 # ---------------- CONFIG ----------------
 
 CONFIG_FILE = "config_listener.json"
@@ -20,6 +24,7 @@ except Exception as e:
 
 DB_PATH = config.get("DB_PATH", "meshcom.db")
 POLL_INTERVAL = config.get("POLL_INTERVAL", 10)
+MAX_SKIP = config.get("SNAPSHOT_MAX_SKIP", SNAPSHOT_MAX_SKIP)
 
 DST_GROUP = str(config.get("DST_GROUP", ""))
 
@@ -31,25 +36,50 @@ KEEP_ALIVE = config.get("KEEP_ALIVE_SECONDS", 60)
 COMMANDS = config.get("COMMANDS", [])
 CMD_CASE_INSENSITIVE = config.get("COMMAND_CASE_INSENSITIVE", False)  
 
+CONSUMER_NAME = config.get("CONSUMER_NAME", "mc_listener")
+START_FROM = config.get("START_FROM", "checkpoint")
+if START_FROM not in START_MODES:
+    START_FROM = "checkpoint"
+
+MAX_CONCURRENT = config.get("MAX_CONCURRENT", 2)
+COMMAND_TIMEOUT = config.get("COMMAND_TIMEOUT", 60)
+COMMAND_COOLDOWN = config.get("COMMAND_COOLDOWN", 30)
+
+REPLY_RESULTS = config.get("REPLY_RESULTS", False)
+SERVER_IP = config.get("SERVER_IP", "127.0.0.1")
+SERVER_PORT = config.get("SERVER_PORT", 1703)
+UDP_PREFIX = config.get("UDP_PREFIX", "MSG_OUT:")
+
+RESULTS_POLL_MS = 500
+
+# le risposte tornano indietro come eco del gateway (src = nodo locale):
+# iniziano con REPLY_TAG e non contengono il nome del comando
+REPLY_TAG = "[risposta]"
+
 IS_WINDOWS = os.name == "nt"
 
-# ---------------- APP ----------------
+# ---------------- VISTA ----------------
 
-class MeshComCommandListener(tk.Tk):
-    def __init__(self):
-        super().__init__()
+class ListenerView(tk.Frame):
+    wants = ("messages",)
 
-        self.title("MeshCom – Command Listener v0.12012026 by IK5XMK")
-        self.geometry("950x420")
+    def __init__(self, master, hub):
+        super().__init__(master)
+        self.hub = hub
 
-        self.last_id = 0
+        self.offsets = ConsumerOffsets(hub.conn)
+        self.last_id = self.offsets.start_id(CONSUMER_NAME, "msg", START_FROM)
 
-        self.conn = sqlite3.connect(DB_PATH)
-        self.conn.row_factory = sqlite3.Row
+        self.executor = CommandExecutor(MAX_CONCURRENT, COMMAND_TIMEOUT, COMMAND_COOLDOWN)
+        self.sent_replies = deque(maxlen=50)
 
         self._setup_ui()
         self._startup_log()
-        self.poll_messages()
+        self.poll_results()
+
+        # i nuovi messaggi arrivano dal ciclo di refresh del DataHub
+        self.msg_start_id = self.last_id
+        hub.register(self)
 
     # ---------------- UI ----------------
 
@@ -71,28 +101,23 @@ class MeshComCommandListener(tk.Tk):
         self.log(f"Keep-alive          : {KEEP_ALIVE}s")
         self.log(f"Polling DB          : {POLL_INTERVAL}s")
         self.log(f"Command case-insens.: {CMD_CASE_INSENSITIVE}")
+        self.log(f"Avvio da            : {START_FROM} (id > {self.last_id})")
+        self.log(f"Esecuzioni max      : {MAX_CONCURRENT} (timeout {COMMAND_TIMEOUT}s, cooldown {COMMAND_COOLDOWN}s)")
 
     # ---------------- DB POLLING ----------------
 
-    def poll_messages(self):
-        cur = self.conn.cursor()
-
-        sql = """
-            SELECT id, time, src, dst, msg
-            FROM msg
-            WHERE id > ?
-            ORDER BY id ASC
-        """
+    def on_refresh(self, data):
+        rows = [r for r in data.messages if r["id"] > self.last_id]
 
-        cur.execute(sql, (self.last_id,))
-        rows = cur.fetchall()
+        # il cursore si salva PRIMA di eseguire i comandi: dopo un riavvio
+        # o un crash un comando non viene mai rieseguito (at-most-once)
+        if rows:
+            self.last_id = rows[-1]["id"]
+            self.offsets.commit(CONSUMER_NAME, self.last_id)
 
         for row in rows:
-            self.last_id = row["id"]
             self.process_message(row)
 
-        self.after(POLL_INTERVAL * 1000, self.poll_messages)
-
     # ---------------- MESSAGE PROCESS ----------------
 
     def process_message(self, row):
@@ -104,6 +129,10 @@ class MeshComCommandListener(tk.Tk):
         if dst != DST_GROUP:
             return
 
+        # eco delle nostre risposte: non sono comandi
+        if self.is_own_reply(msg):
+            return
+
         # 2) SRC autorizzato (PRIMO CALLSIGN)
         src_raw = row["src"]
         src_first = src_raw.split(",")[0].strip().upper()
@@ -128,16 +157,16 @@ class MeshComCommandListener(tk.Tk):
 
             if CMD_CASE_INSENSITIVE:
                 if cmd_key.upper() in msg.upper():
-                    self.execute_command(cmd, msg)
+                    self.execute_command(cmd, row)
                     return
             else:
                 if cmd_key in msg:
-                    self.execute_command(cmd, msg)
+                    self.execute_command(cmd, row)
                     return
 
     # ---------------- COMMAND EXEC ----------------
 
-    def execute_command(self, cmd, msg):
+    def execute_command(self, cmd, row):
         script = cmd["windows"] if IS_WINDOWS else cmd["unix"]
 
         #if not os.path.exists(script):
@@ -145,15 +174,69 @@ class MeshComCommandListener(tk.Tk):
         #    return
 
         self.log(f"COMANDO RICEVUTO: {cmd['command']}")
-        self.log(f"Esecuzione script: {script}")
+
+        msg_id = row["msg_id"] if "msg_id" in row.keys() else None
+        msg_id = msg_id or f"id:{row['id']}"
+        accepted, reason = self.executor.submit(cmd, script, msg_id)
+
+        if accepted:
+            self.log(f"Esecuzione script: {script}")
+        else:
+            self.log(f"Comando scartato ({reason}): {cmd['command']}")
+
+    def poll_results(self):
+        for res in self.executor.poll_results():
+            if res["error"]:
+                self.log(f"Errore esecuzione {res['command']}: {res['error']}")
+                continue
+
+            status = "TIMEOUT (terminato)" if res["timed_out"] else f"exit {res['returncode']}"
+            self.log(f"Fine {res['command']}: {status} in {res['duration']:.1f}s")
+            for line in res["output"].strip().splitlines()[-10:]:
+                self.log(f"  | {line}")
+
+            if self.reply_enabled(res["command"]):
+                self.send_reply(res, status)
+
+        self.after(RESULTS_POLL_MS, self.poll_results)
+
+    # ---------------- REPLY ----------------
+
+    def reply_enabled(self, command):
+        for cmd in COMMANDS:
+            if cmd["command"] == command:
+                return cmd.get("reply", REPLY_RESULTS)
+        return False
+
+    def send_reply(self, res, status):
+        lines = res["output"].strip().splitlines()
+        text = f"{REPLY_TAG} {status}"
+        if lines:
+            text += f" {lines[-1]}"
+        text = text[:150]
+
+        # stesso formato usato da mc_messages verso la porta UDP del logger
+        command = f"{UDP_PREFIX}{{{DST_GROUP}}}{text}"
+        self.sent_replies.append(text)
 
         try:
-            if IS_WINDOWS:
-                subprocess.Popen(script, shell=True)
-            else:
-                subprocess.Popen(["/bin/bash", script])
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.settimeout(3)
+            sock.sendto(command.encode("utf-8"), (SERVER_IP, SERVER_PORT))
+            sock.close()
+            self.log(f"Risposta inviata a {DST_GROUP}: {text}")
         except Exception as e:
-            self.log(f"Errore esecuzione: {e}")
+            self.log(f"Errore invio risposta: {e}")
+
+    def is_own_reply(self, msg):
+        """
+        Messaggio inviato da send_reply (il gateway può aggiungere in coda
+        l'id del messaggio, es. "{833")
+        """
+        msg = str(msg or "").strip()
+        if msg.startswith(REPLY_TAG):
+            return True
+        return any(msg.startswith(text) for text in self.sent_replies)
 
     # ---------------- UTILS ----------------
 
@@ -163,6 +246,20 @@ class MeshComCommandListener(tk.Tk):
         except Exception:
             return None
 
+# ---------------- APP ----------------
+
+class MeshComCommandListener(tk.Tk):
+    def __init__(self):
+        super().__init__()
+
+        self.title("MeshCom – Command Listener v0.12012026 by IK5XMK")
+        self.geometry("950x420")
+
+        self.hub = DataHub(DB_PATH)
+        self.view = ListenerView(self, self.hub)
+        self.view.pack(fill="both", expand=True)
+        self.hub.start(self, POLL_INTERVAL, max_skip=MAX_SKIP)
+
 # ---------------- MAIN ----------------
 
 if __name__ == "__main__":
@@ -0,0 +1,352 @@
+import heapq
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from mc_topology import parse_path
+
+# ---------------- CONFIG ----------------
+
+TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+# un nodo è perso se tace per FACTOR volte il suo intervallo abituale,
+# comunque non meno di MIN_TIMEOUT; finché l'intervallo non è noto si usa
+# DEFAULT_TIMEOUT
+FACTOR = 3.0
+MIN_TIMEOUT = 600
+MAX_TIMEOUT = 24 * 3600
+DEFAULT_TIMEOUT = 3600
+
+# media mobile esponenziale degli intervalli tra due ascolti; intervalli
+# più brevi di MIN_GAP (ripetizioni via relay) o più lunghi di MAX_GAP
+# (nodo spento) non la modificano
+EWMA_ALPHA = 0.2
+MIN_GAP = 10
+MAX_GAP = 6 * 3600
+
+WHEEL_TICK = 10
+WHEEL_SLOTS = 512
+
+# eventi scritti in node_events (anche dagli allarmi di mc_spatial)
+EVENT_LABELS = {
+    "lost": "⚠ Nodo perso",
+    "back": "✔ Nodo di nuovo attivo",
+    "enter": "⚑ Nodo entrato nell'area",
+    "leave": "⚑ Nodo uscito dall'area",
+    "near": "⚠ Nodi vicini",
+    "apart": "✔ Nodi di nuovo distanti",
+}
+
+# ---------------- EVENTI ----------------
+
+def frame_time(frame):
+    """
+    Ora di ricezione del frame (campo time scritto dal logger, anche per
+    i frame recuperati dal journal)
+    """
+    try:
+        return datetime.strptime(frame.get("time"), TIME_FORMAT).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def ensure_events_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS node_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            callsign TEXT,
+            event TEXT,
+            time TEXT,
+            detail TEXT
+        )
+    """)
+
+
+def record_event(conn, callsign, event, detail, now=None):
+    """
+    Aggiunge un evento a node_events (senza commit)
+    """
+    conn.execute(
+        "INSERT INTO node_events (callsign, event, time, detail) VALUES (?, ?, ?, ?)",
+        (callsign, event, datetime.fromtimestamp(now or time.time()).strftime(TIME_FORMAT), detail)
+    )
+
+# ---------------- TIMER WHEEL ----------------
+
+class TimerWheel:
+    """
+    Scadenze per chiave con costo O(1) per inserimento, spostamento e
+    cancellazione. Ogni slot copre 'tick' secondi; una scadenza oltre il
+    giro della ruota resta nel suo slot finché non arriva il giro giusto.
+    """
+
+    def __init__(self, tick=WHEEL_TICK, slots=WHEEL_SLOTS, now=None):
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.due = {}
+        self.current = int((time.time() if now is None else now) // tick)
+
+    def schedule(self, key, deadline):
+        self.cancel(key)
+        t = max(int(deadline // self.tick), self.current + 1)
+        self.due[key] = t
+        self.slots[t % len(self.slots)].add(key)
+
+    def cancel(self, key):
+        t = self.due.pop(key, None)
+        if t is not None:
+            self.slots[t % len(self.slots)].discard(key)
+
+    def advance(self, now=None):
+        """
+        Chiavi scadute fino a 'now' (ognuna una sola volta)
+        """
+        target = int((time.time() if now is None else now) // self.tick)
+        steps = min(target - self.current, len(self.slots))
+        expired = []
+
+        for t in range(self.current + 1, self.current + steps + 1):
+            slot = self.slots[t % len(self.slots)]
+            for key in [k for k in slot if self.due[k] <= target]:
+                slot.discard(key)
+                del self.due[key]
+                expired.append(key)
+
+        self.current = max(self.current, target)
+        return expired
+
+    def __len__(self):
+        return len(self.due)
+
+# ---------------- TRACKER (SINK DEL LOGGER) ----------------
+
+class LivenessTracker:
+    """
+    Ultimo ascolto di ogni nodo, intervallo abituale tra i suoi frame
+    (appreso) e stato "alive" / "lost", salvati in node_liveness. I
+    cambi di stato finiscono in node_events ("lost", "back").
+
+    Come sink di FrameProcessor non esegue commit; tick() va chiamato
+    dal ciclo del logger anche quando non arrivano frame e fa il commit
+    degli eventi di perdita che genera.
+    """
+
+    def __init__(self, conn, local_callsign, factor=FACTOR, min_timeout=MIN_TIMEOUT,
+                 default_timeout=DEFAULT_TIMEOUT):
+        self.conn = conn
+        self.local = local_callsign.strip().upper()
+        self.factor = factor
+        self.min_timeout = min_timeout
+        self.default_timeout = default_timeout
+
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS node_liveness (
+                callsign TEXT PRIMARY KEY,
+                last_heard REAL,
+                interval REAL,
+                state TEXT,
+                updated REAL
+            );
+        """)
+        ensure_events_table(self.conn)
+        self.conn.commit()
+
+        # callsign -> [ultimo ascolto, intervallo, stato]
+        self.nodes = {}
+        self.pending = []
+        now = time.time()
+        self.wheel = TimerWheel(now=now)
+
+        for cs, last, interval, state in self.conn.execute(
+            "SELECT callsign, last_heard, interval, state FROM node_liveness"
+        ):
+            self.nodes[cs] = [last, interval, state]
+            if state != "lost":
+                # il logger non ascoltava: si concede un intervallo intero
+                self.wheel.schedule(cs, now + self.timeout(interval))
+
+        # primo avvio su un database con frame già salvati: ultimo ascolto
+        # e intervalli si ricavano dalla storia invece di partire da zero
+        if not self.nodes:
+            self.rebuild(now)
+
+    def timeout(self, interval):
+        if not interval:
+            return self.default_timeout
+        return min(max(self.factor * interval, self.min_timeout), MAX_TIMEOUT)
+
+    def on_frame(self, frame_type, row_id, frame):
+        if frame_type not in ("msg", "pos", "tele"):
+            return
+        path = parse_path(frame.get("src"))
+        if path and path[0] != self.local:
+            self.heard(path[0], frame_time(frame))
+
+    def heard(self, callsign, now):
+        node, gap = self._learn(callsign, now)
+
+        if node[2] == "lost":
+            node[2] = "alive"
+            detail = f"silenzioso per {int(gap // 60)} min"
+            record_event(self.conn, callsign, "back", detail, now)
+            self.pending.append((callsign, "back", detail))
+
+        self._save(callsign, now)
+        self.wheel.schedule(callsign, now + self.timeout(node[1]))
+
+    def _learn(self, callsign, now):
+        """
+        Aggiorna ultimo ascolto e intervallo abituale; ritorna (nodo,
+        silenzio appena terminato in secondi, None per un nodo nuovo)
+        """
+        node = self.nodes.get(callsign)
+        if node is None:
+            node = self.nodes[callsign] = [now, None, "alive"]
+            return node, None
+
+        last, interval, _ = node
+        gap = now - last
+        if MIN_GAP <= gap <= MAX_GAP:
+            node[1] = gap if interval is None else interval + EWMA_ALPHA * (gap - interval)
+        node[0] = now
+        return node, gap
+
+    def rebuild(self, now=None):
+        """
+        Ricalcola ultimo ascolto, intervallo e stato di ogni nodo dai
+        frame già salvati (msg, pos e tele fusi in ordine di tempo), senza
+        scrivere eventi. Ritorna il numero di frame letti.
+        """
+        now = now or time.time()
+        self.conn.execute("DELETE FROM node_liveness")
+        self.nodes = {}
+        self.pending = []
+        self.wheel = TimerWheel(now=now)
+
+        count = 0
+        for t, src in heapq.merge(*(self._heard_rows(table) for table in ("msg", "pos", "tele"))):
+            path = parse_path(src)
+            if path and path[0] != self.local:
+                self._learn(path[0], t)
+            count += 1
+
+        for cs, node in self.nodes.items():
+            deadline = node[0] + self.timeout(node[1])
+            if deadline <= now:
+                node[2] = "lost"
+            else:
+                self.wheel.schedule(cs, deadline)
+            self._save(cs, now)
+
+        self.conn.commit()
+        return count
+
+    def _heard_rows(self, table):
+        """
+        (ora di ricezione, src) delle righe di una tabella in ordine di id
+        """
+        try:
+            cur = self.conn.execute(f"SELECT time, src FROM {table} ORDER BY id ASC")
+        except sqlite3.OperationalError:
+            return
+
+        for t, src in cur:
+            try:
+                yield datetime.strptime(t, TIME_FORMAT).timestamp(), src or ""
+            except (TypeError, ValueError):
+                continue
+
+    def tick(self, now=None):
+        """
+        Controlla le scadenze; ritorna gli eventi (callsign, evento,
+        dettaglio) generati dall'ultima chiamata, compresi i "back"
+        """
+        now = now or time.time()
+        events, self.pending = self.pending, []
+        lost = 0
+
+        for cs in self.wheel.advance(now):
+            node = self.nodes.get(cs)
+            if not node or node[2] == "lost":
+                continue
+
+            node[2] = "lost"
+            detail = f"nessun frame da {int((now - node[0]) // 60)} min"
+            if node[1]:
+                detail += f" (intervallo abituale {int(node[1] // 60)} min)"
+            self._save(cs, now)
+            record_event(self.conn, cs, "lost", detail, now)
+            events.append((cs, "lost", detail))
+            lost += 1
+
+        if lost:
+            self.conn.commit()
+        return events
+
+    # ---------------- DATABASE ----------------
+
+    def _save(self, callsign, now):
+        last, interval, state = self.nodes[callsign]
+        self.conn.execute("""
+            INSERT OR REPLACE INTO node_liveness (callsign, last_heard, interval, state, updated)
+            VALUES (?, ?, ?, ?, ?)
+        """, (callsign, last, interval, state, now))
+
+# ---------------- LETTURA (VISTE) ----------------
+
+class LivenessState:
+    """
+    Nodi persi e nuovi eventi di node_events, per le viste
+    """
+
+    def __init__(self):
+        self.lost = set()
+        self.events = []
+        self.last_event_id = None
+        self.version = 0
+
+    def refresh(self, conn):
+        try:
+            if self.last_event_id is None:
+                # si parte dagli eventi futuri
+                self.last_event_id = conn.execute(
+                    "SELECT COALESCE(MAX(id), 0) FROM node_events"
+                ).fetchone()[0]
+
+            lost = {r[0] for r in conn.execute(
+                "SELECT callsign FROM node_liveness WHERE state = 'lost'"
+            )}
+            self.events = conn.execute("""
+                SELECT id, callsign, event, time, detail
+                FROM node_events
+                WHERE id > ?
+                ORDER BY id ASC
+            """, (self.last_event_id,)).fetchall()
+        except sqlite3.OperationalError:
+            return False
+
+        if self.events:
+            self.last_event_id = self.events[-1][0]
+
+        changed = lost != self.lost
+        self.lost = lost
+        if changed:
+            self.version += 1
+        return changed
+
+    def is_lost(self, callsign):
+        return callsign.split(",")[0].strip().upper() in self.lost
+
+# ---------------- MAIN ----------------
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3:
+        conn = sqlite3.connect(sys.argv[1])
+        tracker = LivenessTracker(conn, sys.argv[2])
+        count = tracker.rebuild()
+        conn.close()
+        lost = sum(1 for node in tracker.nodes.values() if node[2] == "lost")
+        print(f"Stato dei nodi ricostruito da {count} frame: {len(tracker.nodes)} nodi, {lost} persi")
+    else:
+        print("Uso: mc_liveness.py <database> <callsign del nodo locale>")
@@ -1,12 +1,24 @@
+import argparse
 import json
 import sqlite3
 import serial
 import os
 import socket
 import threading
+import time
 from datetime import datetime
 from typing import Dict, Any
 
+from mc_coverage import CoverageStore
+from mc_groups import GroupIndex
+from mc_journal import Journal, default_journal_dir, load_state, quarantine, read_records, save_state
+from mc_liveness import EVENT_LABELS, LivenessTracker
+from mc_snapshot import SnapshotWriter, default_snapshot_path
+from mc_spatial import ProximityAlerts
+from mc_stream import StreamServer
+from mc_telemetry import TelemetryStore
+from mc_topology import TopologyStore
+
 # --------------------------------------------------
 # CONFIG
 # --------------------------------------------------
@@ -14,6 +26,7 @@ from typing import Dict, Any
 CONFIG_FILE = "config.json"
 UDP_PORT = 1703
 UDP_PREFIX = "MSG_OUT:"
+JOURNAL_RETRY = 5
 
 
 def load_config() -> Dict[str, Any]:
@@ -21,12 +34,28 @@ def load_config() -> Dict[str, Any]:
         return json.load(f)
 
 
+def database_busy(error: Exception) -> bool:
+    """
+    True se il database è solo bloccato da un altro processo (si riprova
+    più tardi); False per gli errori che si ripeterebbero ad ogni
+    tentativo (SQL non valido, colonna con nome riservato, ...)
+    """
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None and (code & 0xFF) in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED):
+        return True
+    text = str(error).lower()
+    return "locked" in text or "busy" in text
+
+
 # --------------------------------------------------
 # TIME (formato italiano)
 # --------------------------------------------------
 
-def italian_timestamp() -> str:
-    return datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+def italian_timestamp(t: float = None) -> str:
+    now = datetime.now() if t is None else datetime.fromtimestamp(t)
+    return now.strftime("%d/%m/%Y %H:%M:%S")
 
 
 # --------------------------------------------------
@@ -59,7 +88,7 @@ class SQLiteHandler:
 
         self.conn.commit()
 
-    def insert(self, table: str, data: Dict[str, Any]):
+    def insert(self, table: str, data: Dict[str, Any], commit: bool = True) -> int:
         self.ensure_table(table, data)
 
         columns = ", ".join(data.keys())
@@ -67,8 +96,10 @@ class SQLiteHandler:
         values = [str(v) for v in data.values()]
 
         query = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
-        self.conn.execute(query, values)
-        self.conn.commit()
+        cur = self.conn.execute(query, values)
+        if commit:
+            self.conn.commit()
+        return cur.lastrowid
 
 
 # --------------------------------------------------
@@ -76,18 +107,50 @@ class SQLiteHandler:
 # --------------------------------------------------
 
 class FrameProcessor:
-    def __init__(self, db: SQLiteHandler, local_callsign: str):
+    """
+    Salva ogni frame nella sua tabella e lo passa ai "sink" (indici e
+    aggregati derivati), che scrivono sulla stessa connessione: frame e
+    dati derivati vengono confermati con un unico commit, insieme al seq
+    del journal (record) da cui proviene la riga.
+    """
+
+    def __init__(self, db: SQLiteHandler, local_callsign: str, sinks=()):
         self.db = db
         self.local_callsign = local_callsign
+        self.sinks = list(sinks)
 
-    def process(self, frame: Dict[str, Any]):
+    def process(self, frame: Dict[str, Any], received: float = None, record=None):
         frame_type = frame.get("type", "unknown")
 
         if "src" not in frame or not frame["src"]:
             frame["src"] = self.local_callsign
 
-        frame["time"] = italian_timestamp()
-        self.db.insert(frame_type, frame)
+        # l'ora è quella di ricezione (anche quando il frame arriva dal journal)
+        frame["time"] = italian_timestamp(received)
+
+        try:
+            row_id = self.db.insert(frame_type, frame, commit=False)
+
+            for sink in self.sinks:
+                # un sink che fallisce annulla solo le proprie scritture
+                self.db.conn.execute("SAVEPOINT sink")
+                try:
+                    sink.on_frame(frame_type, row_id, frame)
+                    self.db.conn.execute("RELEASE sink")
+                except Exception as e:
+                    self.db.conn.execute("ROLLBACK TO sink")
+                    self.db.conn.execute("RELEASE sink")
+                    print(f"❌ Errore {type(sink).__name__}:", e)
+
+            if record is not None:
+                save_state(self.db.conn, record)
+            self.db.conn.commit()
+        except Exception:
+            # niente di parziale resta in sospeso per il commit successivo
+            self.db.conn.rollback()
+            raise
+
+        return row_id
 
 
 # --------------------------------------------------
@@ -151,23 +214,221 @@ def udp_listener(serial_handler: SerialHandler):
                 print(f"➡ Inviato a MeshCom da UDP {addr}: {out_msg}")
 
 
+# --------------------------------------------------
+# PIPELINE
+# --------------------------------------------------
+
+def build_processor(db: SQLiteHandler, config: Dict[str, Any]):
+    """
+    FrameProcessor con tutti i sink; ritorna anche liveness e allarmi,
+    che il ciclo principale interroga
+    """
+    node_cfg = config["node"]
+
+    live_cfg = config.get("liveness", {})
+    liveness = LivenessTracker(
+        db.conn,
+        node_cfg["callsign"],
+        live_cfg.get("factor", 3.0),
+        live_cfg.get("min_timeout", 600),
+        live_cfg.get("default_timeout", 3600)
+    )
+    alert_cfg = config.get("alerts", {})
+    alerts = ProximityAlerts(
+        db.conn,
+        node_cfg["callsign"],
+        alert_cfg.get("geofences", []),
+        alert_cfg.get("proximity_km", 0),
+        alert_cfg.get("proximity_callsigns", [])
+    )
+    sinks = [
+        TelemetryStore(db.conn),
+        TopologyStore(db.conn, node_cfg["callsign"]),
+        CoverageStore(db.conn, node_cfg["callsign"]),
+        GroupIndex(db.conn),
+        liveness,
+        alerts,
+    ]
+    return FrameProcessor(db, node_cfg["callsign"], sinks), liveness, alerts
+
+
+def publish_frame(frame: Dict[str, Any], row_id: int, snapshot, stream, alerts):
+    """
+    Dopo il salvataggio: snapshot, stream live, riga a console e allarmi
+    generati dal frame (frame live e frame recuperati dal journal)
+    """
+    frame_type = frame.get("type")
+
+    if snapshot:
+        snapshot.update(frame_type, row_id, frame)
+    if stream:
+        stream.publish(frame_type or "unknown", row_id, frame)
+    src = frame.get("src", "?")
+
+    # output base
+    out = f"✔ Frame acquisito: {frame_type[0:3]}"
+
+    # messaggio testuale
+    if frame_type == "msg":
+        msg = frame.get("msg") or frame.get("text") or frame.get("message", "")
+        dst = frame.get("dst", "?")
+        dst = dst.split(",")[-1].strip() # VIA patch
+        out += f" | DST: {dst} | DA: {src} | TESTO: {msg}"
+
+    # posizione
+    elif frame_type == "pos":
+        lat = frame.get("lat", "?")
+        lat_dir = frame.get("lat_dir", "?")
+        long = frame.get("long", "?")
+        long_dir = frame.get("long_dir", "?")
+        out += f" | NODO: {src} | LAT: {lat} {lat_dir} | LON: {long} {long_dir}"
+
+    # telemetria
+    elif frame_type == "tele":
+        out += " | " + " | ".join(
+            f"{k.upper()}: {v}"
+            for k, v in frame.items()
+            if k not in ("type", "time")
+        )
+
+    print(out)
+
+    # allarmi di area / prossimità generati da questo frame
+    for cs, event, detail in alerts.drain():
+        print(f"{EVENT_LABELS.get(event, event)}: {cs} | {detail}")
+
+
+# --------------------------------------------------
+# JOURNAL
+# --------------------------------------------------
+
+def journal_dir(config: Dict[str, Any], db_path: str) -> str:
+    return default_journal_dir(db_path, config.get("journal", {}).get("dir", "journal"))
+
+
+def open_journal(config: Dict[str, Any], db_path: str, conn: sqlite3.Connection):
+    """
+    Journal delle righe seriali (None se disattivato); la numerazione
+    riprende dopo l'ultimo seq confermato nel database
+    """
+    journal_cfg = config.get("journal", {})
+    if not journal_cfg.get("enabled", True):
+        return None
+
+    committed = load_state(conn)[0]
+    conn.commit()
+    return Journal(
+        journal_dir(config, db_path),
+        int(journal_cfg.get("segment_mb", 16) * 1024 * 1024),
+        journal_cfg.get("sync_ms", 500) / 1000,
+        committed
+    )
+
+
+def replay_journal(processor: FrameProcessor, directory: str, progress: int = 0, on_frame=None):
+    """
+    Salva nel database le righe del journal successive all'ultimo seq
+    confermato. Ritorna (frame salvati, completato?): si ferma se il
+    database è bloccato, per riprovare più tardi; un record rifiutato per
+    altri motivi va in quarantena (mc_journal.quarantine) e il recupero
+    prosegue. on_frame(frame, row_id) viene chiamata per ogni frame salvato.
+    """
+    seq, segment, offset = load_state(processor.db.conn)
+    count = 0
+
+    for record in read_records(directory, seq, segment, offset):
+        frame = extract_json(record.line)
+        if frame is None:
+            continue
+        try:
+            row_id = processor.process(frame, record.received, record)
+        except Exception as e:
+            if database_busy(e):
+                print(f"❌ Database non disponibile, recupero dal journal sospeso: {e}")
+                return count, False
+            print(f"❌ Errore frame {record.seq} del journal, messo in quarantena:", e)
+            quarantine(processor.db.conn, directory, record, e)
+            continue
+
+        count += 1
+        if on_frame:
+            try:
+                on_frame(frame, row_id)
+            except Exception as e:
+                print(f"❌ Errore frame {record.seq} del journal:", e)
+        if progress and count % progress == 0:
+            print(f"↺ {count} frame recuperati (seq {record.seq})")
+
+    return count, True
+
+
+def rebuild_database(config: Dict[str, Any], db_path: str, target: str):
+    """
+    Nuovo database (tabelle dei frame e tutti gli indici derivati)
+    ricostruito da tutte le righe del journal
+    """
+    if os.path.exists(target):
+        print(f"❌ {target} esiste già: indicare un file nuovo")
+        return
+
+    db = SQLiteHandler(target)
+    # il database si può sempre ricostruire: niente fsync ad ogni frame
+    db.conn.execute("PRAGMA synchronous = OFF")
+    processor, _, _ = build_processor(db, config)
+
+    start = time.time()
+    count, _ = replay_journal(processor, journal_dir(config, db_path), progress=10000)
+    db.conn.close()
+    print(f"✔ {target} ricostruito da {count} frame in {time.time() - start:.1f} s")
+
+
 # --------------------------------------------------
 # MAIN
 # --------------------------------------------------
 
 def main():
+    parser = argparse.ArgumentParser(description="MeshCom serial logger")
+    parser.add_argument("--rebuild", metavar="DB",
+                        help="crea un nuovo database dal journal ed esce")
+    args = parser.parse_args()
+
     config = load_config()
 
     serial_cfg = config["serial"]
     db_cfg = config["database"]
-    node_cfg = config["node"]
 
     db_path = db_cfg["path"]
     if not os.path.isabs(db_path):
         db_path = os.path.join(os.getcwd(), db_path)
 
+    if args.rebuild:
+        rebuild_database(config, db_path, args.rebuild)
+        return
+
     db = SQLiteHandler(db_path)
-    processor = FrameProcessor(db, node_cfg["callsign"])
+    processor, liveness, alerts = build_processor(db, config)
+
+    # righe ricevute ma non ancora nel database (crash, database bloccato)
+    journal = open_journal(config, db_path, db.conn)
+    keep_segments = config.get("journal", {}).get("keep_segments", 0)
+    replay_pending = False
+    retry_at = 0.0
+    if journal:
+        count, done = replay_journal(processor, journal.directory)
+        if count:
+            print(f"↺ Recuperati {count} frame dal journal")
+        replay_pending = not done
+        alerts.drain()
+
+    # stato corrente dei nodi in memoria condivisa per le viste
+    snapshot = None
+    snapshot_cfg = config.get("snapshot", {})
+    if snapshot_cfg.get("enabled", True):
+        snapshot = SnapshotWriter(
+            default_snapshot_path(db_path),
+            snapshot_cfg.get("capacity", 1024)
+        )
+        snapshot.load(db.conn)
 
     serial_handler = SerialHandler(
         serial_cfg["port"],
@@ -175,6 +436,19 @@ def main():
         serial_cfg.get("timeout", 1)
     )
 
+    # Server di streaming live (TCP, JSON per riga)
+    stream = None
+    stream_cfg = config.get("stream", {})
+    if stream_cfg.get("enabled", False):
+        stream = StreamServer(
+            stream_cfg.get("host", "0.0.0.0"),
+            stream_cfg.get("port", 1704),
+            db_path,
+            stream_cfg.get("client_buffer", 1000),
+            stream_cfg.get("history", 5000)
+        ).start()
+        print(f"📡 Stream live attivo su porta {stream.port}")
+
     # Thread UDP
     udp_thread = threading.Thread(
         target=udp_listener,
@@ -187,6 +461,41 @@ def main():
 
     while True:
         line = serial_handler.read_line()
+        received = time.time()
+
+        # scadenze dei nodi controllate anche in assenza di frame; non
+        # mentre i frame restano in attesa nel journal, altrimenti i nodi
+        # ascoltati nel frattempo risulterebbero persi
+        events = liveness.tick() if not replay_pending else []
+        for cs, event, detail in events:
+            if event == "lost":
+                print(f"⚠ Nodo perso: {cs} | {detail}")
+            else:
+                print(f"✔ Nodo di nuovo attivo: {cs} | {detail}")
+            if snapshot:
+                snapshot.set_lost(cs, event == "lost")
+
+        record = None
+        if journal:
+            # la riga va su disco prima di qualsiasi elaborazione
+            if line:
+                record = journal.append(line, received)
+            journal.maybe_sync()
+
+            if replay_pending:
+                # il database era bloccato: le righe arrivate nel frattempo
+                # sono nel journal e si salvano in ordine da lì
+                if received >= retry_at:
+                    count, done = replay_journal(
+                        processor, journal.directory,
+                        on_frame=lambda f, row_id: publish_frame(f, row_id, snapshot, stream, alerts)
+                    )
+                    if count:
+                        print(f"↺ Recuperati {count} frame dal journal")
+                    replay_pending = not done
+                    retry_at = received + JOURNAL_RETRY
+                continue
+
         if not line:
             continue
 
@@ -195,39 +504,26 @@ def main():
             continue
 
         try:
-            processor.process(frame)
-
-            frame_type = frame.get("type")
-            src = frame.get("src", "?")
-
-            # output base
-            out = f"✔ Frame acquisito: {frame_type[0:3]}"
-
-            # messaggio testuale
-            if frame_type == "msg":
-                msg = frame.get("msg") or frame.get("text") or frame.get("message", "")
-                dst = frame.get("dst", "?")
-                dst = dst.split(",")[-1].strip() # VIA patch
-                out += f" | DST: {dst} | DA: {src} | TESTO: {msg}"
-
-            # posizione
-            elif frame_type == "pos":
-                lat = frame.get("lat", "?")
-                lat_dir = frame.get("lat_dir", "?")
-                long = frame.get("long", "?")
-                long_dir = frame.get("long_dir", "?")
-                out += f" | NODO: {src} | LAT: {lat} {lat_dir} | LON: {long} {long_dir}"
-
-            # telemetria
-            elif frame_type == "tele":
-                out += " | " + " | ".join(
-                    f"{k.upper()}: {v}"
-                    for k, v in frame.items()
-                    if k not in ("type", "time")
-                )
-    
-            print(out)
+            row_id = processor.process(frame, received, record)
+        except Exception as e:
+            if database_busy(e):
+                print("❌ Database non disponibile:", e)
+                if journal:
+                    print("↺ Il frame resta nel journal e sarà salvato appena possibile")
+                    replay_pending = True
+                    retry_at = received + JOURNAL_RETRY
+            else:
+                # errore che si ripeterebbe ad ogni tentativo: il frame
+                # si scarta (in quarantena se c'è il journal)
+                print("❌ Errore processamento frame:", e)
+                if journal:
+                    quarantine(db.conn, journal.directory, record, e)
+            continue
 
+        try:
+            if journal:
+                journal.prune(record.seq, keep_segments)
+            publish_frame(frame, row_id, snapshot, stream, alerts)
         except Exception as e:
             print("❌ Errore processamento frame:", e)
 
@@ -1,11 +1,16 @@
 import tkinter as tk
 from tkinter import ttk
 import tkintermapview
-import sqlite3
-import math
 import json
+import math
 from datetime import datetime
 
+from mc_coverage import cell_bounds
+from mc_data import SNAPSHOT_MAX_SKIP, DataHub, snapshot_positions
+from mc_geo import GridIndex, bounds_of, cluster_points, zoom_for_span
+from mc_tilecache import start_tile_proxy
+from mc_tracks import TrackCache
+
 # ---------------- CONFIG ----------------
 
 CONFIG_FILE = "config_map.json"
@@ -16,6 +21,25 @@ with open(CONFIG_FILE, "r", encoding="utf-8") as f:
 DB_PATH = CONFIG.get("DB_PATH", "meshcom.db")
 POLL_INTERVAL = int(CONFIG.get("POLL_INTERVAL", 10))
 RADIUS_KM = float(CONFIG.get("RADIUS_KM", 20))
+CLUSTER_RADIUS_PX = int(CONFIG.get("CLUSTER_RADIUS_PX", 60))
+CLUSTER_MAX_ZOOM = int(CONFIG.get("CLUSTER_MAX_ZOOM", 14))
+VIEWPORT_MARGIN = float(CONFIG.get("VIEWPORT_MARGIN", 0.25))
+SHOW_TRACKS = bool(CONFIG.get("SHOW_TRACKS", True))
+TRACK_HOURS = float(CONFIG.get("TRACK_HOURS", 24))
+TRACK_MIN_DIST_M = float(CONFIG.get("TRACK_MIN_DIST_M", 30))
+TRACK_TOLERANCE_M = float(CONFIG.get("TRACK_TOLERANCE_M", 25))
+SHOW_TOPOLOGY = bool(CONFIG.get("SHOW_TOPOLOGY", True))
+SHOW_LIVENESS = bool(CONFIG.get("SHOW_LIVENESS", True))
+SHOW_COVERAGE = bool(CONFIG.get("SHOW_COVERAGE", False))
+COVERAGE_MODE = CONFIG.get("COVERAGE_MODE", "hits")
+COVERAGE_MIN_PX = int(CONFIG.get("COVERAGE_MIN_PX", 8))
+COVERAGE_MAX_CELLS = int(CONFIG.get("COVERAGE_MAX_CELLS", 1500))
+# i poligoni di tkintermapview non hanno trasparenza (il retino funziona
+# solo su X11): di default le celle sono solo bordate, per non coprire
+# tile e marker
+COVERAGE_FILL = bool(CONFIG.get("COVERAGE_FILL", False))
+MAX_SKIP = int(CONFIG.get("SNAPSHOT_MAX_SKIP", SNAPSHOT_MAX_SKIP))
+REDRAW_DELAY_MS = 300
 
 # ---------------- UTILS ----------------
 
@@ -30,72 +54,104 @@ def convert_coord(value, direction):
     return value
 
 
-def calculate_zoom(radius_km):
-    if radius_km <= 5:
-        return 12
-    elif radius_km <= 10:
-        return 11
-    elif radius_km <= 20:
-        return 10
-    elif radius_km <= 50:
-        return 9
-    return 8
-
-
-def load_latest_positions():
-    """
-    Ritorna una LISTA ordinata dal più recente al più vecchio
+def calculate_zoom(radius_km, lat, pixels):
     """
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    query = """
-        SELECT src, time, lat, lat_dir, long, long_dir
-        FROM pos
-        WHERE lat IS NOT NULL AND long IS NOT NULL
-        ORDER BY rowid DESC
+    Zoom al quale un cerchio di raggio radius_km entra nella mappa
     """
+    return zoom_for_span(2 * radius_km, lat, pixels)
 
-    cur.execute(query)
 
+def nodes_from_rows(rows):
+    """
+    Ultima posizione valida per callsign da righe di pos in ordine di id
+    decrescente. Ritorna una LISTA ordinata dal più recente al più vecchio
+    """
     seen = set()
     nodes = []
 
-    for src, time, lat, lat_dir, lon, lon_dir in cur.fetchall():
-        callsign = normalize_src(src)
+    for r in rows:
+        if r["lat"] is None or r["long"] is None:
+            continue
+
+        callsign = normalize_src(r["src"])
 
         if callsign in seen:
             continue
 
         try:
-            ts = datetime.strptime(time, "%d/%m/%Y %H:%M:%S")
-        except ValueError:
+            ts = datetime.strptime(r["time"], "%d/%m/%Y %H:%M:%S")
+            lat = convert_coord(r["lat"], r["lat_dir"])
+            lon = convert_coord(r["long"], r["long_dir"])
+        except (TypeError, ValueError):
             continue
 
         seen.add(callsign)
 
         nodes.append({
             "callsign": callsign,
-            "lat": convert_coord(lat, lat_dir),
-            "lon": convert_coord(lon, lon_dir),
-            "time": time,
+            "lat": lat,
+            "lon": lon,
+            "time": r["time"],
             "ts": ts
         })
 
-    conn.close()
     return nodes
 
+
+HEAT_COLORS = ["#fff176", "#ffca28", "#ff9800", "#f4511e", "#b71c1c"]
+HOP_COLORS = ["#2e7d32", "#9ccc65", "#ffca28", "#ff7043", "#b71c1c"]
+
+
+def heat_color(counters, mode=COVERAGE_MODE):
+    """
+    Colore di una cella: per numero di ascolti (scala logaritmica) oppure,
+    con mode "hops", per numero minimo di relay (verde = ascolto diretto)
+    """
+    hits, direct, hop_sum, min_hops = counters
+    if mode == "hops":
+        return HOP_COLORS[min(min_hops, len(HOP_COLORS) - 1)]
+    level = int(math.log10(max(hits, 1)) * 2)
+    return HEAT_COLORS[min(level, len(HEAT_COLORS) - 1)]
+
 # ---------------- GUI ----------------
 
-class MapApp(tk.Tk):
-    def __init__(self):
-        super().__init__()
+class MapView(ttk.Frame):
 
-        self.title("MeshCom – Mappa nodi v0.100126 by IK5XMK")
-        self.geometry("1100x700")
+    def __init__(self, master, hub):
+        super().__init__(master)
+        self.hub = hub
 
         self.nodes = []
         self.nodes_by_cs = {}
+        self.index = GridIndex()
+
+        self.selected = None
+        self.markers = {}
+        self._redraw_job = None
+
+        self.tracks = None
+        self.paths = {}
+        self.link_paths = {}
+        self.coverage = None
+        self.heat_cells = {}
+        self.lost = set()
+        self.wants = ["positions", "snapshot"]
+        if SHOW_TRACKS:
+            self.tracks = TrackCache(hub.db_path, TRACK_HOURS, TRACK_MIN_DIST_M, TRACK_TOLERANCE_M)
+            # tracce iniziali con una query limitata a TRACK_HOURS; il
+            # DataHub passa poi solo le righe successive (quelle lette due
+            # volte vengono scartate da TrackCache)
+            self.wants.append("pos_rows")
+            self.pos_start_id = hub.max_id("pos")
+            self.tracks_pending = self.tracks.update()
+        if SHOW_TOPOLOGY:
+            self.wants.append("topology")
+        if SHOW_COVERAGE:
+            self.wants.append("coverage")
+        if SHOW_LIVENESS:
+            self.wants.append("liveness")
+
+        self._initial = True
 
         # ---- Layout ----
         main = ttk.Frame(self)
@@ -115,6 +171,16 @@ class MapApp(tk.Tk):
 
         self.listbox.bind("<<ListboxSelect>>", self.on_select)
 
+        ttk.Button(left, text="Mostra tutti", command=self.fit_to_nodes).pack(pady=5)
+
+        # strato di copertura attivabile senza riavviare
+        self.show_coverage = tk.BooleanVar(value=SHOW_COVERAGE)
+        if SHOW_COVERAGE:
+            ttk.Checkbutton(
+                left, text="Copertura", variable=self.show_coverage,
+                command=self.toggle_coverage
+            ).pack(pady=5)
+
         # ---- Mappa ----
         self.map_widget = tkintermapview.TkinterMapView(
             right,
@@ -122,21 +188,38 @@ class MapApp(tk.Tk):
         )
         self.map_widget.pack(fill="both", expand=True)
 
-        self.marker = None
+        # tile servite dalla cache locale (offline se OFFLINE_MODE)
+        self.tile_proxy = start_tile_proxy(CONFIG)
+        if self.tile_proxy:
+            self.map_widget.set_tile_server(self.tile_proxy.url_template)
+
+        # ridisegno dei marker quando cambia la porzione visibile
+        canvas = self.map_widget.canvas
+        for seq in ("<ButtonRelease-1>", "<MouseWheel>", "<Button-4>", "<Button-5>"):
+            canvas.bind(seq, self.schedule_redraw, add="+")
+        self.map_widget.bind("<Configure>", self.schedule_redraw, add="+")
 
-        # primo caricamento
-        self.refresh_nodes(initial=True)
+        hub.register(self)
 
     # ---------------- REFRESH ----------------
 
-    def refresh_nodes(self, initial=False):
+    def on_refresh(self, data):
         previous_selection = None
         if self.listbox.curselection():
             previous_selection = self.listbox.get(self.listbox.curselection())
 
-        self.nodes = load_latest_positions()
+        # stato corrente dallo snapshot del logger, dal database solo
+        # se il logger non lo pubblica
+        if data.snapshot is not None:
+            self.nodes = nodes_from_rows(snapshot_positions(data.snapshot))
+        else:
+            self.nodes = nodes_from_rows(data.positions)
         self.nodes_by_cs = {n["callsign"]: n for n in self.nodes}
 
+        self.index.clear()
+        for n in self.nodes:
+            self.index.insert(n["callsign"], n["lat"], n["lon"])
+
         self.listbox.delete(0, "end")
         for n in self.nodes:
             self.listbox.insert("end", n["callsign"])
@@ -144,14 +227,24 @@ class MapApp(tk.Tk):
         if previous_selection and previous_selection in self.nodes_by_cs:
             idx = list(self.nodes_by_cs.keys()).index(previous_selection)
             self.listbox.selection_set(idx)
-        elif self.nodes:
-            self.listbox.selection_set(0)
 
-        if initial or self.listbox.curselection():
-            self.on_select()
+        if self.tracks:
+            self.update_tracks(data.pos_rows)
+
+        if data.topology:
+            self.update_links(data.topology)
 
-        # pianifica prossimo refresh
-        self.after(POLL_INTERVAL * 1000, self.refresh_nodes)
+        if data.coverage:
+            self.coverage = data.coverage
+
+        if data.liveness:
+            self.lost = {cs for cs in self.nodes_by_cs if data.liveness.is_lost(cs)}
+
+        if self._initial and self.nodes:
+            self._initial = False
+            self.fit_to_nodes()
+        else:
+            self.redraw_markers()
 
     # ---------------- EVENT ----------------
 
@@ -165,26 +258,283 @@ class MapApp(tk.Tk):
         if not node:
             return
 
-        lat = node["lat"]
-        lon = node["lon"]
-        time = node["time"]
+        self.selected = callsign
+
+        pixels = min(self.map_widget.winfo_width(), self.map_widget.winfo_height())
+        self.map_widget.set_zoom(calculate_zoom(RADIUS_KM, node["lat"], max(pixels, 200)))
+        self.map_widget.set_position(node["lat"], node["lon"])
 
-        self.map_widget.set_position(lat, lon)
-        self.map_widget.set_zoom(calculate_zoom(RADIUS_KM))
+        self.redraw_markers()
 
-        if self.marker:
-            self.marker.delete()
+    def on_cluster_click(self, marker):
+        points = [self.index.position(cs) for cs in marker.data]
+        self.fit_bounds([p for p in points if p])
+
+    # ---------------- VIEWPORT ----------------
+
+    def fit_to_nodes(self):
+        self.fit_bounds([(n["lat"], n["lon"]) for n in self.nodes])
+
+    def fit_bounds(self, points):
+        bounds = bounds_of(points)
+        if not bounds:
+            return
+
+        min_lat, min_lon, max_lat, max_lon = bounds
+        self.map_widget.fit_bounding_box((max_lat, min_lon), (min_lat, max_lon))
+        # fit_bounding_box agisce in differita
+        self.schedule_redraw()
+
+    def visible_area(self):
+        """
+        Rettangolo visibile (min_lat, min_lon, max_lat, max_lon) allargato
+        di VIEWPORT_MARGIN per non far "comparire" i marker ai bordi
+        """
+        w = self.map_widget.canvas.winfo_width()
+        h = self.map_widget.canvas.winfo_height()
+        if w <= 1 or h <= 1:
+            return None
+
+        top, left = self.map_widget.convert_canvas_coords_to_decimal_coords(0, 0)
+        bottom, right = self.map_widget.convert_canvas_coords_to_decimal_coords(w, h)
+
+        dlat = (top - bottom) * VIEWPORT_MARGIN
+        dlon = (right - left) * VIEWPORT_MARGIN
+        return bottom - dlat, left - dlon, top + dlat, right + dlon
+
+    def schedule_redraw(self, event=None):
+        if self._redraw_job:
+            self.after_cancel(self._redraw_job)
+        self._redraw_job = self.after(REDRAW_DELAY_MS, self.redraw_markers)
+
+    # ---------------- TRACCE ----------------
+
+    def update_tracks(self, rows):
+        # si ridisegnano solo le tracce che hanno ricevuto nuovi punti
+        changed = self.tracks.feed(rows) | self.tracks_pending
+        self.tracks_pending = set()
+        for callsign in changed:
+            points = self.tracks.path(callsign)
+            path = self.paths.get(callsign)
+
+            if len(points) < 2:
+                if path:
+                    path.delete()
+                    del self.paths[callsign]
+            elif path:
+                path.set_position_list(points)
+            else:
+                self.paths[callsign] = self.map_widget.set_path(
+                    points,
+                    color="#1565c0",
+                    width=2
+                )
+
+    # ---------------- TOPOLOGIA ----------------
+
+    def update_links(self, topology):
+        """
+        Collegamenti radio attivi tra nodi con posizione nota; spessore e
+        colore seguono il peso (che decade se il collegamento non si sente)
+        """
+        wanted = {}
+        for a, b, w in topology.active_links():
+            na = self.nodes_by_cs.get(a)
+            nb = self.nodes_by_cs.get(b)
+            if not na or not nb:
+                continue
+
+            key = tuple(sorted((a, b)))
+            wanted[key] = wanted.get(key, 0.0) + w
+
+        specs = {}
+        for key, w in wanted.items():
+            na, nb = self.nodes_by_cs[key[0]], self.nodes_by_cs[key[1]]
+            width = 1 if w < 2 else 2 if w < 10 else 3
+            color = "#9e9e9e" if w < 0.5 else "#7b1fa2"
+            specs[key] = (na["lat"], na["lon"], nb["lat"], nb["lon"], width, color)
+
+        for key in list(self.link_paths):
+            path, spec = self.link_paths[key]
+            if specs.get(key) != spec:
+                path.delete()
+                del self.link_paths[key]
+
+        for key, spec in specs.items():
+            if key in self.link_paths:
+                continue
+            lat1, lon1, lat2, lon2, width, color = spec
+            path = self.map_widget.set_path(
+                [(lat1, lon1), (lat2, lon2)],
+                color=color,
+                width=width
+            )
+            self.link_paths[key] = (path, spec)
+
+    # ---------------- COPERTURA ----------------
+
+    def update_coverage(self, area, zoom):
+        """
+        Heatmap delle celle di copertura visibili. Se a questo zoom una
+        cella sarebbe più piccola di COVERAGE_MIN_PX le celle vengono
+        aggregate a blocchi 2x2, 4x4, ...
+        """
+        grid = self.coverage
+        if grid is None or grid.cell_deg is None:
+            return
 
-        # marker = punto blu minimale
-        self.marker = self.map_widget.set_marker(
+        cell_px = grid.cell_deg / 360 * 256 * 2 ** zoom
+        factor = 1
+        while cell_px * factor < COVERAGE_MIN_PX:
+            factor *= 2
+
+        cells = grid.query(*area, factor=factor)
+        if len(cells) > COVERAGE_MAX_CELLS:
+            # si tengono le celle più ascoltate
+            top = sorted(cells.items(), key=lambda kv: -kv[1][0])[:COVERAGE_MAX_CELLS]
+            cells = dict(top)
+
+        specs = {(factor, cy, cx): heat_color(c) for (cy, cx), c in cells.items()}
+
+        for key in list(self.heat_cells):
+            polygon, color = self.heat_cells[key]
+            if specs.get(key) != color:
+                polygon.delete()
+                del self.heat_cells[key]
+
+        for key, color in specs.items():
+            if key in self.heat_cells:
+                continue
+            factor, cy, cx = key
+            min_lat, min_lon, max_lat, max_lon = cell_bounds(cy, cx, grid.cell_deg, factor)
+            polygon = self.map_widget.set_polygon(
+                [(min_lat, min_lon), (min_lat, max_lon), (max_lat, max_lon), (max_lat, min_lon)],
+                fill_color=color if COVERAGE_FILL else None,
+                outline_color=color,
+                border_width=1 if COVERAGE_FILL else 2
+            )
+            self.heat_cells[key] = (polygon, color)
+
+    def toggle_coverage(self):
+        if not self.show_coverage.get():
+            for polygon, _ in self.heat_cells.values():
+                polygon.delete()
+            self.heat_cells = {}
+        self.redraw_markers()
+
+    # ---------------- MARKER ----------------
+
+    def redraw_markers(self):
+        self._redraw_job = None
+
+        area = self.visible_area()
+        if area is None:
+            return
+
+        if self.coverage and self.show_coverage.get():
+            self.update_coverage(area, round(self.map_widget.zoom))
+
+        zoom = round(self.map_widget.zoom)
+        visible = [
+            (cs, *self.index.position(cs))
+            for cs in self.index.query_bbox(*area)
+            if cs != self.selected
+        ]
+
+        if zoom >= CLUSTER_MAX_ZOOM:
+            groups = [{"lat": lat, "lon": lon, "keys": [cs]} for cs, lat, lon in visible]
+        else:
+            groups = cluster_points(visible, zoom, CLUSTER_RADIUS_PX)
+
+        wanted = {}
+        for g in groups:
+            if len(g["keys"]) == 1:
+                cs = g["keys"][0]
+                kind = "l" if cs in self.lost else "n"
+                wanted[(kind, cs)] = (g["lat"], g["lon"], cs)
+            else:
+                key = ("c", tuple(sorted(g["keys"])))
+                wanted[key] = (g["lat"], g["lon"], f"{len(g['keys'])} nodi")
+
+        node = self.nodes_by_cs.get(self.selected)
+        if node:
+            wanted[("s", self.selected)] = (
+                node["lat"], node["lon"], f"{self.selected}\n{node['time']}"
+            )
+
+        # si cancellano/creano solo i marker effettivamente cambiati
+        for key in list(self.markers):
+            marker, spec = self.markers[key]
+            if wanted.get(key) != spec:
+                marker.delete()
+                del self.markers[key]
+
+        for key, spec in wanted.items():
+            if key not in self.markers:
+                self.markers[key] = (self.create_marker(key, spec), spec)
+
+    def create_marker(self, key, spec):
+        lat, lon, text = spec
+        kind = key[0]
+
+        if kind == "c":
+            # bolla di cluster, click = zoom sul gruppo
+            return self.map_widget.set_marker(
+                lat,
+                lon,
+                text=text,
+                marker_color_circle="white",
+                marker_color_outside="orange",
+                text_color="#b35900",
+                command=self.on_cluster_click,
+                data=key[1]
+            )
+
+        if kind == "s":
+            # marker = punto blu minimale
+            return self.map_widget.set_marker(
+                lat,
+                lon,
+                text=text,
+                marker_color_circle="blue",
+                marker_color_outside="blue",
+                text_color="black"
+            )
+
+        if kind == "l":
+            # nodo che non si sente da più del suo intervallo abituale
+            return self.map_widget.set_marker(
+                lat,
+                lon,
+                text=text,
+                marker_color_circle="#9e9e9e",
+                marker_color_outside="#c62828",
+                text_color="#7a1f1f"
+            )
+
+        return self.map_widget.set_marker(
             lat,
             lon,
-            text=f"{callsign}\n{time}",
-            marker_color_circle="blue",
-            marker_color_outside="blue",
-            text_color="black"
+            text=text,
+            marker_color_circle="#2e7d32",
+            marker_color_outside="#2e7d32",
+            text_color="#1b4d1f"
         )
 
+# ---------------- APP ----------------
+
+class MapApp(tk.Tk):
+    def __init__(self):
+        super().__init__()
+
+        self.title("MeshCom – Mappa nodi v0.100126 by IK5XMK")
+        self.geometry("1100x700")
+
+        self.hub = DataHub(DB_PATH)
+        self.view = MapView(self, self.hub)
+        self.view.pack(fill="both", expand=True)
+        self.hub.start(self, POLL_INTERVAL, max_skip=MAX_SKIP)
+
 # ---------------- MAIN ----------------
 
 if __name__ == "__main__":
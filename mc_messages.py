@@ -1,4 +1,3 @@
-import sqlite3
 import tkinter as tk
 from tkinter import ttk, messagebox
 import re
@@ -6,6 +5,10 @@ import socket
 import json
 import sys
 
+from mc_data import SNAPSHOT_MAX_SKIP, DataHub
+from mc_groups import fetch_page, group_of, group_overview, participants, unread_count
+from mc_offsets import ConsumerOffsets, START_MODES
+
 # ---------------- CONFIG (DA FILE JSON) ----------------
 
 CONFIG_FILE = "config_messages.json"
@@ -22,67 +25,166 @@ except json.JSONDecodeError as e:
 
 DB_PATH = config.get("DB_PATH", "meshcom.db")
 POLL_INTERVAL = config.get("POLL_INTERVAL", 10)
+MAX_SKIP = config.get("SNAPSHOT_MAX_SKIP", SNAPSHOT_MAX_SKIP)
 
 SERVER_IP = config.get("SERVER_IP", "127.0.0.1")
 SERVER_PORT = config.get("SERVER_PORT", 1703)
 UDP_PREFIX = config.get("UDP_PREFIX", "MSG_OUT:")
 
-# ---------------- APP ----------------
-
-class MeshcomViewer(tk.Tk):
-    def __init__(self):
-        super().__init__()
-        self.title("MeshCom – Messaggi v0.090126-b by IK5XMK")
-        self.geometry("1100x500")
+CONSUMER_NAME = config.get("CONSUMER_NAME", "mc_messages")
+START_FROM = config.get("START_FROM", "now")
+if START_FROM not in START_MODES:
+    START_FROM = "now"
+MAX_BACKLOG = config.get("MAX_BACKLOG", 500)
+PAGE_SIZE = config.get("PAGE_SIZE", 100)
+
+ALL_GROUPS = "__all__"
+
+# ---------------- DATABASE ----------------
+
+def fetch_last_record(conn, filter_sql="", params=()):
+    return conn.execute(f"""
+        SELECT id, time, src, dst, msg
+        FROM msg
+        WHERE 1=1 {filter_sql}
+        ORDER BY id DESC
+        LIMIT 1
+    """, list(params)).fetchone()
+
+
+def fetch_backlog(conn, last_id, filter_sql="", params=(), limit=MAX_BACKLOG):
+    """
+    Messaggi con id > last_id, al massimo 'limit' (i più recenti), in
+    ordine di id decrescente
+    """
+    return conn.execute(f"""
+        SELECT id, time, src, dst, msg
+        FROM msg
+        WHERE id > ? {filter_sql}
+        ORDER BY id DESC
+        LIMIT ?
+    """, [last_id] + list(params) + [limit]).fetchall()
+
+# ---------------- VISTA ----------------
+
+class MessagesView(tk.Frame):
+    """
+    Elenco dei messaggi con barra laterale dei gruppi (indice mc_groups
+    del logger): "Tutti" mostra l'elenco completo con il filtro DST, un
+    gruppo mostra la sua conversazione a pagine di PAGE_SIZE messaggi,
+    caricate scorrendo verso il basso.
+    """
+
+    wants = ("messages",)
+
+    def __init__(self, master, hub):
+        super().__init__(master)
+        self.hub = hub
 
         self.last_id = 0
+        self.flat_rows = []     # righe di "Tutti", dalla più vecchia
+        self.group = None       # gruppo mostrato (None = tutti)
+        self.oldest_id = None   # chiave della prossima pagina del gruppo
+        self.exhausted = False
+        self.page_pending = False
+        self.read_marks = {}    # gruppo -> ultimo id letto
+        self.start_mark = 0     # ultimo id all'avvio
 
         self._setup_ui()
         self._setup_db()
-        self.load_last_record()
-        self.poll_messages()
+        if START_FROM == "now":
+            self.load_last_record()
+        else:
+            self.load_backlog()
+        if START_FROM != "beginning":
+            self.start_mark = hub.max_id("msg")
+        self.refresh_groups()
+
+        # i nuovi messaggi arrivano dal ciclo di refresh del DataHub
+        self.msg_start_id = self.last_id
+        hub.register(self)
 
     # ---------------- UI ----------------
 
     def _setup_ui(self):
-        top = tk.Frame(self)
+        self._setup_groups()
+
+        main = tk.Frame(self)
+        main.pack(side="left", fill="both", expand=True)
+
+        top = tk.Frame(main)
         top.pack(fill="x", padx=5, pady=5)
 
         tk.Label(top, text="Filtro  (cifre o *):").pack(side="left")
         self.filter_entry = tk.Entry(top, width=10)
         self.filter_entry.pack(side="left", padx=5)
 
-        frame = tk.Frame(self)
+        self.write_button = ttk.Button(
+            top,
+            text="Scrivi al gruppo",
+            state="disabled",
+            command=lambda: self.open_send_window(self.group)
+        )
+        self.write_button.pack(side="right")
+
+        self.participants_label = tk.Label(top, text="", anchor="w")
+        self.participants_label.pack(side="left", fill="x", expand=True, padx=10)
+
+        frame = tk.Frame(main)
         frame.pack(fill="both", expand=True)
 
-        columns = ("time", "src", "", "msg")
+        columns = ("time", "src", "dst", "msg")
         self.tree = ttk.Treeview(frame, columns=columns, show="headings")
 
         self.tree.heading("time", text="TIME")
         self.tree.heading("src", text="SRC")
-        self.tree.heading("", text="")
+        self.tree.heading("dst", text="DST")
         self.tree.heading("msg", text="MSG")
 
         self.tree.column("time", width=160)
         self.tree.column("src", width=140)
-        self.tree.column("", width=120)
+        self.tree.column("dst", width=120)
         self.tree.column("msg", width=600)
 
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
 
         self.tree.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        self.scrollbar.pack(side="right", fill="y")
 
         self.tree.bind("<Button-1>", self.on_tree_click)
 
+    def _setup_groups(self):
+        side = tk.Frame(self)
+        side.pack(side="left", fill="y", padx=(5, 0), pady=5)
+
+        columns = ("unread", "recent", "nodes")
+        self.groups = ttk.Treeview(side, columns=columns, show="tree headings", selectmode="browse", height=20)
+
+        self.groups.heading("#0", text="GRUPPO")
+        self.groups.heading("unread", text="NUOVI")
+        self.groups.heading("recent", text="24H")
+        self.groups.heading("nodes", text="NODI")
+
+        self.groups.column("#0", width=110)
+        self.groups.column("unread", width=55, anchor="e")
+        self.groups.column("recent", width=45, anchor="e")
+        self.groups.column("nodes", width=45, anchor="e")
+
+        self.groups.tag_configure("unread", font=("TkDefaultFont", 9, "bold"))
+        self.groups.insert("", "end", iid=ALL_GROUPS, text="Tutti", values=("", "", ""))
+        self.groups.selection_set(ALL_GROUPS)
+
+        self.groups.pack(fill="y", expand=True)
+        self.groups.bind("<<TreeviewSelect>>", self.on_group_select)
+
     # ---------------- DB ----------------
 
     def _setup_db(self):
-        self.conn = sqlite3.connect(DB_PATH)
-        self.conn.row_factory = sqlite3.Row
+        self.conn = self.hub.conn
+        self.offsets = ConsumerOffsets(self.conn)
 
-    def _build__filter(self):
+    def _build_dst_filter(self):
         pattern = self.filter_entry.get().strip()
 
         if not re.fullmatch(r"[\d*]{0,5}", pattern):
@@ -91,45 +193,168 @@ class MeshcomViewer(tk.Tk):
         if pattern == "" or pattern == "*":
             return "", []
 
-        return " AND  LIKE ? ", [pattern.replace("*", "%")]
+        return " AND dst LIKE ? ", [pattern.replace("*", "%")]
 
-    def load_last_record(self):
-        cur = self.conn.cursor()
-        filter_sql, params = self._build__filter()
-
-        sql = f"""
-            SELECT id, time, src, , msg
-            FROM msg
-            WHERE 1=1 {filter_sql}
-            ORDER BY id DESC
-            LIMIT 1
+    def _dst_matches(self, dst):
+        """
+        Stesso filtro di _build_dst_filter, applicato in memoria alle
+        righe ricevute dal DataHub
         """
+        pattern = self.filter_entry.get().strip()
+
+        if not re.fullmatch(r"[\d*]{0,5}", pattern):
+            return True
 
-        cur.execute(sql, params)
-        row = cur.fetchone()
+        if pattern == "" or pattern == "*":
+            return True
+
+        regex = "".join(".*" if c == "*" else re.escape(c) for c in pattern)
+        return re.fullmatch(regex, str(dst or "")) is not None
+
+    def load_last_record(self):
+        filter_sql, params = self._build_dst_filter()
+
+        row = fetch_last_record(self.conn, filter_sql, params)
         if row:
-            self.tree.insert("", 0, values=(row["time"], row["src"], row[""], row["msg"]))
+            self._add_flat(row)
             self.last_id = row["id"]
 
-    def poll_messages(self):
-        cur = self.conn.cursor()
-        filter_sql, params = self._build__filter()
-        params = [self.last_id] + params
+    def load_backlog(self):
+        """
+        Mostra i messaggi arrivati dopo l'ultimo visto nella sessione
+        precedente (al massimo MAX_BACKLOG, i più recenti)
+        """
+        self.last_id = self.offsets.start_id(CONSUMER_NAME, "msg", START_FROM)
+
+        filter_sql, params = self._build_dst_filter()
 
-        sql = f"""
-            SELECT id, time, src, , msg
-            FROM msg
-            WHERE id > ? {filter_sql}
-            ORDER BY id ASC
+        rows = fetch_backlog(self.conn, self.last_id, filter_sql, params)
+
+        for row in reversed(rows):
+            self._add_flat(row)
+
+        if rows:
+            self.last_id = rows[0]["id"]
+
+    def on_refresh(self, data):
+        rows = [r for r in data.messages if r["id"] > self.last_id]
+        if not rows:
+            return
+
+        for row in rows:
+            if self._dst_matches(row["dst"]):
+                self._add_flat(row)
+            if self.group is not None and group_of(row["dst"]) == self.group:
+                self.tree.insert("", 0, values=(row["time"], row["src"], row["dst"], row["msg"]))
+                self.mark_read(self.group, row["id"])
+
+        self.last_id = rows[-1]["id"]
+        self.offsets.commit(CONSUMER_NAME, self.last_id)
+        self.refresh_groups()
+
+    def _add_flat(self, row):
+        values = (row["time"], row["src"], row["dst"], row["msg"])
+        self.flat_rows.append(values)
+        if self.group is None:
+            self.tree.insert("", 0, values=values)
+
+    # ---------------- GRUPPI ----------------
+
+    def _read_mark(self, grp):
+        """
+        Ultimo id letto del gruppo; un gruppo mai visto è letto fino
+        all'avvio della finestra (tutto non letto con START_FROM
+        "beginning"): un gruppo nato mentre la finestra è aperta risulta
+        non letto
+        """
+        if grp not in self.read_marks:
+            mark = self.offsets.get(f"{CONSUMER_NAME}:{grp}")
+            if mark is None:
+                mark = self.start_mark
+                self.offsets.commit(f"{CONSUMER_NAME}:{grp}", mark)
+            self.read_marks[grp] = mark
+        return self.read_marks[grp]
+
+    def mark_read(self, grp, last_id):
+        if last_id > self.read_marks.get(grp, -1):
+            self.read_marks[grp] = last_id
+            self.offsets.commit(f"{CONSUMER_NAME}:{grp}", last_id)
+
+    def refresh_groups(self):
+        """
+        Contatori della barra laterale, dalle tabelle riassuntive del
+        logger (poche righe, nessuna scansione di msg)
         """
+        for index, row in enumerate(group_overview(self.conn), start=1):
+            grp = row["grp"]
+            mark = self._read_mark(grp)
+            if grp == self.group:
+                self.mark_read(grp, row["last_id"])
+                unread = 0
+            else:
+                unread = unread_count(self.conn, grp, mark) if row["last_id"] > mark else 0
+
+            iid = f"g:{grp}"
+            values = (unread or "", row["recent"] or "", row["nodes"])
+            tags = ("unread",) if unread else ()
+            if self.groups.exists(iid):
+                self.groups.item(iid, values=values, tags=tags)
+                self.groups.move(iid, "", index)
+            else:
+                self.groups.insert("", index, iid=iid, text=grp, values=values, tags=tags)
+
+    def on_group_select(self, event=None):
+        selected = self.groups.selection()
+        if not selected:
+            return
+        grp = None if selected[0] == ALL_GROUPS else self.groups.item(selected[0], "text")
+        if grp != self.group:
+            self.show_group(grp)
+
+    def show_group(self, grp):
+        self.group = grp
+        self.tree.delete(*self.tree.get_children())
+
+        if grp is None:
+            for values in reversed(self.flat_rows):
+                self.tree.insert("", "end", values=values)
+            self.participants_label.config(text="")
+            self.write_button.config(state="disabled")
+            return
 
-        cur.execute(sql, params)
+        self.oldest_id = None
+        self.exhausted = False
+        self.load_older()
 
-        for row in cur.fetchall():
-            self.tree.insert("", 0, values=(row["time"], row["src"], row[""], row["msg"]))
-            self.last_id = row["id"]
+        people = participants(self.conn, grp)
+        self.participants_label.config(
+            text="Partecipanti: " + ", ".join(f"{r['callsign']} ({r['count']})" for r in people)
+        )
+        self.write_button.config(state="normal")
+        self.refresh_groups()
 
-        self.after(POLL_INTERVAL * 1000, self.poll_messages)
+    def load_older(self):
+        """
+        Pagina successiva (messaggi più vecchi) del gruppo mostrato
+        """
+        self.page_pending = False
+        if self.group is None or self.exhausted:
+            return
+
+        rows = fetch_page(self.conn, self.group, self.oldest_id, PAGE_SIZE)
+        for row in rows:
+            self.tree.insert("", "end", values=(row["time"], row["src"], row["dst"], row["msg"]))
+
+        if rows:
+            self.oldest_id = rows[-1]["id"]
+        self.exhausted = len(rows) < PAGE_SIZE
+
+    def on_tree_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        # in fondo all'elenco: si carica la pagina successiva
+        if self.group is not None and not self.exhausted and not self.page_pending and float(last) >= 1.0:
+            self.page_pending = True
+            self.after_idle(self.load_older)
 
     # ---------------- CLICK DST ----------------
 
@@ -152,11 +377,12 @@ class MeshcomViewer(tk.Tk):
 
     def open_send_window(self, dst):
         win = tk.Toplevel(self)
+        top = self.winfo_toplevel()
         win.update_idletasks() # fix xrdp + tkinter bug, needs refresh
         win.lift()             #
         win.title(f"Invia messaggio a {dst}")
         win.geometry("400x180")
-        win.transient(self)
+        win.transient(top)
         win.grab_set()
 
         tk.Label(win, text=f"DST: {dst}").pack(pady=5)
@@ -201,6 +427,19 @@ class MeshcomViewer(tk.Tk):
             messagebox.showerror("Errore invio", str(e))
 
 
+# ---------------- APP ----------------
+
+class MeshcomViewer(tk.Tk):
+    def __init__(self):
+        super().__init__()
+        self.title("MeshCom – Messaggi v0.090126-b by IK5XMK")
+        self.geometry("1400x500")
+
+        self.hub = DataHub(DB_PATH)
+        self.view = MessagesView(self, self.hub)
+        self.view.pack(fill="both", expand=True)
+        self.hub.start(self, POLL_INTERVAL, max_skip=MAX_SKIP)
+
 # ---------------- MAIN ----------------
 
 if __name__ == "__main__":
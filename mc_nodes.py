@@ -6,6 +6,10 @@ import math
 import json
 import sys
 
+from mc_data import SNAPSHOT_MAX_SKIP, DataHub, snapshot_positions
+from mc_liveness import EVENT_LABELS
+from mc_spatial import GridNodeIndex
+
 # ---------------- CONFIG (DA FILE JSON) ----------------
 
 CONFIG_FILE = "config_nodes.json"
@@ -24,6 +28,7 @@ DB_PATH = config.get("DB_PATH", "meshcom.db")
 POLL_INTERVAL = config.get("POLL_INTERVAL", 10)
 MY_CALLSIGN = config.get("MY_CALLSIGN", "IK5XMK-98")
 SHOW_ONLY_TODAY = config.get("SHOW_ONLY_TODAY", True)
+MAX_SKIP = config.get("SNAPSHOT_MAX_SKIP", SNAPSHOT_MAX_SKIP)
 
 # ---------------- UTILS ----------------
 
@@ -56,9 +61,11 @@ def haversine(lat1, lon1, lat2, lon2):
 
 # ---------------- DATABASE ----------------
 
-def get_position_by_callsign(callsign):
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+def get_position_by_callsign(callsign, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
     cur = conn.cursor()
 
     cur.execute("""
@@ -70,7 +77,8 @@ def get_position_by_callsign(callsign):
     """, (f"{callsign}%",))
 
     row = cur.fetchone()
-    conn.close()
+    if own_conn:
+        conn.close()
 
     if not row:
         return None
@@ -112,23 +120,50 @@ def get_latest_positions():
     return rows
 
 
+def filter_today(rows):
+    """
+    Stesso filtro di get_latest_positions con SHOW_ONLY_TODAY, applicato
+    alle righe già lette dal DataHub
+    """
+    if not SHOW_ONLY_TODAY:
+        return rows
+
+    today = datetime.now().strftime("%d/%m/%Y")
+    return [r for r in rows if (r["time"] or "").startswith(today)]
+
+
 # ---------------- GUI ----------------
 
-class App:
+class NodesView(ttk.Frame):
+    wants = ("positions", "snapshot", "topology", "liveness")
 
-    def __init__(self, root):
-        self.root = root
-        self.root.title("MeshCom - Posizioni v0.090126-b by IK5XMK")
+    def __init__(self, master, hub):
+        super().__init__(master)
+        self.hub = hub
 
         self.ref_callsign = None
         self.ref_position = None
-
-        frame = ttk.Frame(root)
+        self.rows = []
+        self.topology = None
+        self.liveness = None
+        self.index = GridNodeIndex()
+
+        # filtro per distanza dal riferimento (0 = tutti)
+        bar = ttk.Frame(self)
+        bar.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(bar, text="Entro km dal riferimento (0 = tutti):").pack(side=tk.LEFT)
+        self.radius_var = tk.StringVar(value="0")
+        ttk.Spinbox(
+            bar, from_=0, to=500, increment=5, width=6,
+            textvariable=self.radius_var, command=self.update_rows
+        ).pack(side=tk.LEFT, padx=5)
+
+        frame = ttk.Frame(self)
         frame.pack(fill=tk.BOTH, expand=True)
 
         self.tree = ttk.Treeview(
             frame,
-            columns=("cs", "lat", "lon", "time", "dist"),
+            columns=("cs", "lat", "lon", "time", "dist", "hop", "via"),
             show="headings",
             selectmode="browse"
         )
@@ -139,6 +174,8 @@ class App:
             ("lon", "Lon", 90),
             ("time", "Time", 160),
             ("dist", "Km", 80),
+            ("hop", "Hop", 50),
+            ("via", "Via", 150),
         ]:
             self.tree.heading(c, text=t)
             self.tree.column(c, width=w, anchor="center")
@@ -152,15 +189,20 @@ class App:
         frame.rowconfigure(0, weight=1)
         frame.columnconfigure(0, weight=1)
 
+        # ultimo evento nodo perso / di nuovo attivo
+        self.event_label = ttk.Label(self, text="", anchor="w")
+        self.event_label.pack(fill=tk.X, padx=5, pady=2)
+
         self.tree.tag_configure("me", background="#d6f5d6")
         self.tree.tag_configure("ref", background="#ffe0b3")
         self.tree.tag_configure("normal", background="white")
+        self.tree.tag_configure("lost", background="#f8d7da", foreground="#7a1f1f")
 
         self.tree.bind("<<TreeviewSelect>>", self.on_select)
 
         self.items = {}
 
-        self.poll()
+        hub.register(self)
 
     # ---------------- EVENT ----------------
 
@@ -172,29 +214,61 @@ class App:
         item = sel[0]
         callsign = self.tree.item(item, "values")[0]
 
-        pos = get_position_by_callsign(callsign)
+        pos = get_position_by_callsign(callsign, self.hub.conn)
         if pos:
             self.ref_callsign = callsign
             self.ref_position = pos
-            self.update()
+            self.update_rows()
 
     # ---------------- UPDATE ----------------
 
-    def poll(self):
-        self.update()
-        self.root.after(POLL_INTERVAL * 1000, self.poll)
+    def on_refresh(self, data):
+        # stato corrente dallo snapshot del logger, dal database solo
+        # se il logger non lo pubblica
+        if data.snapshot is not None:
+            self.rows = filter_today(snapshot_positions(data.snapshot))
+        else:
+            self.rows = filter_today(data.positions)
+
+        self.index = GridNodeIndex()
+        for r in self.rows:
+            lat = dms_to_decimal(r["lat"], r["lat_dir"])
+            lon = dms_to_decimal(r["long"], r["long_dir"])
+            if lat is not None and lon is not None:
+                self.index.update(r["src"].split(",")[0], lat, lon)
+        self.topology = data.topology
+        self.liveness = data.liveness
+
+        if self.liveness and self.liveness.events:
+            _, cs, event, t, detail = self.liveness.events[-1]
+            text = EVENT_LABELS.get(event, event)
+            self.event_label.config(text=f"{text}: {cs} alle {t} ({detail})")
+
+        self.update_rows()
 
-    def update(self):
+    def update_rows(self):
         if self.ref_position:
             ref_pos = self.ref_position
         else:
-            ref_pos = get_position_by_callsign(MY_CALLSIGN)
+            ref_pos = get_position_by_callsign(MY_CALLSIGN, self.hub.conn)
 
-        rows = get_latest_positions()
+        # nodi entro il raggio scelto, dall'indice spaziale
+        nearby = None
+        radius = to_float(self.radius_var.get()) or 0
+        if radius > 0 and ref_pos:
+            nearby = {cs for cs, _ in self.index.within(ref_pos[0], ref_pos[1], radius)}
+            if self.ref_callsign:
+                nearby.add(self.ref_callsign)
+
+        # le righe arrivano in ordine di id decrescente: il ciclo di
+        # inserimento in testa le riporta in ordine di arrivo
+        rows = list(reversed(self.rows))
         seen = set()
 
         for r in rows:
             src = r["src"].split(",")[0]
+            if nearby is not None and src not in nearby:
+                continue
             seen.add(src)
 
             lat = dms_to_decimal(r["lat"], r["lat_dir"])
@@ -210,13 +284,22 @@ class App:
                 tag = "ref" if src == self.ref_callsign else "normal"
             else:
                 tag = "me" if src.startswith(MY_CALLSIGN) else "normal"
+            if tag == "normal" and self.liveness and self.liveness.is_lost(src):
+                tag = "lost"
+
+            hop, via = "", ""
+            if self.topology:
+                hops, via = self.topology.last_route(src)
+                hop = "" if hops is None else hops
 
             values = (
                 src,
                 f"{lat:.5f}",
                 f"{lon:.5f}",
                 r["time"],
-                dist
+                dist,
+                hop,
+                via
             )
 
             if src in self.items:
@@ -236,6 +319,18 @@ class App:
                 del self.items[cs]
 
 
+class App:
+
+    def __init__(self, root):
+        self.root = root
+        self.root.title("MeshCom - Posizioni v0.090126-b by IK5XMK")
+
+        self.hub = DataHub(DB_PATH)
+        self.view = NodesView(root, self.hub)
+        self.view.pack(fill=tk.BOTH, expand=True)
+        self.hub.start(root, POLL_INTERVAL, max_skip=MAX_SKIP)
+
+
 # ---------------- MAIN ----------------
 
 if __name__ == "__main__":
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+# ---------------- OFFSET DEI CONSUMATORI ----------------
+
+START_MODES = ("checkpoint", "now", "beginning")
+
+
+class ConsumerOffsets:
+    """
+    Cursore persistente (ultimo id elaborato) per ogni programma che legge
+    una tabella del database, salvato nella tabella consumer_offsets.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS consumer_offsets (
+                consumer TEXT PRIMARY KEY,
+                last_id INTEGER,
+                updated TEXT
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, consumer):
+        row = self.conn.execute(
+            "SELECT last_id FROM consumer_offsets WHERE consumer = ?",
+            (consumer,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def commit(self, consumer, last_id):
+        self.conn.execute("""
+            INSERT INTO consumer_offsets (consumer, last_id, updated)
+            VALUES (?, ?, ?)
+            ON CONFLICT (consumer) DO UPDATE SET
+                last_id = excluded.last_id,
+                updated = excluded.updated
+        """, (consumer, last_id, datetime.now().strftime("%d/%m/%Y %H:%M:%S")))
+        self.conn.commit()
+
+    def start_id(self, consumer, table, mode):
+        """
+        Id da cui ripartire: 'checkpoint' = ultimo salvato (o 'now' se
+        manca), 'now' = solo i record futuri, 'beginning' = tutta la storia
+        """
+        if mode == "beginning":
+            return 0
+
+        if mode == "checkpoint":
+            last_id = self.get(consumer)
+            if last_id is not None:
+                return last_id
+
+        row = self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()
+        return row[0]
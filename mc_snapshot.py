@@ -0,0 +1,377 @@
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import time
+from collections import namedtuple
+
+from mc_liveness import frame_time
+from mc_topology import parse_path
+
+# ---------------- CONFIG ----------------
+
+CAPACITY = 1024
+MAX_RETRIES = 1000
+
+# ---------------- LAYOUT ----------------
+#
+# File <database>.snap (es. meshcom.snap), scritto solo dal logger.
+# Tutti i campi little endian; dimensione = 64 + capacity * 64 byte.
+#
+# Intestazione (64 byte)
+#   0  magic        4s   b"MCS1" (altro valore: file dismesso, riaprire)
+#   4  layout       u16  versione del formato (1)
+#   6  record_size  u16  dimensione di un record nodo (64)
+#   8  version      u64  seqlock: dispari durante una scrittura, cresce
+#                        ad ogni pubblicazione
+#  16  capacity     u32  record nodo disponibili
+#  20  count        u32  record nodo usati (0..count-1)
+#  24  lost         u32  nodi persi
+#  28  -            4 byte liberi
+#  32  msg_id       u64  ultimo id della tabella msg
+#  40  pos_id       u64  ultimo id della tabella pos
+#  48  tele_id      u64  ultimo id della tabella tele
+#  56  updated      f64  ora dell'ultima pubblicazione (epoch)
+#
+# Record nodo (64 byte, dall'offset 64)
+#   0  callsign     16s  utf-8, completato con zeri
+#  16  lat          f64  gradi (NaN se la posizione non è nota)
+#  24  lon          f64
+#  32  last_heard   f64  ultimo frame ascoltato (epoch)
+#  40  pos_id       u64  id della riga di pos dell'ultima posizione (0 se
+#                        non nota)
+#  48  frames       u64  frame ricevuti da quando il logger è partito
+#  56  hops         u8   relay dell'ultimo frame (255 = non noto)
+#  57  batt         u8   batteria % (255 = non nota)
+#  58  flags        u8   bit 0 nodo perso, bit 1 posizione nota
+#  59  -            5 byte liberi
+#
+# Lettura senza lock (seqlock): leggere version, se dispari riprovare;
+# copiare i dati; rileggere version: se è cambiata la copia non è
+# coerente e va ripetuta.
+
+MAGIC = b"MCS1"
+RETIRED = b"MCS0"
+LAYOUT = 1
+HEADER = struct.Struct("<4sHHQIII4xQQQd")
+VERSION = struct.Struct("<Q")
+VERSION_OFFSET = 8
+NODE = struct.Struct("<16sdddQQBBB5x")
+
+FLAG_LOST = 1
+FLAG_POSITION = 2
+UNKNOWN = 255
+
+NodeState = namedtuple("NodeState", "callsign lat lon last_heard pos_id frames hops batt lost")
+Snapshot = namedtuple("Snapshot", "version msg_id pos_id tele_id updated lost nodes")
+
+# ---------------- UTILS ----------------
+
+def default_snapshot_path(db_path):
+    return os.path.splitext(os.path.abspath(db_path))[0] + ".snap"
+
+
+def to_degrees(value, direction):
+    value = float(value)
+    if direction in ("S", "W"):
+        value = -value
+    return value
+
+
+def file_size(capacity):
+    return HEADER.size + capacity * NODE.size
+
+# ---------------- SCRITTURA (LOGGER) ----------------
+
+class SnapshotWriter:
+    """
+    Stato corrente dei nodi pubblicato dal logger nel file mappato in
+    memoria. Ogni pubblicazione riscrive solo il record del nodo
+    interessato e l'intestazione. Quando i record sono finiti si riusa
+    quello del nodo ascoltato meno di recente.
+    """
+
+    def __init__(self, path, capacity=CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.size = file_size(capacity)
+
+        if os.path.exists(path) and os.path.getsize(path) != self.size:
+            # capacità cambiata: chi legge il vecchio file lo vede dismesso
+            self._retire(path)
+
+        mode = "r+b" if os.path.exists(path) else "w+b"
+        self.file = open(path, mode)
+        self.file.truncate(self.size)
+        self.mm = mmap.mmap(self.file.fileno(), self.size)
+
+        self.version = self._stored_version()
+        self.slots = {}         # callsign -> indice del record
+        self.nodes = []         # record in chiaro, stesso indice
+        self.ids = {"msg": 0, "pos": 0, "tele": 0}
+        self._publish(None)
+
+    def _stored_version(self):
+        # si riparte dalla versione precedente (pari) per non farla
+        # tornare indietro agli occhi di chi legge
+        version = VERSION.unpack_from(self.mm, VERSION_OFFSET)[0]
+        return version + (version & 1)
+
+    @staticmethod
+    def _retire(path):
+        try:
+            with open(path, "r+b") as f:
+                f.write(RETIRED)
+            os.remove(path)
+        except OSError as e:
+            print(f"⚠ Snapshot: impossibile sostituire {path}: {e}")
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+        self.file.close()
+
+    # ---------------- STATO ----------------
+
+    def load(self, conn):
+        """
+        Stato iniziale dal database: ultimi id, nodi con ultimo ascolto e
+        stato (node_liveness) e ultima posizione (node_pos)
+        """
+        for table in self.ids:
+            try:
+                self.ids[table] = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+            except sqlite3.OperationalError:
+                pass
+
+        known = {}
+        try:
+            for cs, last, state in conn.execute(
+                "SELECT callsign, last_heard, state FROM node_liveness ORDER BY last_heard DESC"
+            ):
+                known[cs] = [cs, math.nan, math.nan, last or 0.0, 0, 0, UNKNOWN, UNKNOWN,
+                             FLAG_LOST if state == "lost" else 0]
+        except sqlite3.OperationalError:
+            pass
+        try:
+            for cs, lat, lon in conn.execute("SELECT callsign, lat, lon FROM node_pos"):
+                node = known.setdefault(cs, [cs, math.nan, math.nan, 0.0, 0, 0, UNKNOWN, UNKNOWN, 0])
+                node[1], node[2] = lat, lon
+                node[8] |= FLAG_POSITION
+        except sqlite3.OperationalError:
+            pass
+
+        ranked = sorted(known.values(), key=lambda n: -n[3])[:self.capacity]
+        self.nodes = ranked
+        self.slots = {n[0]: i for i, n in enumerate(ranked)}
+
+        self._begin()
+        for i in range(len(self.nodes)):
+            self._write_node(i)
+        self._write_header()
+        self._end()
+
+    def update(self, frame_type, row_id, frame):
+        """
+        Frame appena salvato nel database (chiamare dopo il commit)
+        """
+        if frame_type in self.ids and row_id:
+            self.ids[frame_type] = max(self.ids[frame_type], row_id)
+
+        path = parse_path(frame.get("src"))
+        if not path:
+            self._publish(None)
+            return
+
+        i = self._slot(path[0])
+        node = self.nodes[i]
+        node[3] = frame_time(frame)
+        node[5] += 1
+        node[6] = min(len(path) - 1, UNKNOWN - 1)
+        node[8] &= ~FLAG_LOST
+
+        if frame_type == "pos":
+            try:
+                node[1] = to_degrees(frame.get("lat"), frame.get("lat_dir"))
+                node[2] = to_degrees(frame.get("long"), frame.get("long_dir"))
+                node[4] = row_id or 0
+                node[8] |= FLAG_POSITION
+            except (TypeError, ValueError):
+                pass
+            try:
+                node[7] = min(max(int(float(frame.get("batt"))), 0), UNKNOWN - 1)
+            except (TypeError, ValueError):
+                pass
+
+        self._publish(i)
+
+    def set_lost(self, callsign, lost):
+        i = self.slots.get(callsign)
+        if i is None:
+            return
+        if lost:
+            self.nodes[i][8] |= FLAG_LOST
+        else:
+            self.nodes[i][8] &= ~FLAG_LOST
+        self._publish(i)
+
+    def _slot(self, callsign):
+        i = self.slots.get(callsign)
+        if i is not None:
+            return i
+
+        node = [callsign, math.nan, math.nan, 0.0, 0, 0, UNKNOWN, UNKNOWN, 0]
+        if len(self.nodes) < self.capacity:
+            self.nodes.append(node)
+            i = len(self.nodes) - 1
+        else:
+            i = min(range(len(self.nodes)), key=lambda k: self.nodes[k][3])
+            del self.slots[self.nodes[i][0]]
+            self.nodes[i] = node
+        self.slots[callsign] = i
+        return i
+
+    # ---------------- SCRITTURA ----------------
+
+    def _publish(self, i):
+        self._begin()
+        if i is not None:
+            self._write_node(i)
+        self._write_header()
+        self._end()
+
+    def _begin(self):
+        self.version += 1
+        VERSION.pack_into(self.mm, VERSION_OFFSET, self.version)
+
+    def _end(self):
+        self.version += 1
+        VERSION.pack_into(self.mm, VERSION_OFFSET, self.version)
+
+    def _write_node(self, i):
+        cs, lat, lon, last, pos_id, frames, hops, batt, flags = self.nodes[i]
+        NODE.pack_into(
+            self.mm, HEADER.size + i * NODE.size,
+            cs.encode("utf-8")[:16], lat, lon, last, pos_id, frames, hops, batt, flags
+        )
+
+    def _write_header(self):
+        lost = sum(1 for n in self.nodes if n[8] & FLAG_LOST)
+        HEADER.pack_into(
+            self.mm, 0,
+            MAGIC, LAYOUT, NODE.size, self.version, self.capacity, len(self.nodes), lost,
+            self.ids["msg"], self.ids["pos"], self.ids["tele"], time.time()
+        )
+
+# ---------------- LETTURA (VISTE) ----------------
+
+class SnapshotReader:
+    """
+    Lettura del file del logger senza SQL né lock. version() costa una
+    lettura di 8 byte: se non cambia, non è cambiato nulla.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.mm = None
+
+    def _open(self):
+        self.close()
+        try:
+            self.file = open(self.path, "rb")
+            size = os.fstat(self.file.fileno()).st_size
+            if size < HEADER.size:
+                raise OSError("file incompleto")
+            self.mm = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+        except OSError:
+            self.close()
+            return False
+        return True
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        if self.file is not None:
+            self.file.close()
+        self.mm = self.file = None
+
+    def _valid(self):
+        if self.mm is None or self.mm[:4] != MAGIC:
+            # file non ancora creato o sostituito dal logger
+            if not self._open() or self.mm[:4] != MAGIC:
+                return False
+        layout, record_size = struct.unpack_from("<HH", self.mm, 4)
+        return layout == LAYOUT and record_size == NODE.size
+
+    def version(self):
+        """
+        Versione corrente, None se il file non è disponibile
+        """
+        if not self._valid():
+            return None
+        return VERSION.unpack_from(self.mm, VERSION_OFFSET)[0]
+
+    def read(self):
+        """
+        Copia coerente dello stato (Snapshot), None se non disponibile
+        """
+        for _ in range(MAX_RETRIES):
+            if not self._valid():
+                return None
+
+            before = VERSION.unpack_from(self.mm, VERSION_OFFSET)[0]
+            if before & 1:
+                time.sleep(0)
+                continue
+            data = self.mm[:]
+            if VERSION.unpack_from(self.mm, VERSION_OFFSET)[0] != before:
+                continue
+            return parse_snapshot(data)
+        return None
+
+
+def parse_snapshot(data):
+    (_, _, _, version, capacity, count, lost,
+     msg_id, pos_id, tele_id, updated) = HEADER.unpack_from(data, 0)
+
+    count = min(count, capacity, (len(data) - HEADER.size) // NODE.size)
+    nodes = []
+    for i in range(count):
+        cs, lat, lon, last, node_pos_id, frames, hops, batt, flags = NODE.unpack_from(
+            data, HEADER.size + i * NODE.size
+        )
+        has_pos = bool(flags & FLAG_POSITION)
+        nodes.append(NodeState(
+            cs.rstrip(b"\0").decode("utf-8", errors="replace"),
+            lat if has_pos else None,
+            lon if has_pos else None,
+            last,
+            node_pos_id,
+            frames,
+            None if hops == UNKNOWN else hops,
+            None if batt == UNKNOWN else batt,
+            bool(flags & FLAG_LOST)
+        ))
+    return Snapshot(version, msg_id, pos_id, tele_id, updated, lost, nodes)
+
+# ---------------- MAIN ----------------
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        snap = SnapshotReader(sys.argv[1]).read()
+        if snap is None:
+            print("Snapshot non disponibile")
+            sys.exit(1)
+
+        print(f"versione {snap.version} | msg {snap.msg_id} | pos {snap.pos_id} | tele {snap.tele_id} | "
+              f"{len(snap.nodes)} nodi, {snap.lost} persi")
+        for n in sorted(snap.nodes, key=lambda n: -n.last_heard):
+            where = f"{n.lat:.5f} {n.lon:.5f}" if n.lat is not None else "-"
+            heard = time.strftime("%d/%m/%Y %H:%M:%S", time.localtime(n.last_heard)) if n.last_heard else "-"
+            print(f"{n.callsign:<12} {heard}  {where:<22} hop {n.hops if n.hops is not None else '-'}"
+                  f"  {'PERSO' if n.lost else ''}")
+    else:
+        print("Uso: mc_snapshot.py <file .snap>")
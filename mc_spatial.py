@@ -0,0 +1,350 @@
+import math
+import sqlite3
+import sys
+import time
+
+from mc_geo import EARTH_RADIUS_KM, GridIndex, bbox_around, haversine
+from mc_liveness import ensure_events_table, frame_time, record_event
+from mc_topology import parse_path
+
+# ---------------- CONFIG ----------------
+
+# due nodi tornano "distanti" solo oltre PROXIMITY_HYSTERESIS volte la
+# soglia, per non generare eventi a raffica al confine
+PROXIMITY_HYSTERESIS = 1.2
+NEAREST_START_KM = 2.0
+MAX_RADIUS_KM = EARTH_RADIUS_KM * math.pi
+
+# ---------------- UTILS ----------------
+
+def to_degrees(value, direction):
+    value = float(value)
+    if direction in ("S", "W"):
+        value = -value
+    return value
+
+
+def rtree_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.rtree_probe USING rtree(id, a, b, c, d)")
+        conn.execute("DROP TABLE temp.rtree_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+# ---------------- INDICI ----------------
+
+class _NodeIndexBase:
+    """
+    Query comuni: within() e nearest() filtrano con il rettangolo
+    dell'indice e poi calcolano la distanza vera (haversine)
+    """
+
+    def candidates(self, min_lat, min_lon, max_lat, max_lon):
+        raise NotImplementedError
+
+    def position(self, callsign):
+        raise NotImplementedError
+
+    def within(self, lat, lon, radius_km, exclude=None):
+        """
+        [(callsign, km)] dei nodi entro radius_km, dal più vicino
+        """
+        result = []
+        for cs, clat, clon in self.candidates(*bbox_around(lat, lon, radius_km)):
+            if cs == exclude:
+                continue
+            d = haversine(lat, lon, clat, clon)
+            if d <= radius_km:
+                result.append((cs, d))
+        result.sort(key=lambda item: item[1])
+        return result
+
+    def within_node(self, callsign, radius_km):
+        pos = self.position(callsign)
+        return self.within(pos[0], pos[1], radius_km, exclude=callsign) if pos else []
+
+    def nearest(self, lat, lon, k=5, exclude=None):
+        """
+        I k nodi più vicini: raggio di ricerca raddoppiato finché il
+        cerchio contiene k nodi (dentro il cerchio l'ordine è esatto)
+        """
+        radius = NEAREST_START_KM
+        while True:
+            found = self.within(lat, lon, radius, exclude)
+            if len(found) >= k or radius >= MAX_RADIUS_KM:
+                return found[:k]
+            radius *= 2
+
+
+class GridNodeIndex(_NodeIndexBase):
+    """
+    Indice in memoria (mc_geo.GridIndex): per le viste o quando sqlite
+    non ha il modulo R*Tree
+    """
+
+    def __init__(self, cell_deg=0.05):
+        self.grid = GridIndex(cell_deg)
+
+    def __len__(self):
+        return len(self.grid)
+
+    def update(self, callsign, lat, lon, t=None):
+        previous = self.grid.position(callsign)
+        self.grid.insert(callsign, lat, lon)
+        return previous
+
+    def position(self, callsign):
+        return self.grid.position(callsign)
+
+    def candidates(self, min_lat, min_lon, max_lat, max_lon):
+        for cs in self.grid.query_bbox(min_lat, min_lon, max_lat, max_lon):
+            lat, lon = self.grid.position(cs)
+            yield cs, lat, lon
+
+
+class RTreeNodeIndex(_NodeIndexBase):
+    """
+    Ultima posizione di ogni nodo in node_pos, indicizzata dalla tabella
+    R*Tree node_rtree (stesso rowid). Come sink del logger non esegue
+    commit; con create=False si apre in sola lettura (viste).
+    """
+
+    def __init__(self, conn, create=True):
+        self.conn = conn
+        if create:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS node_pos (
+                    num INTEGER PRIMARY KEY,
+                    callsign TEXT UNIQUE,
+                    lat REAL,
+                    lon REAL,
+                    time TEXT
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS node_rtree USING rtree (
+                    num, min_lat, max_lat, min_lon, max_lon
+                );
+            """)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM node_pos").fetchone()[0]
+
+    def update(self, callsign, lat, lon, t=None):
+        row = self.conn.execute(
+            "SELECT num, lat, lon FROM node_pos WHERE callsign = ?", (callsign,)
+        ).fetchone()
+
+        if row:
+            num, previous = row[0], (row[1], row[2])
+            self.conn.execute(
+                "UPDATE node_pos SET lat = ?, lon = ?, time = ? WHERE num = ?",
+                (lat, lon, t, num)
+            )
+        else:
+            previous = None
+            num = self.conn.execute(
+                "INSERT INTO node_pos (callsign, lat, lon, time) VALUES (?, ?, ?, ?)",
+                (callsign, lat, lon, t)
+            ).lastrowid
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO node_rtree (num, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)",
+            (num, lat, lat, lon, lon)
+        )
+        return previous
+
+    def position(self, callsign):
+        row = self.conn.execute(
+            "SELECT lat, lon FROM node_pos WHERE callsign = ?", (callsign,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def candidates(self, min_lat, min_lon, max_lat, max_lon):
+        return self.conn.execute("""
+            SELECT p.callsign, p.lat, p.lon
+            FROM node_rtree r
+            JOIN node_pos p ON p.num = r.num
+            WHERE r.min_lat <= ? AND r.max_lat >= ?
+              AND r.min_lon <= ? AND r.max_lon >= ?
+        """, (max_lat, min_lat, max_lon, min_lon)).fetchall()
+
+    def rebuild(self):
+        """
+        Ricarica l'ultima posizione di ogni nodo dalla tabella pos
+        """
+        self.conn.execute("DELETE FROM node_pos")
+        self.conn.execute("DELETE FROM node_rtree")
+
+        count = 0
+        try:
+            cur = self.conn.execute("""
+                SELECT src, time, lat, lat_dir, long, long_dir
+                FROM pos
+                WHERE lat IS NOT NULL AND long IS NOT NULL
+                ORDER BY id ASC
+            """)
+        except sqlite3.OperationalError:
+            cur = []
+
+        for src, t, lat, lat_dir, lon, lon_dir in cur:
+            path = parse_path(src)
+            try:
+                lat, lon = to_degrees(lat, lat_dir), to_degrees(lon, lon_dir)
+            except (TypeError, ValueError):
+                continue
+            if path and not (lat == 0 and lon == 0):
+                self.update(path[0], lat, lon, t)
+                count += 1
+
+        self.conn.commit()
+        return count
+
+
+def open_node_index(conn, create=True):
+    """
+    R*Tree se disponibile in sqlite, altrimenti indice in memoria
+    """
+    if rtree_available(conn):
+        return RTreeNodeIndex(conn, create)
+    return GridNodeIndex()
+
+# ---------------- ALLARMI (SINK DEL LOGGER) ----------------
+
+class Geofence:
+    """
+    Area circolare ("lat", "lon", "radius_km") o rettangolare ("bbox":
+    [min_lat, min_lon, max_lat, max_lon]); "callsigns" limita i nodi
+    controllati (vuoto = tutti)
+    """
+
+    def __init__(self, cfg):
+        self.name = cfg.get("name", "area")
+        self.bbox = cfg.get("bbox")
+        self.lat = cfg.get("lat")
+        self.lon = cfg.get("lon")
+        self.radius_km = float(cfg.get("radius_km", 0))
+        self.callsigns = {c.upper() for c in cfg.get("callsigns", [])}
+
+    def applies_to(self, callsign):
+        return not self.callsigns or callsign in self.callsigns
+
+    def contains(self, lat, lon):
+        if self.bbox:
+            min_lat, min_lon, max_lat, max_lon = self.bbox
+            return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+        return haversine(self.lat, self.lon, lat, lon) <= self.radius_km
+
+
+class ProximityAlerts:
+    """
+    Allarmi valutati ad ogni frame pos, solo per il nodo che si è mosso:
+    - geofence: il nodo entra / esce da un'area ("enter" / "leave")
+    - prossimità: due nodi a meno di proximity_km ("near"), di nuovo
+      distanti ("apart"); i vicini si cercano con l'indice spaziale
+    Gli eventi vanno in node_events. Come sink non esegue commit.
+    """
+
+    def __init__(self, conn, local_callsign, geofences=(), proximity_km=0, proximity_callsigns=()):
+        self.conn = conn
+        self.local = local_callsign.strip().upper()
+        self.index = open_node_index(conn)
+        if isinstance(self.index, RTreeNodeIndex) and len(self.index) == 0:
+            # primo avvio: ultime posizioni dalla storia di pos
+            self.index.rebuild()
+        self.fences = [Geofence(g) for g in geofences]
+        self.proximity_km = float(proximity_km or 0)
+        self.watch = {c.upper() for c in proximity_callsigns}
+
+        self.inside = {}    # (area, callsign) -> dentro?
+        self.near = {}      # callsign -> insieme dei nodi vicini
+        self.fired = []     # eventi non ancora letti con drain()
+        self.now = None
+
+        ensure_events_table(self.conn)
+        self.conn.commit()
+
+    def on_frame(self, frame_type, row_id, frame):
+        if frame_type != "pos":
+            return
+
+        path = parse_path(frame.get("src"))
+        if not path:
+            return
+        try:
+            lat = to_degrees(frame.get("lat"), frame.get("lat_dir"))
+            lon = to_degrees(frame.get("long"), frame.get("long_dir"))
+        except (TypeError, ValueError):
+            return
+        if lat == 0 and lon == 0:
+            return
+
+        callsign = path[0]
+        self.now = frame_time(frame)
+        previous = self.index.update(callsign, lat, lon, frame.get("time"))
+        self.check_fences(callsign, lat, lon, previous)
+        if self.proximity_km > 0:
+            self.check_proximity(callsign, lat, lon)
+
+    def drain(self):
+        events, self.fired = self.fired, []
+        return events
+
+    def _event(self, callsign, event, detail):
+        record_event(self.conn, callsign, event, detail, self.now)
+        self.fired.append((callsign, event, detail))
+
+    def check_fences(self, callsign, lat, lon, previous):
+        for fence in self.fences:
+            if not fence.applies_to(callsign):
+                continue
+
+            key = (fence.name, callsign)
+            was = self.inside.get(key)
+            if was is None:
+                # primo frame dopo l'avvio: stato dalla posizione precedente
+                was = fence.contains(*previous) if previous else None
+            now_inside = fence.contains(lat, lon)
+            self.inside[key] = now_inside
+
+            if was is None or was == now_inside:
+                continue
+            event = "enter" if now_inside else "leave"
+            self._event(callsign, event, f"area {fence.name}")
+
+    def check_proximity(self, callsign, lat, lon):
+        if self.watch and callsign not in self.watch:
+            return
+
+        limit = self.proximity_km
+        close = {
+            cs: d for cs, d in self.index.within(lat, lon, limit * PROXIMITY_HYSTERESIS, exclude=callsign)
+            if cs != self.local and (not self.watch or cs in self.watch)
+        }
+        before = self.near.get(callsign, set())
+        now_near = {cs for cs in before if cs in close}
+        now_near |= {cs for cs, d in close.items() if d <= limit}
+
+        for cs in now_near - before:
+            self._event(callsign, "near", f"{cs} a {close[cs] * 1000:.0f} m")
+            self.near.setdefault(cs, set()).add(callsign)
+        for cs in before - now_near:
+            self._event(callsign, "apart", f"{cs} oltre {limit * PROXIMITY_HYSTERESIS * 1000:.0f} m")
+            self.near.get(cs, set()).discard(callsign)
+
+        self.near[callsign] = now_near
+
+# ---------------- MAIN ----------------
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        conn = sqlite3.connect(sys.argv[1])
+        index = open_node_index(conn)
+        if isinstance(index, RTreeNodeIndex):
+            start = time.time()
+            count = index.rebuild()
+            print(f"Indice spaziale ricostruito da {count} posizioni in {time.time() - start:.1f} s")
+        else:
+            print("sqlite senza modulo R*Tree: il logger userà l'indice in memoria")
+        conn.close()
+    else:
+        print("Uso: mc_spatial.py <database>")
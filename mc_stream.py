@@ -0,0 +1,300 @@
+import argparse
+import json
+import queue
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+# ---------------- PROTOCOLLO ----------------
+#
+# TCP, una riga JSON per evento (newline-delimited JSON):
+#   {"table": "msg", "id": 123, "data": {...colonne del frame...}}
+#   {"ping": 1760000000}                        (ogni HEARTBEAT secondi)
+#
+# Appena connesso il client può inviare UNA riga (entro HELLO_TIMEOUT):
+#   {"resume": {"msg": 120, "pos": 340}, "tables": ["msg", "pos"]}
+# per ricevere prima le righe con id successivo a quelli indicati e poi
+# il flusso live. Senza riga iniziale si riceve solo il flusso live.
+# Se una parte delle righe richieste non è più nel database (archiviata
+# o cancellata) il server lo segnala prima di proseguire:
+#   {"gap": {"table": "msg", "after": 120, "next": 480}}
+# Un client che non legge abbastanza in fretta (buffer pieno) viene
+# scollegato: si riconnette e riprende con "resume".
+
+STREAM_TABLES = ("msg", "pos", "tele")
+HELLO_TIMEOUT = 2.0
+HEARTBEAT = 30
+BACKFILL_PAGE = 1000
+
+
+def encode(table, row_id, data):
+    return (json.dumps({"table": table, "id": row_id, "data": data}, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def parse_hello(hello):
+    """
+    (tabelle, resume) dalla riga iniziale del client; voci non valide
+    vengono ignorate
+    """
+    tables = hello.get("tables", STREAM_TABLES)
+    if not isinstance(tables, list):
+        tables = STREAM_TABLES
+    tables = [t for t in tables if t in STREAM_TABLES]
+
+    resume = {}
+    requested = hello.get("resume")
+    for table, value in (requested.items() if isinstance(requested, dict) else ()):
+        if table not in tables or isinstance(value, bool):
+            continue
+        try:
+            resume[table] = int(value)
+        except (TypeError, ValueError):
+            continue
+    return tables, resume
+
+# ---------------- CLIENT LATO SERVER ----------------
+
+class _Subscriber:
+    def __init__(self, sock, addr, buffer_size, tables):
+        self.sock = sock
+        self.addr = addr
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.tables = set(tables)
+        self.alive = True
+        self.last_sent = {}
+
+    def offer(self, table, row_id, line):
+        """
+        Accoda senza mai bloccare il logger; False se il buffer è pieno
+        """
+        if table not in self.tables:
+            return True
+        try:
+            self.queue.put_nowait((table, row_id, line))
+            return True
+        except queue.Full:
+            return False
+
+    def send(self, table, row_id, line):
+        # le righe già inviate dal recupero iniziale non si ripetono
+        if row_id <= self.last_sent.get(table, -1):
+            return
+        self.sock.sendall(line)
+        self.last_sent[table] = row_id
+
+    def close(self):
+        self.alive = False
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+# ---------------- SERVER ----------------
+
+class StreamServer:
+    """
+    Distribuisce in tempo reale i frame decodificati dal logger a più
+    client TCP, ognuno con il proprio buffer limitato. Gli ultimi
+    'history' frame restano in memoria per la ripresa (resume); per id
+    più vecchi il server legge dal proprio database.
+    """
+
+    def __init__(self, host, port, db_path, client_buffer=1000, history=5000):
+        self.db_path = db_path
+        self.client_buffer = client_buffer
+        self.history = deque(maxlen=history)
+        self.lock = threading.Lock()
+        self.clients = []
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(16)
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def close(self):
+        self.sock.close()
+        with self.lock:
+            for c in self.clients:
+                c.close()
+            self.clients = []
+
+    # ---------------- PUBBLICAZIONE ----------------
+
+    def publish(self, table, row_id, frame):
+        line = encode(table, row_id, frame)
+
+        with self.lock:
+            self.history.append((table, row_id, line))
+            slow = [c for c in self.clients if not c.offer(table, row_id, line)]
+            for c in slow:
+                self.clients.remove(c)
+
+        for c in slow:
+            print(f"⚠ Stream: client lento scollegato {c.addr}")
+            c.close()
+
+    # ---------------- CONNESSIONI ----------------
+
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, addr = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(sock, addr), daemon=True).start()
+
+    def _read_hello(self, sock):
+        sock.settimeout(HELLO_TIMEOUT)
+        buf = b""
+        try:
+            while b"\n" not in buf and len(buf) < 4096:
+                chunk = sock.recv(1024)
+                if not chunk:
+                    break
+                buf += chunk
+        except (socket.timeout, OSError):
+            pass
+        sock.settimeout(None)
+
+        try:
+            hello = json.loads(buf.split(b"\n")[0].decode("utf-8")) if buf.strip() else {}
+        except (ValueError, UnicodeDecodeError):
+            hello = {}
+        return hello if isinstance(hello, dict) else {}
+
+    def _serve(self, sock, addr):
+        tables, resume = parse_hello(self._read_hello(sock))
+
+        client = _Subscriber(sock, addr, self.client_buffer, tables)
+
+        # iscrizione PRIMA del recupero: il live si accumula nel buffer
+        with self.lock:
+            self.clients.append(client)
+            ring = list(self.history)
+        print(f"📡 Stream: client connesso {addr} tabelle={tables} resume={resume}")
+
+        try:
+            for table, after_id in resume.items():
+                self._backfill(client, table, after_id, ring)
+
+            while client.alive:
+                try:
+                    table, row_id, line = client.queue.get(timeout=HEARTBEAT)
+                    client.send(table, row_id, line)
+                except queue.Empty:
+                    client.sock.sendall((json.dumps({"ping": int(time.time())}) + "\n").encode())
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                if client in self.clients:
+                    self.clients.remove(client)
+            client.close()
+            print(f"📡 Stream: client scollegato {addr}")
+
+    def _backfill(self, client, table, after_id, ring):
+        ring_ids = [row_id for t, row_id, _ in ring if t == table]
+
+        # la memoria basta se contiene l'id subito successivo; altrimenti
+        # si legge il database a pagine fino al primo id in memoria
+        if not ring_ids or ring_ids[0] > after_id + 1:
+            stop = ring_ids[0] if ring_ids else None
+            after_id = self._backfill_db(client, table, after_id, stop)
+
+        for t, row_id, line in ring:
+            if t == table and row_id > after_id:
+                client.send(t, row_id, line)
+
+    def _backfill_db(self, client, table, after_id, stop):
+        """
+        Righe con id > after_id (e < stop) dal database, BACKFILL_PAGE
+        alla volta; ritorna l'ultimo id inviato
+        """
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        last_id = after_id
+        try:
+            while True:
+                rows = conn.execute(
+                    f"SELECT * FROM {table} WHERE id > ? AND id < ? ORDER BY id ASC LIMIT ?",
+                    (last_id, stop if stop is not None else sys.maxsize, BACKFILL_PAGE)
+                ).fetchall()
+
+                if last_id == after_id:
+                    first = rows[0]["id"] if rows else stop
+                    if first is not None and first > after_id + 1:
+                        self._send_gap(client, table, after_id, first)
+
+                for row in rows:
+                    data = {k: row[k] for k in row.keys() if k != "id" and row[k] is not None}
+                    client.send(table, row["id"], encode(table, row["id"], data))
+                    last_id = row["id"]
+
+                if len(rows) < BACKFILL_PAGE:
+                    return last_id
+        except sqlite3.OperationalError:
+            return last_id
+        finally:
+            conn.close()
+
+    def _send_gap(self, client, table, after_id, next_id):
+        """
+        Righe tra after_id e next_id non più disponibili: il client lo sa
+        invece di perderle in silenzio
+        """
+        gap = {"table": table, "after": after_id, "next": next_id}
+        client.sock.sendall((json.dumps({"gap": gap}) + "\n").encode())
+
+# ---------------- CLIENT ----------------
+
+def iter_stream(host, port, resume=None, tables=STREAM_TABLES, timeout=HEARTBEAT * 2):
+    """
+    Generatore di eventi {"table", "id", "data"} (o {"gap": ...}) letti
+    dal server; i ping sono filtrati. Termina quando la connessione si
+    chiude.
+    """
+    sock = socket.create_connection((host, port), timeout=timeout)
+    hello = {"tables": list(tables)}
+    if resume:
+        hello["resume"] = resume
+    sock.sendall((json.dumps(hello) + "\n").encode("utf-8"))
+
+    try:
+        for line in sock.makefile("r", encoding="utf-8"):
+            event = json.loads(line)
+            if "ping" not in event:
+                yield event
+    finally:
+        sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Client del flusso live di mc_logger")
+    parser.add_argument("host")
+    parser.add_argument("port", type=int)
+    parser.add_argument("--resume", default="", help="es. msg=120,pos=340")
+    parser.add_argument("--tables", default=",".join(STREAM_TABLES))
+    args = parser.parse_args()
+
+    resume = {}
+    for item in filter(None, args.resume.split(",")):
+        table, value = item.split("=")
+        resume[table.strip()] = int(value)
+
+    for event in iter_stream(args.host, args.port, resume, args.tables.split(",")):
+        print(json.dumps(event, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import heapq
+import math
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+# ---------------- CONFIG ----------------
+
+TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+# stesse colonne che il logger crea nel database reale
+COLUMNS = {
+    "msg": ("src_type", "type", "src", "dst", "msg", "msg_id", "firmware", "fw_sub"),
+    "pos": ("src_type", "type", "src", "msg", "lat", "lat_dir", "long", "long_dir",
+            "aprs_symbol", "aprs_symbol_group", "hw_id", "msg_id", "alt", "batt",
+            "firmware", "fw_sub"),
+    "tele": ("src_type", "type", "temp1", "temp2", "hum", "qfe", "qnh", "gas", "co2", "src"),
+}
+
+GROUPS = ("*", "10", "20", "222", "2222", "91")
+WORDS = ("ciao", "prova", "radio", "qsl", "meteo", "test", "ok", "73", "ricevuto", "posizione")
+BATCH = 10000
+
+# ---------------- NODI ----------------
+
+class SynthNode:
+    def __init__(self, rnd, callsign, center, radius_km, beacon_s, mobile):
+        self.callsign = callsign
+        self.beacon_s = beacon_s
+        self.mobile = mobile
+
+        # posizione casuale nel cerchio (distribuzione uniforme in area)
+        r = radius_km * math.sqrt(rnd.random())
+        a = rnd.random() * 2 * math.pi
+        self.lat = center[0] + r * math.cos(a) / 111.0
+        self.lon = center[1] + r * math.sin(a) / (111.0 * math.cos(math.radians(center[0])))
+
+    def move(self, rnd):
+        if self.mobile:
+            # passeggiata casuale di qualche centinaio di metri
+            self.lat += rnd.gauss(0, 0.003)
+            self.lon += rnd.gauss(0, 0.004)
+
+
+def make_callsign(rnd, i):
+    prefix = rnd.choice(("IK5", "IZ5", "IU5", "IW5", "IR5", "OE1", "DD3"))
+    letters = "".join(rnd.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(3))
+    return f"{prefix}{letters}-{i % 99 + 1}"
+
+# ---------------- GENERATORE ----------------
+
+def generate(db_path, nodes=50, days=7, beacon_min=10, msg_per_hour=0.5, tele_ratio=0.2,
+             relays=8, max_hops=4, dup_ratio=0.1, mobile_ratio=0.2, rows=None,
+             center=(43.80, 11.10), radius_km=40, seed=1):
+    """
+    Crea un database sintetico con le tabelle msg, pos e tele del logger:
+    - 'nodes' nodi (una parte mobili) con beacon di posizione ogni
+      ~beacon_min minuti, messaggi e telemetria
+    - percorsi di relay realistici (fino a max_hops relay scelti tra
+      'relays' nodi fissi) e una quota dup_ratio di frame ricevuti due
+      volte per percorsi diversi
+    Con 'rows' la durata viene calcolata per ottenere circa quel numero di
+    righe totali. Ritorna {tabella: righe}.
+    """
+    rnd = random.Random(seed)
+
+    mobile_count = int(nodes * mobile_ratio)
+    fleet = [
+        SynthNode(
+            rnd, make_callsign(rnd, i), center, radius_km,
+            beacon_min * 60 * rnd.uniform(0.5, 1.5),
+            i < mobile_count
+        )
+        for i in range(nodes)
+    ]
+    relay_nodes = [n.callsign for n in fleet[mobile_count:mobile_count + relays]]
+    tele_nodes = set(n.callsign for n in fleet[:max(1, int(nodes * tele_ratio))])
+
+    per_node_s = 1 / (beacon_min * 60) + msg_per_hour / 3600
+    per_day = nodes * 86400 * per_node_s * (1 + dup_ratio)
+    per_day += len(tele_nodes) * 86400 / 1800
+    if rows:
+        days = rows / per_day
+
+    end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=days)
+    horizon = days * 86400
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    for table, cols in COLUMNS.items():
+        conn.execute(f"""
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                time TEXT,
+                {", ".join(f"{c} TEXT" for c in cols)}
+            )
+        """)
+
+    # prossimo evento per ogni nodo (memoria proporzionale ai nodi); il
+    # contatore evita il confronto dei payload a parità di tempo
+    events = []
+    seq = 0
+
+    def schedule(t, kind, cs, payload=None):
+        nonlocal seq
+        seq += 1
+        heapq.heappush(events, (t, seq, kind, cs, payload))
+
+    for n in fleet:
+        schedule(rnd.uniform(0, n.beacon_s), "pos", n.callsign)
+        if msg_per_hour > 0:
+            schedule(rnd.expovariate(msg_per_hour / 3600), "msg", n.callsign)
+        if n.callsign in tele_nodes:
+            schedule(rnd.uniform(0, 1800), "tele", n.callsign)
+    by_cs = {n.callsign: n for n in fleet}
+
+    pending = {t: [] for t in COLUMNS}
+    counts = {t: 0 for t in COLUMNS}
+    total = 0
+
+    def path_for(origin):
+        hops = rnd.choice(range(max_hops + 1))
+        chain = [r for r in rnd.sample(relay_nodes, min(hops, len(relay_nodes))) if r != origin]
+        return ",".join([origin] + chain)
+
+    def emit(table, t, values):
+        nonlocal total
+        stamp = (start + timedelta(seconds=t)).strftime(TIME_FORMAT)
+        pending[table].append((stamp,) + values)
+        counts[table] += 1
+        total += 1
+        if len(pending[table]) >= BATCH:
+            flush(table)
+
+    def flush(table):
+        cols = ("time",) + COLUMNS[table]
+        conn.executemany(
+            f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})",
+            pending[table]
+        )
+        pending[table] = []
+
+    # le righe escono in ordine di tempo, come le scrive il logger
+    while events:
+        t, _, kind, cs, payload = heapq.heappop(events)
+        if t > horizon or (rows and total >= rows):
+            break
+        node = by_cs[cs]
+
+        if kind == "dup":
+            # stesso frame ascoltato di nuovo attraverso altri relay
+            table, values = payload
+            emit(table, t, values[:2] + (path_for(cs),) + values[3:])
+            continue
+
+        msg_id = f"{rnd.getrandbits(32):08X}"
+
+        if kind == "pos":
+            node.move(rnd)
+            values = (
+                "lora", "pos", path_for(cs), "",
+                f"{abs(node.lat):.4f}", "N" if node.lat >= 0 else "S",
+                f"{abs(node.lon):.4f}", "E" if node.lon >= 0 else "W",
+                rnd.choice("#r>["), "/", str(rnd.randint(1, 50)), msg_id,
+                str(rnd.randint(0, 900)), str(rnd.randint(20, 100)), "4.35", "h"
+            )
+            schedule(t + node.beacon_s * rnd.uniform(0.9, 1.1), "pos", cs)
+
+        elif kind == "msg":
+            text = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 6)))
+            values = ("lora", "msg", path_for(cs), rnd.choice(GROUPS), text, msg_id, "35", "k")
+            schedule(t + rnd.expovariate(msg_per_hour / 3600), "msg", cs)
+
+        else:
+            emit("tele", t, (
+                "node", "tele",
+                f"{rnd.gauss(18, 5):.1f}", f"{rnd.gauss(20, 3):.1f}", f"{rnd.uniform(30, 90):.0f}",
+                f"{rnd.gauss(1000, 8):.1f}", f"{rnd.gauss(1013, 8):.1f}", "0", "0", cs
+            ))
+            schedule(t + 1800, "tele", cs)
+            continue
+
+        emit(kind, t, values)
+        if rnd.random() < dup_ratio:
+            schedule(t + rnd.uniform(1, 5), "dup", cs, (kind, values))
+
+    for table in COLUMNS:
+        if pending[table]:
+            flush(table)
+
+    conn.commit()
+    conn.close()
+    return counts
+
+# ---------------- MAIN ----------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un database MeshCom sintetico")
+    parser.add_argument("db", help="file da creare (sovrascritto)")
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--rows", type=int, help="righe totali (sostituisce --days)")
+    parser.add_argument("--beacon", type=float, default=10, help="intervallo beacon in minuti")
+    parser.add_argument("--msg-rate", type=float, default=0.5, help="messaggi per nodo all'ora")
+    parser.add_argument("--relays", type=int, default=8)
+    parser.add_argument("--max-hops", type=int, default=4)
+    parser.add_argument("--dup", type=float, default=0.1, help="quota di frame duplicati")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    counts = generate(
+        args.db, nodes=args.nodes, days=args.days, beacon_min=args.beacon,
+        msg_per_hour=args.msg_rate, relays=args.relays, max_hops=args.max_hops,
+        dup_ratio=args.dup, rows=args.rows, seed=args.seed
+    )
+    for table, count in counts.items():
+        print(f"{table}: {count} righe")
+
+
+if __name__ == "__main__":
+    main()
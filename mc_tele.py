@@ -0,0 +1,192 @@
+import sqlite3
+import tkinter as tk
+from tkinter import ttk, messagebox
+from datetime import datetime
+import time
+import json
+import sys
+
+from mc_telemetry import TelemetryStore
+
+# ---------------- CONFIG (DA FILE JSON) ----------------
+
+CONFIG_FILE = "config_telemetry.json"
+
+try:
+    with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+        config = json.load(f)
+except FileNotFoundError:
+    messagebox.showerror("Errore", f"File di configurazione mancante: {CONFIG_FILE}")
+    sys.exit(1)
+except json.JSONDecodeError as e:
+    messagebox.showerror("Errore", f"Errore nel file JSON:\n{e}")
+    sys.exit(1)
+
+DB_PATH = config.get("DB_PATH", "meshcom.db")
+POLL_INTERVAL = config.get("POLL_INTERVAL", 30)
+HOURS_CHOICES = config.get("HOURS_CHOICES", [1, 6, 24, 72, 168])
+DEFAULT_HOURS = config.get("DEFAULT_HOURS", 24)
+MAX_POINTS = config.get("MAX_POINTS", 300)
+
+COLORS = {
+    "temp1": "#c62828",
+    "temp2": "#ef6c00",
+    "hum": "#1565c0",
+    "qfe": "#6a1b9a",
+    "qnh": "#4527a0",
+    "gas": "#2e7d32",
+    "co2": "#37474f",
+}
+
+# ---------------- APP ----------------
+
+class TeleViewer(tk.Tk):
+    def __init__(self):
+        super().__init__()
+        self.title("MeshCom – Telemetria by IK5XMK")
+        self.geometry("1000x600")
+
+        self.conn = sqlite3.connect(DB_PATH)
+        self.store = TelemetryStore(self.conn)
+
+        self._setup_ui()
+        self.poll()
+
+    # ---------------- UI ----------------
+
+    def _setup_ui(self):
+        top = tk.Frame(self)
+        top.pack(fill="x", padx=5, pady=5)
+
+        tk.Label(top, text="Nodo:").pack(side="left")
+        self.node_cb = ttk.Combobox(top, state="readonly", width=18)
+        self.node_cb.pack(side="left", padx=5)
+        self.node_cb.bind("<<ComboboxSelected>>", self.on_node)
+
+        tk.Label(top, text="Sensore:").pack(side="left")
+        self.metric_cb = ttk.Combobox(top, state="readonly", width=10)
+        self.metric_cb.pack(side="left", padx=5)
+        self.metric_cb.bind("<<ComboboxSelected>>", lambda e: self.redraw())
+
+        tk.Label(top, text="Ore:").pack(side="left")
+        self.hours_cb = ttk.Combobox(
+            top, state="readonly", width=5, values=[str(h) for h in HOURS_CHOICES]
+        )
+        self.hours_cb.set(str(DEFAULT_HOURS))
+        self.hours_cb.pack(side="left", padx=5)
+        self.hours_cb.bind("<<ComboboxSelected>>", lambda e: self.redraw())
+
+        self.info = tk.Label(top, text="", anchor="w")
+        self.info.pack(side="left", padx=15)
+
+        self.canvas = tk.Canvas(self, bg="white")
+        self.canvas.pack(fill="both", expand=True, padx=5, pady=5)
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+
+    # ---------------- EVENT ----------------
+
+    def on_node(self, event=None):
+        metrics = self.store.metrics(self.node_cb.get())
+        self.metric_cb["values"] = metrics
+        if self.metric_cb.get() not in metrics:
+            self.metric_cb.set(metrics[0] if metrics else "")
+        self.redraw()
+
+    # ---------------- UPDATE ----------------
+
+    def poll(self):
+        nodes = self.store.nodes()
+        self.node_cb["values"] = nodes
+        if nodes and self.node_cb.get() not in nodes:
+            self.node_cb.set(nodes[0])
+            self.on_node()
+        else:
+            self.redraw()
+
+        self.after(POLL_INTERVAL * 1000, self.poll)
+
+    def redraw(self):
+        c = self.canvas
+        c.delete("all")
+
+        src = self.node_cb.get()
+        metric = self.metric_cb.get()
+        if not src or not metric:
+            return
+
+        end = int(time.time())
+        start = end - int(self.hours_cb.get()) * 3600
+        data = self.store.query(src, metric, start, end, MAX_POINTS)
+
+        latest = self.store.latest(src).get(metric)
+        if latest:
+            ts, value = latest
+            self.info.config(
+                text=f"Ultimo: {value:g} ({datetime.fromtimestamp(ts).strftime('%d/%m %H:%M')})"
+            )
+        else:
+            self.info.config(text="")
+
+        w = c.winfo_width()
+        h = c.winfo_height()
+        if w < 100 or h < 100:
+            return
+
+        ml, mr, mt, mb = 60, 20, 20, 40
+        pw, ph = w - ml - mr, h - mt - mb
+        c.create_rectangle(ml, mt, ml + pw, mt + ph, outline="#999")
+
+        if not data:
+            c.create_text(w / 2, h / 2, text="Nessun dato nell'intervallo", fill="#666")
+            return
+
+        vmin = min(d[1] for d in data)
+        vmax = max(d[2] for d in data)
+        if vmax == vmin:
+            vmin -= 1
+            vmax += 1
+
+        def px(ts):
+            return ml + (ts - start) / (end - start) * pw
+
+        def py(v):
+            return mt + (vmax - v) / (vmax - vmin) * ph
+
+        # assi
+        for i in range(5):
+            v = vmin + (vmax - vmin) * i / 4
+            y = py(v)
+            c.create_line(ml, y, ml + pw, y, fill="#eee")
+            c.create_text(ml - 5, y, text=f"{v:.1f}", anchor="e", fill="#555")
+
+        for i in range(7):
+            ts = start + (end - start) * i / 6
+            x = px(ts)
+            c.create_line(x, mt, x, mt + ph, fill="#eee")
+            c.create_text(
+                x, mt + ph + 15,
+                text=datetime.fromtimestamp(ts).strftime("%d/%m %H:%M"),
+                fill="#555"
+            )
+
+        color = COLORS.get(metric, "black")
+
+        # banda min/max e linea della media
+        for bucket, lo, hi, avg in data:
+            x = px(bucket)
+            c.create_line(x, py(lo), x, py(hi), fill="#ccc", width=3)
+
+        if len(data) > 1:
+            points = []
+            for bucket, lo, hi, avg in data:
+                points += [px(bucket), py(avg)]
+            c.create_line(*points, fill=color, width=2)
+        else:
+            x, y = px(data[0][0]), py(data[0][3])
+            c.create_oval(x - 3, y - 3, x + 3, y + 3, fill=color, outline=color)
+
+# ---------------- MAIN ----------------
+
+if __name__ == "__main__":
+    app = TeleViewer()
+    app.mainloop()
@@ -0,0 +1,188 @@
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+# ---------------- CONFIG ----------------
+
+TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+METRICS = ("temp1", "temp2", "hum", "qfe", "qnh", "gas", "co2")
+
+# risoluzioni degli aggregati, in secondi (1 min, 15 min, 1 h)
+RESOLUTIONS = (60, 900, 3600)
+
+# ---------------- UTILS ----------------
+
+def to_float(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_ts(t):
+    try:
+        return int(datetime.strptime(t, TIME_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def pick_resolution(seconds, max_points):
+    """
+    Risoluzione più fine che non supera max_points punti sull'intervallo
+    """
+    for res in RESOLUTIONS:
+        if seconds / res <= max_points:
+            return res
+    return RESOLUTIONS[-1]
+
+# ---------------- STORE ----------------
+
+class TelemetryStore:
+    """
+    Serie numeriche per nodo e metrica ricavate dai frame tele, con
+    aggregati min/max/media a 1 min, 15 min e 1 h aggiornati ad ogni
+    inserimento. Le letture usano solo gli aggregati.
+
+    Come sink di FrameProcessor non esegue commit: lo fa il logger.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tele_series (
+                src TEXT,
+                metric TEXT,
+                ts INTEGER,
+                value REAL
+            );
+            CREATE INDEX IF NOT EXISTS tele_series_idx
+                ON tele_series (src, metric, ts);
+
+            CREATE TABLE IF NOT EXISTS tele_rollup (
+                src TEXT,
+                metric TEXT,
+                res INTEGER,
+                bucket INTEGER,
+                n INTEGER,
+                vmin REAL,
+                vmax REAL,
+                vsum REAL,
+                PRIMARY KEY (src, metric, res, bucket)
+            ) WITHOUT ROWID;
+        """)
+
+    # ---------------- SCRITTURA ----------------
+
+    def on_frame(self, frame_type, row_id, frame):
+        if frame_type != "tele":
+            return
+
+        ts = parse_ts(frame.get("time"))
+        if ts is None:
+            return
+
+        src = str(frame.get("src", "")).split(",")[0].strip()
+        for metric in METRICS:
+            value = to_float(frame.get(metric))
+            if value is not None:
+                self.record(src, metric, ts, value)
+
+    def record(self, src, metric, ts, value):
+        self.conn.execute(
+            "INSERT INTO tele_series (src, metric, ts, value) VALUES (?, ?, ?, ?)",
+            (src, metric, ts, value)
+        )
+        self.conn.executemany("""
+            INSERT INTO tele_rollup (src, metric, res, bucket, n, vmin, vmax, vsum)
+            VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+            ON CONFLICT (src, metric, res, bucket) DO UPDATE SET
+                n = n + 1,
+                vmin = MIN(vmin, excluded.vmin),
+                vmax = MAX(vmax, excluded.vmax),
+                vsum = vsum + excluded.vsum
+        """, [
+            (src, metric, res, ts - ts % res, value, value, value)
+            for res in RESOLUTIONS
+        ])
+
+    def rebuild(self):
+        """
+        Ricostruisce serie e aggregati dalla tabella tele
+        """
+        self.conn.execute("DELETE FROM tele_series")
+        self.conn.execute("DELETE FROM tele_rollup")
+
+        cur = self.conn.cursor()
+        cur.execute("SELECT * FROM tele ORDER BY id ASC")
+        names = [d[0] for d in cur.description]
+
+        n = 0
+        for row in cur:
+            self.on_frame("tele", row[0], dict(zip(names, row)))
+            n += 1
+
+        self.conn.commit()
+        return n
+
+    # ---------------- LETTURA ----------------
+
+    def nodes(self):
+        cur = self.conn.execute(
+            "SELECT DISTINCT src FROM tele_rollup WHERE res = ? ORDER BY src",
+            (RESOLUTIONS[-1],)
+        )
+        return [r[0] for r in cur.fetchall()]
+
+    def metrics(self, src):
+        cur = self.conn.execute(
+            "SELECT DISTINCT metric FROM tele_rollup WHERE src = ? AND res = ?",
+            (src, RESOLUTIONS[-1])
+        )
+        found = {r[0] for r in cur.fetchall()}
+        return [m for m in METRICS if m in found]
+
+    def query(self, src, metric, start, end=None, max_points=500, res=None):
+        """
+        Serie aggregata [(bucket_ts, min, max, media), ...] tra start e end
+        (epoch). Senza res si sceglie la risoluzione in base all'intervallo.
+        """
+        end = end or int(time.time())
+        res = res or pick_resolution(end - start, max_points)
+
+        cur = self.conn.execute("""
+            SELECT bucket, vmin, vmax, vsum / n
+            FROM tele_rollup
+            WHERE src = ? AND metric = ? AND res = ?
+              AND bucket >= ? AND bucket <= ?
+            ORDER BY bucket ASC
+        """, (src, metric, res, start - start % res, end))
+        return cur.fetchall()
+
+    def latest(self, src):
+        """
+        Ultimo valore di ogni metrica del nodo
+        """
+        result = {}
+        for metric in METRICS:
+            row = self.conn.execute("""
+                SELECT ts, value
+                FROM tele_series
+                WHERE src = ? AND metric = ?
+                ORDER BY ts DESC
+                LIMIT 1
+            """, (src, metric)).fetchone()
+            if row:
+                result[metric] = row
+        return result
+
+# ---------------- MAIN ----------------
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        conn = sqlite3.connect(sys.argv[1])
+        count = TelemetryStore(conn).rebuild()
+        conn.close()
+        print(f"Telemetria ricostruita da {count} frame tele")
+    else:
+        print("Specificare il percorso/nome del database")
@@ -0,0 +1,419 @@
+import argparse
+import json
+import math
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mc_geo import MAX_LAT, bbox_around
+
+# ---------------- CONFIG ----------------
+
+CONFIG_FILE = "config_map.json"
+
+DEFAULT_TILE_SERVER = "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png"
+USER_AGENT = "mc_op_room-tilecache/1.0"
+FETCH_TIMEOUT = 10
+TOUCH_FLUSH = 200
+
+
+def load_config():
+    with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# ---------------- UTILS ----------------
+
+def tile_xy(lat, lon, zoom):
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_for_bbox(bbox, zoom_min, zoom_max):
+    """
+    Genera (z, x, y) di tutte le tile che coprono il rettangolo
+    (min_lat, min_lon, max_lat, max_lon) tra zoom_min e zoom_max
+    """
+    min_lat, min_lon, max_lat, max_lon = bbox
+    for z in range(zoom_min, zoom_max + 1):
+        x0, y0 = tile_xy(max_lat, min_lon, z)
+        x1, y1 = tile_xy(min_lat, max_lon, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+def count_tiles(bbox, zoom_min, zoom_max):
+    total = 0
+    min_lat, min_lon, max_lat, max_lon = bbox
+    for z in range(zoom_min, zoom_max + 1):
+        x0, y0 = tile_xy(max_lat, min_lon, z)
+        x1, y1 = tile_xy(min_lat, max_lon, z)
+        total += (x1 - x0 + 1) * (y1 - y0 + 1)
+    return total
+
+
+def fetch_tile(tile_server, z, x, y):
+    url = tile_server.replace("{z}", str(z)).replace("{x}", str(x)).replace("{y}", str(y))
+    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(req, timeout=FETCH_TIMEOUT) as resp:
+        return resp.read()
+
+# ---------------- STORE (MBTiles) ----------------
+
+class TileStore:
+    """
+    Archivio tile su SQLite in formato MBTiles (righe TMS, y invertita).
+    La tabella tiles ha in più le colonne size e last_access usate per
+    l'eviction LRU quando si supera max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=0, tile_server=DEFAULT_TILE_SERVER):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.pending_touch = {}
+
+        with self.lock:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS metadata (
+                    name TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                CREATE TABLE IF NOT EXISTS tiles (
+                    zoom_level INTEGER,
+                    tile_column INTEGER,
+                    tile_row INTEGER,
+                    tile_data BLOB,
+                    size INTEGER,
+                    last_access INTEGER,
+                    PRIMARY KEY (zoom_level, tile_column, tile_row)
+                );
+                CREATE INDEX IF NOT EXISTS tiles_lru ON tiles (last_access);
+            """)
+            for name, value in (("name", "meshcom"), ("format", "png"), ("type", "baselayer")):
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)",
+                    (name, value)
+                )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES ('source', ?)",
+                (tile_server,)
+            )
+            self.conn.commit()
+            self.total_bytes = self.conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM tiles"
+            ).fetchone()[0]
+
+    @staticmethod
+    def _row(z, y):
+        return (2 ** z - 1) - y
+
+    def get(self, z, x, y):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (z, x, self._row(z, y))
+            ).fetchone()
+            if row is None:
+                return None
+
+            # aggiornamento last_access a blocchi, non una scrittura per tile
+            self.pending_touch[(z, x, self._row(z, y))] = int(time.time())
+            if len(self.pending_touch) >= TOUCH_FLUSH:
+                self._flush_touch()
+            return row[0]
+
+    def has(self, z, x, y):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (z, x, self._row(z, y))
+            ).fetchone() is not None
+
+    def put(self, z, x, y, data):
+        with self.lock:
+            key = (z, x, self._row(z, y))
+            old = self.conn.execute(
+                "SELECT size FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                key
+            ).fetchone()
+            self.conn.execute("""
+                INSERT OR REPLACE INTO tiles
+                    (zoom_level, tile_column, tile_row, tile_data, size, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (*key, sqlite3.Binary(data), len(data), int(time.time())))
+            self.total_bytes += len(data) - (old[0] if old else 0)
+            self.pending_touch.pop(key, None)
+
+            if self.max_bytes and self.total_bytes > self.max_bytes:
+                self._evict(self.max_bytes)
+            self.conn.commit()
+
+    def evict(self, max_bytes=None):
+        with self.lock:
+            deleted = self._evict(max_bytes if max_bytes is not None else self.max_bytes)
+            self.conn.commit()
+            return deleted
+
+    def _evict(self, max_bytes):
+        """
+        Cancella le tile usate meno di recente finché si scende al 90%
+        del limite (l'isteresi evita un'eviction ad ogni inserimento)
+        """
+        self._flush_touch()
+        target = int(max_bytes * 0.9)
+        deleted = 0
+
+        while self.total_bytes > target:
+            rows = self.conn.execute("""
+                SELECT zoom_level, tile_column, tile_row, size
+                FROM tiles
+                ORDER BY last_access ASC
+                LIMIT 200
+            """).fetchall()
+            if not rows:
+                break
+
+            for z, x, r, size in rows:
+                self.conn.execute(
+                    "DELETE FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                    (z, x, r)
+                )
+                self.total_bytes -= size or 0
+                deleted += 1
+                if self.total_bytes <= target:
+                    break
+
+        return deleted
+
+    def _flush_touch(self):
+        if not self.pending_touch:
+            return
+        self.conn.executemany(
+            "UPDATE tiles SET last_access=? WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+            [(ts, *key) for key, ts in self.pending_touch.items()]
+        )
+        self.pending_touch.clear()
+        self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            rows = self.conn.execute("""
+                SELECT zoom_level, COUNT(*), COALESCE(SUM(size), 0)
+                FROM tiles
+                GROUP BY zoom_level
+                ORDER BY zoom_level
+            """).fetchall()
+        return rows
+
+    def close(self):
+        with self.lock:
+            self._flush_touch()
+            self.conn.close()
+
+# ---------------- PROXY HTTP LOCALE ----------------
+
+class TileProxy(ThreadingHTTPServer):
+    """
+    Server HTTP locale usato da tkintermapview come tile server: serve le
+    tile dall'archivio e, se non in modalità offline, scarica e salva
+    quelle mancanti dal server remoto.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, store, tile_server, offline=False, port=0):
+        super().__init__(("127.0.0.1", port), TileRequestHandler)
+        self.store = store
+        self.tile_server = tile_server
+        self.offline = offline
+
+    @property
+    def url_template(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/{{z}}/{{x}}/{{y}}.png"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def get_tile(self, z, x, y):
+        data = self.store.get(z, x, y)
+        if data is not None or self.offline:
+            return data
+
+        try:
+            data = fetch_tile(self.tile_server, z, x, y)
+        except (urllib.error.URLError, OSError):
+            return None
+
+        self.store.put(z, x, y, data)
+        return data
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        try:
+            z, x, y = self.path.strip("/").split("?")[0].split("/")
+            z, x, y = int(z), int(x), int(y.split(".")[0])
+        except ValueError:
+            self.send_error(400)
+            return
+
+        data = self.server.get_tile(z, x, y)
+        if data is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_tile_proxy(config):
+    """
+    Avvia il proxy secondo config_map.json. Ritorna None se la cache è
+    disabilitata (TILE_CACHE_PATH vuoto).
+    """
+    path = config.get("TILE_CACHE_PATH", "tiles.mbtiles")
+    if not path:
+        return None
+
+    tile_server = config.get("TILE_SERVER", DEFAULT_TILE_SERVER)
+    store = TileStore(
+        path,
+        max_bytes=int(float(config.get("TILE_CACHE_MAX_MB", 500)) * 1024 * 1024),
+        tile_server=tile_server
+    )
+    return TileProxy(
+        store,
+        tile_server,
+        offline=bool(config.get("OFFLINE_MODE", False)),
+        port=int(config.get("TILE_PROXY_PORT", 0))
+    ).start()
+
+# ---------------- PREFETCH ----------------
+
+def prefetch(store, tile_server, bbox, zoom_min, zoom_max, delay=0.0):
+    total = count_tiles(bbox, zoom_min, zoom_max)
+    done = skipped = failed = 0
+
+    print(f"Tile da verificare: {total} (zoom {zoom_min}-{zoom_max})")
+
+    for z, x, y in tiles_for_bbox(bbox, zoom_min, zoom_max):
+        if store.has(z, x, y):
+            skipped += 1
+            continue
+
+        try:
+            store.put(z, x, y, fetch_tile(tile_server, z, x, y))
+            done += 1
+        except (urllib.error.URLError, OSError) as e:
+            failed += 1
+            print(f"Errore tile {z}/{x}/{y}: {e}")
+
+        if (done + failed) % 100 == 0:
+            print(f"... {done + skipped + failed}/{total}")
+        if delay:
+            time.sleep(delay)
+
+    print(f"Scaricate: {done} | già presenti: {skipped} | errori: {failed}")
+    print(f"Dimensione archivio: {store.total_bytes / 1024 / 1024:.1f} MB")
+    return done, skipped, failed
+
+
+def my_position(db_path, callsign):
+    conn = sqlite3.connect(db_path)
+    row = conn.execute("""
+        SELECT lat, lat_dir, long, long_dir
+        FROM pos
+        WHERE src LIKE ?
+        ORDER BY id DESC
+        LIMIT 1
+    """, (f"{callsign}%",)).fetchone()
+    conn.close()
+
+    if not row:
+        return None
+
+    lat, lat_dir, lon, lon_dir = row
+    lat = -float(lat) if lat_dir == "S" else float(lat)
+    lon = -float(lon) if lon_dir == "W" else float(lon)
+    return lat, lon
+
+
+def parse_zoom(text):
+    if "-" in text:
+        a, b = text.split("-", 1)
+        return int(a), int(b)
+    return int(text), int(text)
+
+# ---------------- MAIN ----------------
+
+def main():
+    config = load_config()
+
+    parser = argparse.ArgumentParser(description="Cache tile offline per mc_map")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("prefetch", help="scarica le tile di una zona")
+    p.add_argument("--bbox", help="min_lat,min_lon,max_lat,max_lon")
+    p.add_argument("--radius", type=float, default=float(config.get("RADIUS_KM", 20)),
+                   help="raggio in km attorno a MY_CALLSIGN (se manca --bbox)")
+    p.add_argument("--zoom", default="8-14", help="es. 8-14")
+    p.add_argument("--delay", type=float, default=0.0, help="pausa tra download (s)")
+
+    sub.add_parser("stats", help="contenuto dell'archivio")
+
+    p = sub.add_parser("evict", help="riduce l'archivio al limite indicato")
+    p.add_argument("--max-mb", type=float, default=float(config.get("TILE_CACHE_MAX_MB", 500)))
+
+    args = parser.parse_args()
+
+    tile_server = config.get("TILE_SERVER", DEFAULT_TILE_SERVER)
+    max_bytes = int(float(config.get("TILE_CACHE_MAX_MB", 500)) * 1024 * 1024)
+    store = TileStore(config.get("TILE_CACHE_PATH") or "tiles.mbtiles", max_bytes, tile_server)
+
+    if args.cmd == "prefetch":
+        if args.bbox:
+            bbox = tuple(float(v) for v in args.bbox.split(","))
+        else:
+            callsign = config.get("MY_CALLSIGN", "")
+            pos = my_position(config.get("DB_PATH", "meshcom.db"), callsign)
+            if not pos:
+                print(f"ERRORE: posizione di {callsign} non trovata, usare --bbox")
+                sys.exit(1)
+            bbox = bbox_around(pos[0], pos[1], args.radius)
+
+        zoom_min, zoom_max = parse_zoom(args.zoom)
+        prefetch(store, tile_server, bbox, zoom_min, zoom_max, args.delay)
+
+    elif args.cmd == "stats":
+        total_n = total_size = 0
+        for z, n, size in store.stats():
+            print(f"zoom {z:2d}: {n:7d} tile  {size / 1024 / 1024:8.1f} MB")
+            total_n += n
+            total_size += size
+        print(f"Totale : {total_n} tile  {total_size / 1024 / 1024:.1f} MB")
+
+    elif args.cmd == "evict":
+        deleted = store.evict(int(args.max_mb * 1024 * 1024))
+        print(f"Tile rimosse: {deleted}")
+
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import sqlite3
+import sys
+import time
+from collections import deque
+from datetime import datetime
+
+# ---------------- CONFIG ----------------
+
+TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+# il peso di un collegamento si dimezza ogni HALF_LIFE secondi senza
+# essere riascoltato; sotto MIN_WEIGHT il collegamento è considerato perso
+HALF_LIFE = 6 * 3600
+MIN_WEIGHT = 0.05
+
+# ---------------- UTILS ----------------
+
+def parse_path(src):
+    """
+    "ORIGINE,RELAY1,RELAY2" -> ["ORIGINE", "RELAY1", "RELAY2"]
+    """
+    return [p.strip().upper() for p in str(src or "").split(",") if p.strip()]
+
+
+def decayed(weight, last_seen, now, half_life=HALF_LIFE):
+    return weight * 0.5 ** (max(0, now - last_seen) / half_life)
+
+
+def parse_ts(t):
+    try:
+        return int(datetime.strptime(t, TIME_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return int(time.time())
+
+# ---------------- SCRITTURA (SINK DEL LOGGER) ----------------
+
+class TopologyStore:
+    """
+    Mantiene nel database il grafo nodo -> relay -> ... -> noi ricavato
+    dal campo src di ogni frame msg/pos:
+    - topo_links: peso (con decadimento), conteggio e ultimo ascolto di
+      ogni collegamento orientato
+    - topo_nodes: numero di hop e ultimo relay dell'ultimo percorso di
+      ogni nodo di origine
+    Come sink di FrameProcessor non esegue commit: lo fa il logger.
+    """
+
+    def __init__(self, conn, local_callsign):
+        self.conn = conn
+        self.local = local_callsign.strip().upper()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS topo_links (
+                a TEXT,
+                b TEXT,
+                weight REAL,
+                count INTEGER,
+                last_seen INTEGER,
+                PRIMARY KEY (a, b)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS topo_links_seen ON topo_links (last_seen);
+
+            CREATE TABLE IF NOT EXISTS topo_nodes (
+                callsign TEXT PRIMARY KEY,
+                hops INTEGER,
+                via TEXT,
+                last_seen INTEGER
+            );
+
+            CREATE TABLE IF NOT EXISTS topo_meta (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO topo_meta (name, value) VALUES ('local', ?)",
+            (self.local,)
+        )
+        self.conn.commit()
+
+    def on_frame(self, frame_type, row_id, frame):
+        if frame_type not in ("msg", "pos"):
+            return
+        self.add_path(parse_path(frame.get("src")), parse_ts(frame.get("time")))
+
+    def add_path(self, path, now):
+        if not path or path[0] == self.local:
+            return
+
+        hops = path + [self.local] if path[-1] != self.local else path
+
+        for a, b in zip(hops, hops[1:]):
+            if a == b:
+                continue
+            row = self.conn.execute(
+                "SELECT weight, last_seen FROM topo_links WHERE a = ? AND b = ?",
+                (a, b)
+            ).fetchone()
+            weight = 1.0 + (decayed(row[0], row[1], now) if row else 0.0)
+            self.conn.execute("""
+                INSERT INTO topo_links (a, b, weight, count, last_seen)
+                VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT (a, b) DO UPDATE SET
+                    weight = excluded.weight,
+                    count = count + 1,
+                    last_seen = MAX(last_seen, excluded.last_seen)
+            """, (a, b, weight, now))
+
+        self.conn.execute("""
+            INSERT OR REPLACE INTO topo_nodes (callsign, hops, via, last_seen)
+            VALUES (?, ?, ?, ?)
+        """, (hops[0], len(hops) - 1, hops[-2] if len(hops) > 2 else "", now))
+
+    def rebuild(self):
+        """
+        Ricostruisce il grafo dalla storia di msg e pos
+        """
+        self.conn.execute("DELETE FROM topo_links")
+        self.conn.execute("DELETE FROM topo_nodes")
+
+        frames = []
+        for table in ("msg", "pos"):
+            try:
+                frames += self.conn.execute(f"SELECT time, src FROM {table}").fetchall()
+            except sqlite3.OperationalError:
+                continue
+
+        frames.sort(key=lambda r: parse_ts(r[0]))
+        for t, src in frames:
+            self.add_path(parse_path(src), parse_ts(t))
+
+        self.conn.commit()
+        return len(frames)
+
+# ---------------- LETTURA (VISTE) ----------------
+
+class TopologyGraph:
+    """
+    Copia in memoria del grafo, aggiornata leggendo solo i collegamenti
+    cambiati dall'ultimo refresh (indice su last_seen)
+    """
+
+    def __init__(self):
+        self.local = None
+        self.links = {}
+        self.nodes = {}
+        self.last_seen = 0
+        self.version = 0
+
+    def refresh(self, conn):
+        try:
+            if self.local is None:
+                row = conn.execute("SELECT value FROM topo_meta WHERE name = 'local'").fetchone()
+                self.local = row[0] if row else None
+
+            rows = conn.execute("""
+                SELECT a, b, weight, count, last_seen
+                FROM topo_links
+                WHERE last_seen >= ?
+            """, (self.last_seen,)).fetchall()
+
+            node_rows = conn.execute("""
+                SELECT callsign, hops, via, last_seen
+                FROM topo_nodes
+                WHERE last_seen >= ?
+            """, (self.last_seen,)).fetchall()
+        except sqlite3.OperationalError:
+            return False
+
+        changed = False
+        for a, b, weight, count, seen in rows:
+            if self.links.get((a, b)) != (weight, count, seen):
+                self.links[(a, b)] = (weight, count, seen)
+                changed = True
+            self.last_seen = max(self.last_seen, seen)
+
+        for callsign, hops, via, seen in node_rows:
+            self.nodes[callsign] = (hops, via, seen)
+
+        if changed:
+            self.version += 1
+        return changed
+
+    # ---------------- QUERY ----------------
+
+    def weight(self, a, b, now=None):
+        link = self.links.get((a, b))
+        if not link:
+            return 0.0
+        return decayed(link[0], link[2], now or time.time())
+
+    def active_links(self, now=None):
+        """
+        [(a, b, peso attuale)] dei collegamenti non ancora decaduti
+        """
+        now = now or time.time()
+        result = []
+        for (a, b), (weight, count, seen) in self.links.items():
+            w = decayed(weight, seen, now)
+            if w >= MIN_WEIGHT:
+                result.append((a, b, w))
+        return result
+
+    def neighbors(self, callsign, now=None):
+        """
+        Vicini diretti (in entrambe le direzioni) ordinati per peso
+        """
+        callsign = callsign.upper()
+        result = {}
+        for a, b, w in self.active_links(now):
+            if a == callsign:
+                result[b] = result.get(b, 0.0) + w
+            elif b == callsign:
+                result[a] = result.get(a, 0.0) + w
+        return sorted(result.items(), key=lambda kv: -kv[1])
+
+    def hops_to_us(self, callsign, now=None):
+        """
+        Numero minimo di hop verso il nostro nodo sui collegamenti attivi
+        (BFS), None se non raggiungibile
+        """
+        callsign = callsign.upper()
+        if not self.local:
+            return None
+        if callsign == self.local:
+            return 0
+
+        adj = {}
+        for a, b, w in self.active_links(now):
+            adj.setdefault(a, []).append(b)
+
+        seen = {callsign}
+        todo = deque([(callsign, 0)])
+        while todo:
+            node, dist = todo.popleft()
+            for nxt in adj.get(node, ()):
+                if nxt == self.local:
+                    return dist + 1
+                if nxt not in seen:
+                    seen.add(nxt)
+                    todo.append((nxt, dist + 1))
+        return None
+
+    def last_route(self, callsign):
+        """
+        (hop, ultimo relay) dell'ultimo percorso ascoltato dal nodo
+        """
+        node = self.nodes.get(callsign.upper())
+        return (node[0], node[1]) if node else (None, "")
+
+    def top_relays(self, n=10, now=None):
+        """
+        Relay più usati: somma dei pesi dei collegamenti in uscita di
+        ogni nodo che ha anche collegamenti in ingresso
+        """
+        incoming = {b for a, b, w in self.active_links(now)}
+        score = {}
+        for a, b, w in self.active_links(now):
+            if a in incoming and a != self.local:
+                score[a] = score.get(a, 0.0) + w
+        return sorted(score.items(), key=lambda kv: -kv[1])[:n]
+
+# ---------------- MAIN ----------------
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3:
+        conn = sqlite3.connect(sys.argv[1])
+        count = TopologyStore(conn, sys.argv[2]).rebuild()
+        conn.close()
+        print(f"Topologia ricostruita da {count} frame")
+    else:
+        print("Uso: mc_topology.py <database> <callsign del nodo locale>")
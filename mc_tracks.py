@@ -0,0 +1,219 @@
+import math
+import sqlite3
+from datetime import datetime
+
+from mc_archive import time_filter_sql
+from mc_geo import EARTH_RADIUS_KM
+
+TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+TAIL_MAX = 64
+
+# ---------------- UTILS ----------------
+
+def _xy(lat, lon, lat0):
+    """
+    Proiezione equirettangolare locale in metri (sufficiente per tracce
+    di pochi km)
+    """
+    k = EARTH_RADIUS_KM * 1000.0 * math.pi / 180.0
+    return lon * k * math.cos(math.radians(lat0)), lat * k
+
+
+def _segment_distance(p, a, b):
+    px, py = p
+    ax, ay = a
+    bx, by = b
+    dx, dy = bx - ax, by - ay
+
+    if dx == 0 and dy == 0:
+        return math.hypot(px - ax, py - ay)
+
+    t = ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)
+    t = max(0.0, min(1.0, t))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def douglas_peucker(points, tolerance_m):
+    """
+    Semplificazione Douglas-Peucker (iterativa) di una lista di punti
+    (lat, lon, ts). Gli estremi sono sempre conservati.
+    """
+    n = len(points)
+    if n < 3:
+        return list(points)
+
+    lat0 = points[0][0]
+    xy = [_xy(p[0], p[1], lat0) for p in points]
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_d = 0.0
+        index = 0
+
+        for i in range(first + 1, last):
+            d = _segment_distance(xy[i], xy[first], xy[last])
+            if d > max_d:
+                max_d = d
+                index = i
+
+        if max_d > tolerance_m:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [p for p, k in zip(points, keep) if k]
+
+
+def distance_m(a, b):
+    ax, ay = _xy(a[0], a[1], a[0])
+    bx, by = _xy(b[0], b[1], a[0])
+    return math.hypot(bx - ax, by - ay)
+
+# ---------------- TRACCIA ----------------
+
+class Track:
+    """
+    Traccia di un nodo: parte "congelata" già semplificata + coda grezza.
+    Ogni TAIL_MAX punti la coda viene semplificata e congelata, così un
+    nuovo punto non richiede di rielaborare l'intera storia.
+    """
+
+    def __init__(self, min_dist_m, tolerance_m):
+        self.min_dist_m = min_dist_m
+        self.tolerance_m = tolerance_m
+        self.frozen = []
+        self.tail = []
+        self._path = None
+
+    def add(self, lat, lon, ts):
+        p = (lat, lon, ts)
+        last = self.tail[-1] if self.tail else (self.frozen[-1] if self.frozen else None)
+
+        # filtro di distanza: un nodo fermo non allunga la traccia
+        if last and distance_m(last, p) < self.min_dist_m:
+            return False
+
+        self.tail.append(p)
+        if len(self.tail) > TAIL_MAX:
+            simplified = douglas_peucker(self.tail, self.tolerance_m)
+            self.frozen.extend(simplified[:-1])
+            self.tail = [self.tail[-1]]
+
+        self._path = None
+        return True
+
+    def expire(self, cutoff_ts):
+        n = 0
+        while n < len(self.frozen) and self.frozen[n][2] < cutoff_ts:
+            n += 1
+        if n:
+            del self.frozen[:n]
+            self._path = None
+
+        if not self.frozen:
+            n = 0
+            # l'ultimo punto resta comunque come posizione corrente
+            while n < len(self.tail) - 1 and self.tail[n][2] < cutoff_ts:
+                n += 1
+            if n:
+                del self.tail[:n]
+                self._path = None
+
+    def path(self):
+        if self._path is None:
+            self._path = [
+                (p[0], p[1])
+                for p in self.frozen + douglas_peucker(self.tail, self.tolerance_m)
+            ]
+        return self._path
+
+# ---------------- CACHE ----------------
+
+class TrackCache:
+    """
+    Tracce di tutti i nodi, estese ad ogni refresh con le sole righe di
+    pos successive all'ultimo id letto
+    """
+
+    def __init__(self, db_path, max_age_hours=24, min_dist_m=30, tolerance_m=25):
+        self.db_path = db_path
+        self.max_age = max_age_hours * 3600
+        self.min_dist_m = min_dist_m
+        self.tolerance_m = tolerance_m
+        self.last_id = 0
+        self.tracks = {}
+
+    def update(self, now=None):
+        """
+        Legge le nuove posizioni delle ultime max_age ore (il filtro sul
+        tempo è nella query: all'avvio non si carica tutta la tabella pos)
+        e ritorna l'insieme dei callsign la cui traccia è cambiata
+        """
+        now = now or datetime.now().timestamp()
+        time_sql, time_params = time_filter_sql(datetime.fromtimestamp(now - self.max_age))
+
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cur = conn.execute(f"""
+                SELECT id, src, time, lat, lat_dir, long, long_dir
+                FROM pos
+                WHERE id > ? AND lat IS NOT NULL AND long IS NOT NULL {time_sql}
+                ORDER BY id ASC
+            """, [self.last_id] + time_params)
+            changed = self.feed(cur, now)
+        except sqlite3.OperationalError:
+            # tabella pos non ancora creata dal logger
+            changed = set()
+        finally:
+            conn.close()
+        return changed
+
+    def feed(self, rows, now=None):
+        """
+        Aggiunge righe di pos già lette (id crescente, colonne id, src,
+        time, lat, lat_dir, long, long_dir) e ritorna i callsign cambiati
+        """
+        now = now or datetime.now().timestamp()
+        cutoff = now - self.max_age
+        changed = set()
+
+        for row in rows:
+            if row["id"] <= self.last_id:
+                continue
+            self.last_id = row["id"]
+
+            src, time = row["src"], row["time"]
+            lat, lat_dir, lon, lon_dir = row["lat"], row["lat_dir"], row["long"], row["long_dir"]
+            try:
+                ts = datetime.strptime(time, TIME_FORMAT).timestamp()
+                lat = float(lat) * (-1 if lat_dir == "S" else 1)
+                lon = float(lon) * (-1 if lon_dir == "W" else 1)
+            except (TypeError, ValueError):
+                continue
+
+            if ts < cutoff or not src:
+                continue
+
+            callsign = src.split(",")[0].strip()
+            track = self.tracks.get(callsign)
+            if track is None:
+                track = self.tracks[callsign] = Track(self.min_dist_m, self.tolerance_m)
+
+            if track.add(lat, lon, ts):
+                changed.add(callsign)
+
+        for callsign, track in self.tracks.items():
+            before = len(track.frozen) + len(track.tail)
+            track.expire(cutoff)
+            if len(track.frozen) + len(track.tail) != before:
+                changed.add(callsign)
+
+        return changed
+
+    def path(self, callsign):
+        track = self.tracks.get(callsign)
+        return track.path() if track else []
@@ -0,0 +1,335 @@
+import cProfile
+import io
+import pstats
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import tkinter as tk
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+# ---------------- CONFIG ----------------
+
+HEARTBEAT_MS = 100
+SLOW_MS = 200
+SAMPLE_MS = 10
+STACK_LIMIT = 12
+TOP_N = 20
+
+# ---------------- UTILS ----------------
+
+def callback_name(func):
+    name = getattr(func, "__qualname__", None) or getattr(func, "__name__", None) or repr(func)
+    owner = getattr(func, "__self__", None)
+    if owner is not None and not isinstance(owner, type) and "." not in name:
+        name = f"{type(owner).__name__}.{name}"
+    return name
+
+
+def format_stack(frame, limit=STACK_LIMIT):
+    return "".join(traceback.format_stack(frame, limit=limit))
+
+# ---------------- WATCHDOG ----------------
+
+class Watchdog:
+    """
+    Strumentazione del main loop Tk:
+    - ritardo del ciclo eventi (lag) misurato con un battito ogni
+      HEARTBEAT_MS
+    - durata di ogni callback di after()/after_idle() (dopo install())
+      e dei blocchi misurati con measure()
+    - una callback che supera slow_ms viene registrata con lo stack del
+      thread Tk preso MENTRE è bloccata (dice dove sta aspettando)
+    - profilo cProfile (Ctrl+F12) o a campionamento (Ctrl+F11)
+      attivabili a runtime
+    """
+
+    def __init__(self, root, slow_ms=SLOW_MS, heartbeat_ms=HEARTBEAT_MS, log_file=None):
+        self.root = root
+        self.slow = slow_ms / 1000
+        self.heartbeat_ms = heartbeat_ms
+        self.log_file = log_file
+
+        self.tk_thread = threading.get_ident()
+        self.lock = threading.Lock()
+        self.current = None          # (nome, inizio) della callback in corso
+        self.reported = False
+        self.stats = {}              # nome -> [chiamate, totale, massimo]
+        self.lag_max = 0.0
+        self.lag_last = 0.0
+
+        self.profiler = None
+        self.samples = None
+
+        self._expected = None
+        self._original_after = None
+        self._original_after_idle = None
+
+    # ---------------- AVVIO ----------------
+
+    def start(self, bind_keys=True):
+        self._expected = time.monotonic() + self.heartbeat_ms / 1000
+        self.root.after(self.heartbeat_ms, self._beat)
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+        if bind_keys:
+            self.root.bind_all("<Control-F12>", lambda e: self.toggle_cprofile())
+            self.root.bind_all("<Control-F11>", lambda e: self.toggle_sampling())
+            self.root.bind_all("<Control-F10>", lambda e: self.report())
+        return self
+
+    def install(self):
+        """
+        Sostituisce after()/after_idle() di tutti i widget Tk con versioni
+        che misurano la durata delle callback
+        """
+        if self._original_after:
+            return self
+
+        watchdog = self
+        self._original_after = original_after = tk.Misc.after
+        self._original_after_idle = original_after_idle = tk.Misc.after_idle
+
+        def after(widget, ms, func=None, *args):
+            if func is None:
+                return original_after(widget, ms)
+            return original_after(widget, ms, watchdog.wrap(func), *args)
+
+        def after_idle(widget, func, *args):
+            return original_after_idle(widget, watchdog.wrap(func), *args)
+
+        tk.Misc.after = after
+        tk.Misc.after_idle = after_idle
+        return self
+
+    def uninstall(self):
+        if self._original_after:
+            tk.Misc.after = self._original_after
+            tk.Misc.after_idle = self._original_after_idle
+            self._original_after = None
+
+    # ---------------- MISURA ----------------
+
+    def wrap(self, func):
+        name = callback_name(func)
+
+        def timed(*args):
+            with self.measure(name):
+                return func(*args)
+
+        timed.__qualname__ = name
+        return timed
+
+    @contextmanager
+    def measure(self, name):
+        outer = self.current
+        start = time.monotonic()
+        with self.lock:
+            self.current = (name, start)
+            if outer is None:
+                self.reported = False
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.current = outer
+            self._record(name, elapsed)
+
+    def _record(self, name, elapsed):
+        s = self.stats.setdefault(name, [0, 0.0, 0.0])
+        s[0] += 1
+        s[1] += elapsed
+        s[2] = max(s[2], elapsed)
+        if elapsed >= self.slow:
+            self.log(f"⏱ Callback lenta: {name} {elapsed * 1000:.0f} ms")
+
+    def _beat(self):
+        now = time.monotonic()
+        self.lag_last = max(0.0, now - self._expected)
+        self.lag_max = max(self.lag_max, self.lag_last)
+        if self.lag_last >= self.slow:
+            self.log(f"⏱ Main loop bloccato per {self.lag_last * 1000:.0f} ms")
+
+        self._expected = now + self.heartbeat_ms / 1000
+        (self._original_after or tk.Misc.after)(self.root, self.heartbeat_ms, self._beat)
+
+    def _monitor(self):
+        """
+        Thread di controllo: stack delle callback bloccate e campioni del
+        profilo a campionamento
+        """
+        while True:
+            interval = SAMPLE_MS / 1000 if self.samples is not None else self.slow / 2
+            time.sleep(interval)
+
+            frame = sys._current_frames().get(self.tk_thread)
+            if frame is None:
+                continue
+
+            # toggle_sampling può azzerare self.samples in qualsiasi
+            # momento: si legge una sola volta e si usa la copia locale
+            samples = self.samples
+            if samples is not None:
+                stack = traceback.extract_stack(frame, limit=STACK_LIMIT)
+                key = tuple(f"{f.name} ({f.filename.split('/')[-1]}:{f.lineno})" for f in stack)
+                with self.lock:
+                    samples[key] += 1
+
+            with self.lock:
+                current, reported = self.current, self.reported
+                if current and not reported and time.monotonic() - current[1] >= self.slow:
+                    self.reported = True
+                else:
+                    current = None
+
+            if current:
+                self.log(
+                    f"⏱ {current[0]} in esecuzione da {(time.monotonic() - current[1]) * 1000:.0f} ms, "
+                    f"stack:\n{format_stack(frame)}"
+                )
+
+    # ---------------- PROFILI ----------------
+
+    def toggle_cprofile(self):
+        """
+        Avvia/ferma cProfile sul thread Tk; alla fermata stampa le funzioni
+        più costose e salva il profilo in un file .prof
+        """
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            self.log("⏱ cProfile avviato (Ctrl+F12 per fermare)")
+            return None
+
+        self.profiler.disable()
+        path = datetime.now().strftime("profile_%Y%m%d_%H%M%S.prof")
+        self.profiler.dump_stats(path)
+
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(TOP_N)
+        self.profiler = None
+        self.log(f"⏱ cProfile fermato, salvato in {path}\n{out.getvalue()}")
+        return path
+
+    def toggle_sampling(self):
+        """
+        Avvia/ferma il profilo a campionamento (stack del thread Tk ogni
+        SAMPLE_MS); alla fermata stampa gli stack più frequenti
+        """
+        if self.samples is None:
+            self.samples = Counter()
+            self.log("⏱ Campionamento avviato (Ctrl+F11 per fermare)")
+            return None
+
+        with self.lock:
+            samples, self.samples = self.samples, None
+        total = sum(samples.values()) or 1
+        lines = [f"⏱ Campionamento fermato: {total} campioni"]
+        for stack, count in samples.most_common(TOP_N):
+            lines.append(f"{count * 100 / total:5.1f}%  " + " > ".join(stack[-4:]))
+        self.log("\n".join(lines))
+        return samples
+
+    def report(self):
+        """
+        Riepilogo: lag massimo e callback ordinate per tempo totale
+        """
+        lines = [f"⏱ Lag massimo {self.lag_max * 1000:.0f} ms, ultimo {self.lag_last * 1000:.0f} ms"]
+        ranked = sorted(self.stats.items(), key=lambda kv: -kv[1][1])
+        for name, (calls, total, worst) in ranked[:TOP_N]:
+            lines.append(
+                f"{name:<50} {calls:>6} chiamate  tot {total * 1000:8.0f} ms  "
+                f"media {total / calls * 1000:6.1f} ms  max {worst * 1000:6.0f} ms"
+            )
+        self.log("\n".join(lines))
+
+    def log(self, text):
+        stamp = datetime.now().strftime("%H:%M:%S")
+        print(f"[{stamp}] {text}")
+        if self.log_file:
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(f"[{stamp}] {text}\n")
+
+# ---------------- LAVORO IN BACKGROUND ----------------
+
+class BackgroundRunner:
+    """
+    Esegue funzioni (tipicamente query) in thread separati e consegna
+    risultati ed errori sul thread Tk, dove si possono toccare i widget.
+    Le funzioni passate a submit_db ricevono una connessione sqlite
+    propria del thread (le connessioni non si condividono tra thread).
+    """
+
+    def __init__(self, root, db_path=None, workers=2, poll_ms=50):
+        self.root = root
+        self.db_path = db_path
+        self.poll_ms = poll_ms
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mc_bg")
+        self.done = queue.Queue()
+        self.pending = 0
+        self.local = threading.local()
+        self._polling = False
+
+    def submit(self, func, *args, on_done=None, on_error=None):
+        self.pending += 1
+        future = self.pool.submit(func, *args)
+        future.add_done_callback(lambda f: self.done.put((f, on_done, on_error)))
+        self._schedule_poll()
+        return future
+
+    def submit_db(self, func, *args, on_done=None, on_error=None):
+        return self.submit(lambda: func(self._conn(), *args), on_done=on_done, on_error=on_error)
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+        return conn
+
+    def _schedule_poll(self):
+        # il controllo gira solo mentre c'è lavoro in corso
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        while True:
+            try:
+                future, on_done, on_error = self.done.get_nowait()
+            except queue.Empty:
+                break
+
+            self.pending -= 1
+            error = future.exception()
+            try:
+                if error is not None:
+                    if on_error:
+                        on_error(error)
+                    else:
+                        print(f"❌ Errore in background: {error}")
+                elif on_done:
+                    on_done(future.result())
+            except Exception as e:
+                print(f"❌ Errore nella consegna del risultato: {e}")
+
+        self._polling = False
+        if self.pending > 0:
+            self._schedule_poll()
+
+
+def run_in_background(widget, func, *args, on_done=None, on_error=None):
+    """
+    Esecuzione singola di func(*args) in un thread; on_done(risultato) o
+    on_error(eccezione) vengono chiamati sul thread Tk di 'widget'
+    """
+    runner = getattr(widget, "_mc_runner", None)
+    if runner is None:
+        runner = widget._mc_runner = BackgroundRunner(widget)
+    return runner.submit(func, *args, on_done=on_done, on_error=on_error)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# i moduli mc_*.py stanno nella cartella principale del progetto
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+from mc_journal import (
+    QUARANTINE_FILE, SEGMENT_HEADER, Journal, list_segments, load_state,
+    read_records, segment_name
+)
+
+mc_logger = pytest.importorskip("mc_logger", exc_type=ImportError)
+
+
+def frame_line(text, **extra):
+    return json.dumps({"type": "msg", "src": "IU1AA", "dst": "*", "msg": text, **extra})
+
+
+def segment_path(journal):
+    return os.path.join(journal.directory, segment_name(journal.segment))
+
+
+@pytest.fixture
+def processor(tmp_path):
+    db = mc_logger.SQLiteHandler(str(tmp_path / "meshcom.db"))
+    processor, _, _ = mc_logger.build_processor(db, {"node": {"callsign": "IK5XMK-98"}})
+    # come open_journal all'avvio del logger
+    load_state(db.conn)
+    db.conn.commit()
+    yield processor
+    db.conn.close()
+
+
+def saved_messages(processor):
+    try:
+        return [r[0] for r in processor.db.conn.execute("SELECT msg FROM msg ORDER BY id")]
+    except sqlite3.OperationalError:
+        return []
+
+# ---------------- RECUPERO DEL SEGMENTO ----------------
+
+def test_torn_tail_is_truncated_on_reopen(tmp_path):
+    journal = Journal(str(tmp_path / "journal"))
+    journal.append(frame_line("riga 0"))
+    good_end = journal.append(frame_line("riga 1")).end
+    journal.append(frame_line("riga 2"))
+    path = segment_path(journal)
+    journal.close()
+
+    # crash durante la scrittura dell'ultimo record
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 5)
+
+    journal = Journal(str(tmp_path / "journal"))
+    assert journal.last_seq == 2
+    assert os.path.getsize(path) == good_end
+    assert journal.append(frame_line("dopo")).seq == 3
+    journal.close()
+
+    assert [r.seq for r in read_records(str(tmp_path / "journal"))] == [1, 2, 3]
+
+
+def test_bad_crc_is_truncated_on_reopen(tmp_path):
+    journal = Journal(str(tmp_path / "journal"))
+    journal.append(frame_line("buona"))
+    good_end = journal.append(frame_line("buona anche questa")).end
+    journal.append(frame_line("rovinata"))
+    path = segment_path(journal)
+    journal.close()
+
+    with open(path, "r+b") as f:
+        f.seek(-3, os.SEEK_END)
+        byte = f.read(1)
+        f.seek(-3, os.SEEK_END)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    journal = Journal(str(tmp_path / "journal"))
+    assert journal.last_seq == 2
+    assert os.path.getsize(path) == good_end
+    journal.close()
+
+
+def test_numbering_continues_after_committed_seq(tmp_path):
+    # journal perso (crash del sistema prima del fsync): nessun seq riusato
+    journal = Journal(str(tmp_path / "journal"), min_seq=41)
+    assert journal.append(frame_line("x")).seq == 42
+    journal.close()
+
+# ---------------- PRUNE ----------------
+
+def test_prune_keeps_uncommitted_segments(tmp_path):
+    directory = str(tmp_path / "journal")
+    journal = Journal(directory, segment_bytes=SEGMENT_HEADER.size + 1)
+    for i in range(6):
+        journal.append(frame_line(f"riga {i}"))
+    assert list_segments(directory) == [1, 2, 3, 4, 5, 6]
+
+    # confermati fino al seq 3: i segmenti 4..6 devono restare
+    removed = journal.prune(3, keep=1)
+    assert removed == 3
+    assert list_segments(directory) == [4, 5, 6]
+    assert [r.seq for r in read_records(directory, 3)] == [4, 5, 6]
+
+    # niente confermato: anche con keep=1 non si cancella nulla
+    assert journal.prune(0, keep=1) == 0
+    # keep=0 tiene tutto
+    assert journal.prune(6, keep=0) == 0
+    journal.close()
+
+# ---------------- REPLAY ----------------
+
+def test_replay_resumes_from_journal_state(tmp_path, processor):
+    directory = str(tmp_path / "journal")
+    journal = Journal(directory)
+
+    for text in ("uno", "due"):
+        line = frame_line(text)
+        processor.process(json.loads(line), None, journal.append(line))
+
+    # crash tra la scrittura nel journal e il commit nel database
+    journal.append(frame_line("tre"))
+    journal.append(frame_line("quattro"))
+    journal.close()
+
+    journal = Journal(directory, min_seq=load_state(processor.db.conn)[0])
+    count, done = mc_logger.replay_journal(processor, directory)
+    journal.close()
+
+    assert (count, done) == (2, True)
+    assert saved_messages(processor) == ["uno", "due", "tre", "quattro"]
+    assert load_state(processor.db.conn)[0] == 4
+
+    # un secondo recupero non duplica nulla
+    assert mc_logger.replay_journal(processor, directory) == (0, True)
+
+
+def test_replay_quarantines_poison_record(tmp_path, processor):
+    directory = str(tmp_path / "journal")
+    journal = Journal(directory)
+    journal.append(frame_line("prima"))
+    # "group" è una parola riservata: ALTER TABLE fallisce sempre
+    journal.append(frame_line("veleno", group="x"))
+    journal.append(frame_line("dopo"))
+    journal.close()
+
+    count, done = mc_logger.replay_journal(processor, directory)
+
+    assert (count, done) == (2, True)
+    assert saved_messages(processor) == ["prima", "dopo"]
+    assert load_state(processor.db.conn)[0] == 3
+
+    with open(os.path.join(directory, QUARANTINE_FILE), encoding="utf-8") as f:
+        quarantined = [json.loads(line) for line in f]
+    assert [q["seq"] for q in quarantined] == [2]
+    assert "group" in quarantined[0]["line"]
+
+
+def test_replay_quarantine_as_last_record(tmp_path, processor):
+    directory = str(tmp_path / "journal")
+    journal = Journal(directory)
+    journal.append(frame_line("veleno", group="x"))
+    journal.close()
+
+    assert mc_logger.replay_journal(processor, directory) == (0, True)
+    # stato avanzato: il tentativo successivo non rilegge il record
+    assert load_state(processor.db.conn)[0] == 1
+    assert mc_logger.replay_journal(processor, directory) == (0, True)
+
+
+def test_replay_stops_while_database_locked(tmp_path, processor):
+    directory = str(tmp_path / "journal")
+    journal = Journal(directory)
+    journal.append(frame_line("uno"))
+    journal.append(frame_line("due"))
+    journal.close()
+
+    # crea la tabella msg prima del blocco
+    processor.db.ensure_table("msg", json.loads(frame_line("x")))
+    processor.db.conn.execute("PRAGMA busy_timeout = 0")
+
+    other = sqlite3.connect(str(tmp_path / "meshcom.db"))
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        assert mc_logger.replay_journal(processor, directory) == (0, False)
+    finally:
+        other.rollback()
+        other.close()
+
+    assert not os.path.exists(os.path.join(directory, QUARANTINE_FILE))
+    assert mc_logger.replay_journal(processor, directory) == (2, True)
+    assert saved_messages(processor) == ["uno", "due"]
+
+
+def test_database_busy():
+    assert mc_logger.database_busy(sqlite3.OperationalError("database is locked"))
+    assert not mc_logger.database_busy(sqlite3.OperationalError('near "group": syntax error'))
+    assert not mc_logger.database_busy(ValueError("locked"))
@@ -0,0 +1,203 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from mc_liveness import (
+    EWMA_ALPHA, MAX_GAP, MAX_TIMEOUT, MIN_GAP, TIME_FORMAT, LivenessTracker, TimerWheel
+)
+
+T0 = 1_800_000_000
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    yield conn
+    conn.close()
+
+
+def tracker_at(conn, now, **kwargs):
+    tracker = LivenessTracker(conn, "IK5XMK-98", **kwargs)
+    tracker.wheel = TimerWheel(now=now)
+    return tracker
+
+
+def events(conn):
+    return [tuple(r) for r in conn.execute("SELECT callsign, event FROM node_events ORDER BY id")]
+
+# ---------------- TIMER WHEEL ----------------
+
+def test_wheel_expires_on_deadline():
+    wheel = TimerWheel(tick=10, slots=8, now=T0)
+    wheel.schedule("A", T0 + 35)
+
+    assert wheel.advance(T0 + 29) == []
+    assert wheel.advance(T0 + 40) == ["A"]
+    # una sola volta
+    assert wheel.advance(T0 + 200) == []
+    assert len(wheel) == 0
+
+
+def test_wheel_reschedule_and_cancel():
+    wheel = TimerWheel(tick=10, slots=8, now=T0)
+    wheel.schedule("A", T0 + 20)
+    wheel.schedule("B", T0 + 20)
+    wheel.schedule("A", T0 + 60)
+    wheel.cancel("B")
+
+    assert wheel.advance(T0 + 30) == []
+    assert wheel.advance(T0 + 60) == ["A"]
+
+
+def test_wheel_deadline_beyond_one_turn():
+    # 8 slot da 10 s = 80 s per giro: la scadenza a 250 s resta nel suo
+    # slot per più giri
+    wheel = TimerWheel(tick=10, slots=8, now=T0)
+    wheel.schedule("A", T0 + 250)
+
+    for t in range(T0 + 10, T0 + 250, 10):
+        assert wheel.advance(t) == []
+    assert wheel.advance(T0 + 250) == ["A"]
+
+
+def test_wheel_long_pause_expires_everything():
+    wheel = TimerWheel(tick=10, slots=8, now=T0)
+    wheel.schedule("A", T0 + 15)
+    wheel.schedule("B", T0 + 70)
+    assert sorted(wheel.advance(T0 + 10_000)) == ["A", "B"]
+
+
+def test_wheel_past_deadline_fires_next_tick():
+    wheel = TimerWheel(tick=10, slots=8, now=T0)
+    wheel.schedule("A", T0 - 100)
+    assert wheel.advance(T0 + 10) == ["A"]
+
+# ---------------- INTERVALLO (EWMA) ----------------
+
+def test_first_gap_sets_interval_then_ewma(conn):
+    tracker = tracker_at(conn, T0)
+    tracker.heard("IU1AA", T0)
+    assert tracker.nodes["IU1AA"][1] is None
+
+    tracker.heard("IU1AA", T0 + 600)
+    assert tracker.nodes["IU1AA"][1] == 600
+
+    tracker.heard("IU1AA", T0 + 600 + 1200)
+    assert tracker.nodes["IU1AA"][1] == pytest.approx(600 + EWMA_ALPHA * (1200 - 600))
+
+
+def test_gaps_outside_thresholds_are_ignored(conn):
+    tracker = tracker_at(conn, T0)
+    tracker.heard("IU1AA", T0)
+    tracker.heard("IU1AA", T0 + 600)
+
+    # ripetizione via relay
+    tracker.heard("IU1AA", T0 + 600 + MIN_GAP - 1)
+    assert tracker.nodes["IU1AA"][1] == 600
+
+    # nodo rimasto spento
+    last = tracker.nodes["IU1AA"][0]
+    tracker.heard("IU1AA", last + MAX_GAP + 1)
+    assert tracker.nodes["IU1AA"][1] == 600
+
+    # al limite conta
+    last = tracker.nodes["IU1AA"][0]
+    tracker.heard("IU1AA", last + MIN_GAP)
+    assert tracker.nodes["IU1AA"][1] == pytest.approx(600 + EWMA_ALPHA * (MIN_GAP - 600))
+
+
+def test_timeout_limits(conn):
+    tracker = tracker_at(conn, T0, factor=3.0, min_timeout=600, default_timeout=3600)
+    assert tracker.timeout(None) == 3600
+    assert tracker.timeout(60) == 600
+    assert tracker.timeout(1000) == 3000
+    assert tracker.timeout(MAX_TIMEOUT) == MAX_TIMEOUT
+
+# ---------------- EVENTI ----------------
+
+def test_lost_then_back(conn):
+    tracker = tracker_at(conn, T0, factor=3.0, min_timeout=600)
+    tracker.heard("IU1AA", T0)
+    tracker.heard("IU1AA", T0 + 600)
+    conn.commit()
+
+    # scadenza a 600 + 3 * 600 s dall'ultimo ascolto
+    assert tracker.tick(T0 + 600 + 1790) == []
+    lost = tracker.tick(T0 + 600 + 1810)
+    assert [(cs, ev) for cs, ev, _ in lost] == [("IU1AA", "lost")]
+    assert tracker.nodes["IU1AA"][2] == "lost"
+    # un nodo perso non viene segnalato di nuovo
+    assert tracker.tick(T0 + 10_000) == []
+
+    tracker.heard("IU1AA", T0 + 11_000)
+    back = tracker.tick(T0 + 11_010)
+    assert [(cs, ev) for cs, ev, _ in back] == [("IU1AA", "back")]
+    assert tracker.nodes["IU1AA"][2] == "alive"
+    assert events(conn) == [("IU1AA", "lost"), ("IU1AA", "back")]
+
+
+def test_back_events_come_before_new_lost_events(conn):
+    tracker = tracker_at(conn, T0, min_timeout=600, default_timeout=600)
+    tracker.heard("IU1AA", T0)
+    tracker.heard("IU2BB", T0 + 300)
+    assert [ev for _, ev, _ in tracker.tick(T0 + 610)] == ["lost"]
+
+    # IU1AA torna mentre IU2BB scade: prima il ritorno già avvenuto
+    tracker.heard("IU1AA", T0 + 800)
+    result = tracker.tick(T0 + 910)
+    assert [(cs, ev) for cs, ev, _ in result] == [("IU1AA", "back"), ("IU2BB", "lost")]
+    assert events(conn) == [("IU1AA", "lost"), ("IU1AA", "back"), ("IU2BB", "lost")]
+
+
+def test_local_node_and_other_frames_ignored(conn):
+    tracker = tracker_at(conn, T0)
+    when = datetime.fromtimestamp(T0).strftime(TIME_FORMAT)
+    tracker.on_frame("msg", 1, {"src": "IK5XMK-98", "time": when})
+    tracker.on_frame("ack", 2, {"src": "IU1AA", "time": when})
+    assert tracker.nodes == {}
+
+    tracker.on_frame("pos", 3, {"src": "IU1AA,IR5AY-12", "time": when})
+    assert tracker.nodes["IU1AA"][0] == T0
+
+
+def test_state_survives_restart(conn):
+    tracker = tracker_at(conn, T0)
+    tracker.heard("IU1AA", T0)
+    tracker.heard("IU1AA", T0 + 600)
+    conn.commit()
+
+    again = LivenessTracker(conn, "IK5XMK-98")
+    assert again.nodes["IU1AA"][:2] == [T0 + 600, 600]
+    assert len(again.wheel) == 1
+
+# ---------------- RICOSTRUZIONE ----------------
+
+def add_frames(conn, table, rows):
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, src TEXT, time TEXT)")
+    conn.executemany(
+        f"INSERT INTO {table} (src, time) VALUES (?, ?)",
+        [(src, datetime.fromtimestamp(t).strftime(TIME_FORMAT)) for src, t in rows]
+    )
+    conn.commit()
+
+
+def test_rebuild_from_stored_frames(conn):
+    add_frames(conn, "pos", [("IU1AA", T0), ("IU1AA", T0 + 1200), ("IU2BB", T0)])
+    add_frames(conn, "msg", [("IU1AA,IR5AY-12", T0 + 600), ("IK5XMK-98", T0 + 700)])
+    add_frames(conn, "tele", [("IU2BB", T0 + 100_000)])
+
+    # il primo avvio su un database esistente ricostruisce da solo
+    tracker = LivenessTracker(conn, "IK5XMK-98")
+    assert set(tracker.nodes) == {"IU1AA", "IU2BB"}
+
+    count = tracker.rebuild(now=T0 + 100_100)
+    assert count == 6
+    # msg e pos fusi in ordine di tempo: intervalli di 600 s
+    assert tracker.nodes["IU1AA"][:2] == [T0 + 1200, 600]
+    assert tracker.nodes["IU1AA"][2] == "lost"
+    assert tracker.nodes["IU2BB"][0] == T0 + 100_000
+    assert tracker.nodes["IU2BB"][2] == "alive"
+    # ricostruzione silenziosa
+    assert events(conn) == []
+    assert tracker.tick(T0 + 100_100) == []
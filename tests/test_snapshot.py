@@ -0,0 +1,150 @@
+import pytest
+
+import mc_snapshot
+from mc_snapshot import (
+    RETIRED, VERSION, VERSION_OFFSET, SnapshotReader, SnapshotWriter
+)
+
+
+def pos_frame(src, lat, lon):
+    return {
+        "src": src, "time": "19/10/2026 10:00:00",
+        "lat": str(lat), "lat_dir": "N", "long": str(lon), "long_dir": "E", "batt": "80",
+    }
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "meshcom.snap")
+
+
+@pytest.fixture
+def writer(path):
+    writer = SnapshotWriter(path, capacity=4)
+    yield writer
+    writer.close()
+
+
+def test_round_trip(writer, path):
+    writer.update("pos", 7, pos_frame("IU1AA,IR5AY-12", 43.5, 10.25))
+    writer.update("msg", 3, {"src": "IU2BB", "time": "19/10/2026 10:01:00"})
+    writer.set_lost("IU2BB", True)
+
+    snap = SnapshotReader(path).read()
+    assert snap.version == writer.version and snap.version % 2 == 0
+    assert (snap.msg_id, snap.pos_id, snap.lost) == (3, 7, 1)
+
+    nodes = {n.callsign: n for n in snap.nodes}
+    assert (nodes["IU1AA"].lat, nodes["IU1AA"].lon, nodes["IU1AA"].pos_id) == (43.5, 10.25, 7)
+    assert (nodes["IU1AA"].hops, nodes["IU1AA"].batt) == (1, 80)
+    assert nodes["IU2BB"].lat is None and nodes["IU2BB"].lost
+
+# ---------------- SEQLOCK ----------------
+
+def test_read_gives_up_while_write_in_progress(writer, path, monkeypatch):
+    monkeypatch.setattr(mc_snapshot, "MAX_RETRIES", 20)
+    # scrittura iniziata e mai conclusa: versione dispari
+    writer._begin()
+    reader = SnapshotReader(path)
+    assert reader.version() % 2 == 1
+    assert reader.read() is None
+
+
+def test_read_retries_until_write_ends(writer, path, monkeypatch):
+    writer._begin()
+    writer.nodes.append(["IU3CC", 44.0, 11.0, 0.0, 9, 1, 0, 255, mc_snapshot.FLAG_POSITION])
+    writer.slots["IU3CC"] = len(writer.nodes) - 1
+    writer._write_node(writer.slots["IU3CC"])
+
+    waits = []
+
+    def finish_write(_):
+        # il lettore cede il processore: intanto lo scrittore finisce
+        waits.append(1)
+        writer._write_header()
+        writer._end()
+
+    monkeypatch.setattr(mc_snapshot.time, "sleep", finish_write)
+    snap = SnapshotReader(path).read()
+
+    assert waits == [1]
+    assert snap.version == writer.version
+    assert [n.callsign for n in snap.nodes] == ["IU3CC"]
+
+
+class WriteDuringCopy:
+    """
+    VERSION che esegue una pubblicazione tra la copia dei dati e il
+    secondo controllo della versione (la prima lettura)
+    """
+
+    def __init__(self, publish):
+        self.publish = publish
+        self.calls = 0
+
+    def unpack_from(self, buffer, offset=0):
+        self.calls += 1
+        if self.calls == 2:
+            self.publish()
+        return VERSION.unpack_from(buffer, offset)
+
+    def pack_into(self, buffer, offset, *values):
+        VERSION.pack_into(buffer, offset, *values)
+
+
+def test_torn_copy_is_rejected(writer, path, monkeypatch):
+    writer.update("pos", 1, pos_frame("IU1AA", 43.0, 10.0))
+    reader = SnapshotReader(path)
+    assert reader.version() == writer.version
+
+    interference = WriteDuringCopy(lambda: writer.update("pos", 2, pos_frame("IU1AA", 45.0, 12.0)))
+    monkeypatch.setattr(mc_snapshot, "VERSION", interference)
+    snap = reader.read()
+
+    # la prima copia (ancora con la vecchia posizione) è scartata
+    assert interference.calls == 4
+    assert snap.version == writer.version
+    assert (snap.pos_id, snap.nodes[0].lat, snap.nodes[0].lon) == (2, 45.0, 12.0)
+
+# ---------------- FILE DISMESSO ----------------
+
+def test_retired_file_is_reopened(path):
+    old = SnapshotWriter(path, capacity=2)
+    old.update("pos", 1, pos_frame("IU1AA", 43.0, 10.0))
+    reader = SnapshotReader(path)
+    assert len(reader.read().nodes) == 1
+    old.close()
+
+    # il logger riparte con un'altra capacità: il vecchio file è dismesso
+    new = SnapshotWriter(path, capacity=8)
+    try:
+        assert reader.mm[:4] == RETIRED
+        new.update("pos", 5, pos_frame("IU2BB", 44.0, 11.0))
+        new.update("pos", 6, pos_frame("IU3CC", 44.5, 11.5))
+
+        snap = reader.read()
+        assert [n.callsign for n in snap.nodes] == ["IU2BB", "IU3CC"]
+        assert snap.pos_id == 6
+        assert reader.mm[:4] == mc_snapshot.MAGIC
+    finally:
+        new.close()
+
+
+def test_missing_file(tmp_path):
+    reader = SnapshotReader(str(tmp_path / "nessuno.snap"))
+    assert reader.version() is None
+    assert reader.read() is None
+
+
+def test_version_never_goes_back_after_restart(path):
+    writer = SnapshotWriter(path, capacity=4)
+    writer.update("msg", 1, {"src": "IU1AA"})
+    before = writer.version
+    writer.close()
+
+    writer = SnapshotWriter(path, capacity=4)
+    try:
+        assert writer.version > before
+        assert SnapshotReader(path).version() == writer.version
+    finally:
+        writer.close()
@@ -0,0 +1,114 @@
+import json
+import socket
+import sqlite3
+
+import pytest
+
+import mc_stream
+from mc_stream import StreamServer, iter_stream, parse_hello
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "meshcom.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE msg (id INTEGER PRIMARY KEY, src TEXT, msg TEXT)")
+    conn.executemany(
+        "INSERT INTO msg (id, src, msg) VALUES (?, ?, ?)",
+        [(i, "IU1AA", f"testo {i}") for i in range(1, 101)]
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def server(db_path):
+    # in memoria solo gli ultimi 10 frame (91..100): il resto dal database
+    server = StreamServer("127.0.0.1", 0, db_path, history=10).start()
+    for i in range(91, 101):
+        server.publish("msg", i, {"src": "IU1AA", "msg": f"testo {i}"})
+    yield server
+    server.close()
+
+
+def read_events(server, resume, count):
+    events = []
+    for event in iter_stream("127.0.0.1", server.port, resume, ["msg"], timeout=5):
+        events.append(event)
+        if len(events) == count:
+            break
+    return events
+
+
+def ids(events):
+    return [e["id"] for e in events]
+
+# ---------------- RESUME ----------------
+
+def test_resume_from_memory(server):
+    events = read_events(server, {"msg": 95}, 5)
+    assert ids(events) == [96, 97, 98, 99, 100]
+    assert events[0]["data"] == {"src": "IU1AA", "msg": "testo 96"}
+
+
+def test_resume_from_database_in_pages(server, monkeypatch):
+    monkeypatch.setattr(mc_stream, "BACKFILL_PAGE", 7)
+    events = read_events(server, {"msg": 5}, 95)
+    # database a pagine fino a 90, poi la memoria, senza buchi né doppioni
+    assert ids(events) == list(range(6, 101))
+
+
+def test_resume_then_live(server):
+    stream = iter_stream("127.0.0.1", server.port, {"msg": 98}, ["msg"], timeout=5)
+    assert [next(stream)["id"] for _ in range(2)] == [99, 100]
+
+    server.publish("msg", 101, {"src": "IU2BB", "msg": "nuovo"})
+    event = next(stream)
+    stream.close()
+    assert event == {"table": "msg", "id": 101, "data": {"src": "IU2BB", "msg": "nuovo"}}
+
+
+def test_resume_reports_gap(server, db_path):
+    # righe 1..40 archiviate: il client lo sa invece di perderle
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM msg WHERE id <= 40")
+    conn.commit()
+    conn.close()
+
+    events = read_events(server, {"msg": 5}, 61)
+    assert events[0] == {"gap": {"table": "msg", "after": 5, "next": 41}}
+    assert ids(events[1:]) == list(range(41, 101))
+
+
+# ---------------- HELLO ----------------
+
+def test_parse_hello_ignores_bad_entries():
+    tables, resume = parse_hello({
+        "tables": ["msg", "pos", "tele", "node_pos"],
+        "resume": {"msg": "abc", "pos": "12", "tele": None, "node_pos": 3},
+    })
+    assert tables == ["msg", "pos", "tele"]
+    assert resume == {"pos": 12}
+
+    assert parse_hello({"tables": "msg", "resume": [1, 2]}) == (list(mc_stream.STREAM_TABLES), {})
+
+
+def test_bad_hello_keeps_connection(server):
+    sock = socket.create_connection(("127.0.0.1", server.port), timeout=5)
+    try:
+        sock.sendall(b'{"resume": {"msg": "abc"}, "tables": ["msg"]}\n')
+        # nessun recupero, ma il flusso live arriva
+        line = b""
+        for _ in range(50):
+            server.publish("msg", 200, {"msg": "live"})
+            sock.settimeout(0.1)
+            try:
+                line = sock.recv(4096)
+                break
+            except socket.timeout:
+                continue
+    finally:
+        sock.close()
+
+    assert json.loads(line.split(b"\n")[0])["id"] == 200
@@ -0,0 +1,148 @@
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import mc_tilecache
+from mc_tilecache import TileProxy, TileStore
+
+# ---------------- SERVER REMOTO FINTO ----------------
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        data = f"tile {self.path}".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+    server.daemon_threads = True
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TileStore(str(tmp_path / "tiles.mbtiles"))
+    yield store
+    store.close()
+
+
+def start_proxy(store, upstream, offline=False):
+    tile_server = f"http://127.0.0.1:{upstream.server_address[1]}/{{z}}/{{x}}/{{y}}.png"
+    return TileProxy(store, tile_server, offline=offline).start()
+
+
+def download(proxy, z, x, y):
+    url = proxy.url_template.format(z=z, x=x, y=y)
+    with urllib.request.urlopen(url, timeout=5) as resp:
+        return resp.read()
+
+# ---------------- PROXY ----------------
+
+def test_proxy_miss_then_hit(store, upstream):
+    proxy = start_proxy(store, upstream)
+    try:
+        first = download(proxy, 12, 2170, 1480)
+        second = download(proxy, 12, 2170, 1480)
+    finally:
+        proxy.shutdown()
+        proxy.server_close()
+
+    assert first == second == b"tile /12/2170/1480.png"
+    # la seconda richiesta è servita dall'archivio
+    assert upstream.requests == ["/12/2170/1480.png"]
+    assert store.has(12, 2170, 1480)
+
+
+def test_proxy_offline_serves_only_cached(store, upstream):
+    store.put(10, 1, 2, b"cached")
+    proxy = start_proxy(store, upstream, offline=True)
+    try:
+        assert download(proxy, 10, 1, 2) == b"cached"
+        with pytest.raises(urllib.error.HTTPError) as error:
+            download(proxy, 10, 1, 3)
+    finally:
+        proxy.shutdown()
+        proxy.server_close()
+
+    assert error.value.code == 404
+    assert upstream.requests == []
+
+
+def test_proxy_bad_path(store, upstream):
+    proxy = start_proxy(store, upstream)
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            with urllib.request.urlopen(proxy.url_template.replace("{z}", "z"), timeout=5):
+                pass
+    finally:
+        proxy.shutdown()
+        proxy.server_close()
+
+    assert error.value.code == 400
+
+# ---------------- EVICTION LRU ----------------
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_evict_least_recently_used(tmp_path, monkeypatch):
+    clock = Clock(1000)
+    monkeypatch.setattr(mc_tilecache.time, "time", clock)
+
+    store = TileStore(str(tmp_path / "tiles.mbtiles"), max_bytes=350)
+    try:
+        for x in range(3):
+            clock.now += 1
+            store.put(5, x, 0, b"x" * 100)
+
+        # la tile più vecchia viene letta e torna la più recente
+        clock.now += 1
+        assert store.get(5, 0, 0) is not None
+
+        # 400 byte oltre il limite di 350: si scende sotto il 90% (315)
+        # togliendo la tile usata meno di recente
+        clock.now += 1
+        store.put(5, 3, 0, b"x" * 100)
+
+        assert not store.has(5, 1, 0)
+        assert all(store.has(5, x, 0) for x in (0, 2, 3))
+        assert store.total_bytes == 300
+    finally:
+        store.close()
+
+
+def test_total_bytes_survives_reopen(tmp_path):
+    path = str(tmp_path / "tiles.mbtiles")
+    store = TileStore(path)
+    store.put(3, 1, 1, b"a" * 10)
+    store.put(3, 1, 1, b"b" * 25)
+    store.close()
+
+    store = TileStore(path)
+    try:
+        assert store.total_bytes == 25
+        assert store.get(3, 1, 1) == b"b" * 25
+    finally:
+        store.close()